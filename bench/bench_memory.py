@@ -0,0 +1,78 @@
+#!/bin/python3
+
+'''Compare the peak memory of gqlast.py with and without --low-memory
+
+Usage:
+    bench_memory.py [--parser NAME] [--scales LIST] [--jobs N]
+
+Run the `make dgraph_in` (--dgraph) and `make gqlgen_in` pipelines on the schemas
+of the repository and on synthetic schemas (see gen_schema.py), in a new process
+for each run, and report the time and peak memory (from --profile) of the parse
+phase and the peak RSS of the process, in the default and the --low-memory modes.
+
+Options:
+    --parser NAME       Parser to use (tatsu or fast) [default: tatsu].
+    --scales LIST       Comma separated sizes of the synthetic schemas, relative
+                        to graphql/fractal6.graphql [default: 1,2,5].
+    --jobs N            Number of processes parsing the inputs [default: 1].
+'''
+
+import os
+import sys
+import json
+import tempfile
+import subprocess
+from docopt import docopt
+
+from gen_schema import scaled_schema
+
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+REFERENCES = [
+    ('dgraph', ['graphql/errors.graphql', 'graphql/fractal6.graphql']),
+    ('gqlgen', ['graphql/directives.graphql', 'graphql/fractal6.graphql', 'gen_dgraph_out/schema.graphql']),
+]
+
+MODES = [('default', []), ('low-memory', ['--low-memory'])]
+
+
+def cases(scales, tmp):
+    ''' Yields the (case, scale, mode, files) to benchmark. '''
+    for mode, files in REFERENCES:
+        yield 'reference', None, mode, [os.path.join(ROOT, fn) for fn in files]
+
+    for scale in scales:
+        schema = scaled_schema(scale)
+        source, dgraph_out = os.path.join(tmp, 'source%d.graphql' % scale), os.path.join(tmp, 'dgraph_out%d.graphql' % scale)
+        for fn, text in ((source, schema.source()), (dgraph_out, schema.dgraph_out())):
+            with open(fn, 'w') as f:
+                f.write(text)
+        yield 'synthetic', scale, 'dgraph', [os.path.join(ROOT, 'graphql/errors.graphql'), source]
+        yield 'synthetic', scale, 'gqlgen', [os.path.join(ROOT, 'graphql/directives.graphql'), source, dgraph_out]
+
+
+def run(mode, files, options):
+    ''' Returns the profile (see --profile) of a gqlast.py run. '''
+    args = ['--profile', '--no-cache', '--nv'] + options + (['--dgraph'] if mode == 'dgraph' else []) + files
+    out = subprocess.run([sys.executable, 'gqlast.py'] + args, cwd=ROOT,
+                         stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True).stderr
+    return json.loads(out.splitlines()[-1])
+
+
+if __name__ == '__main__':
+    args = docopt(__doc__, version='bench_memory 0')
+    options = ['--parser', args['--parser'], '--jobs', args['--jobs']]
+    scales = [int(s) for s in args['--scales'].split(',')]
+
+    print('%-10s %5s %-7s %8s %-10s %9s %10s %10s' % ('case', 'scale', 'mode', 'size',
+                                                     'run', 'parse', 'parse peak', 'max rss'))
+    with tempfile.TemporaryDirectory() as tmp:
+        for case, scale, mode, files in cases(scales, tmp):
+            size = sum(os.path.getsize(fn) for fn in files)
+            for name, extra in MODES:
+                profile = run(mode, files, options + extra)
+                parse = profile['phases']['parse']
+                print('%-10s %5s %-7s %7dk %-10s %8.3fs %8.1fMB %8.1fMB' % (
+                    case, scale or '', mode, size//1000, name, parse['time'],
+                    (parse['peak_memory'] or 0) / 2**20, profile['max_rss'] / 2**20), flush=True)
@@ -0,0 +1,77 @@
+#!/bin/python3
+
+'''Benchmark the parsers on the schemas of the repository
+
+Usage:
+    bench_parser.py [--repeat N]
+
+Parse the inputs of `make dgraph_in` and `make gqlgen_in` with the generated
+parser (tatsu) and the hand-written parser (fast), check that they build the
+same AST (with DeferredSemantics) and the same schema once the semantics are
+applied on its IR (see to_ir), and report the best parsing time of each.
+
+Options:
+    --repeat N     Number of runs per parser [default: 3].
+'''
+
+import os
+import sys
+import time
+from docopt import docopt
+from loguru import logger
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from gram.graphql import GRAPHQLParser
+from gram.sdlparser import SDLParser
+from gqlast import SDL, DeferredSemantics, to_ir
+
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+INPUTS = [
+    ('dgraph_in', True, ['graphql/errors.graphql', 'graphql/fractal6.graphql']),
+    ('gqlgen_in', False, ['graphql/directives.graphql', 'graphql/fractal6.graphql', 'gen_dgraph_out/schema.graphql']),
+]
+
+
+def read(files):
+    text = ''
+    for fn in files:
+        with open(os.path.join(ROOT, fn)) as f:
+            text += f.read()
+    return text
+
+
+def run(parser_class, text, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        ast = parser_class().parse(text, rule_name='start', semantics=DeferredSemantics(), parseinfo=False)
+        t = time.perf_counter() - t0
+        best = t if best is None else min(best, t)
+    return best, ast
+
+
+def generate(ast, dgraph):
+    ''' Returns the schema of the target from the AST of its inputs. '''
+    return SDL({'--dgraph': dgraph}, parsed=[to_ir(ast)]).stringify()
+
+
+if __name__ == '__main__':
+    args = docopt(__doc__, version='bench_parser 0')
+    repeat = int(args['--repeat'])
+    # The warnings of the semantics (unknown types of the gqlgen inputs) are not benchmarked.
+    logger.disable('gqlast')
+
+    print('%-10s %8s %10s %10s %8s' % ('input', 'size', 'tatsu', 'fast', 'speedup'))
+    for name, dgraph, files in INPUTS:
+        text = read(files)
+        t_tatsu, ast_tatsu = run(GRAPHQLParser, text, repeat)
+        t_fast, ast_fast = run(SDLParser, text, repeat)
+        if ast_tatsu != ast_fast:
+            raise ValueError('The parsers built different AST for %s' % name)
+        if generate(ast_tatsu, dgraph) != generate(ast_fast, dgraph):
+            raise ValueError('The parsers generated different schemas for %s' % name)
+
+        print('%-10s %7dk %9.3fs %9.3fs %7.1fx' % (name, len(text)//1000, t_tatsu, t_fast, t_tatsu/t_fast))
@@ -0,0 +1,132 @@
+#!/bin/python3
+
+'''Benchmark the parse, semantic and stringify phases on schemas of growing size
+
+Usage:
+    bench_scale.py [--parser NAME] [--scales LIST] [--repeat N] [-o FILE] [--compare FILE]
+
+Run the `make dgraph_in` (--dgraph) and `make gqlgen_in` pipelines on the schemas
+of the repository and on synthetic schemas (see gen_schema.py) of growing size,
+and report the best time of each phase.
+
+Options:
+    --parser NAME       Parser to use (tatsu or fast) [default: fast].
+    --scales LIST       Comma separated sizes of the synthetic schemas, relative
+                        to graphql/fractal6.graphql [default: 1,2,5,10,20,50,100].
+    --repeat N          Number of runs per case [default: 3].
+    -o --output FILE    Save the results as JSON in FILE.
+    --compare FILE      Compare the results with the ones saved in FILE.
+'''
+
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+from datetime import datetime
+from docopt import docopt
+from loguru import logger
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from gqlast import SDL, parse_deferred_inputs
+from gen_schema import scaled_schema
+
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+REFERENCES = [
+    ('dgraph', ['graphql/errors.graphql', 'graphql/fractal6.graphql']),
+    ('gqlgen', ['graphql/directives.graphql', 'graphql/fractal6.graphql', 'gen_dgraph_out/schema.graphql']),
+]
+
+PHASES = ['parse', 'semantic', 'stringify']
+
+
+def read(fn):
+    with open(os.path.join(ROOT, fn)) as f:
+        return f.read()
+
+
+def cases(scales):
+    ''' Yields the (case, scale, mode, inputs) to benchmark. '''
+    for mode, files in REFERENCES:
+        yield 'reference', None, mode, [read(fn) for fn in files]
+
+    errors, directives = read('graphql/errors.graphql'), read('graphql/directives.graphql')
+    for scale in scales:
+        schema = scaled_schema(scale)
+        source, dgraph_out = schema.source(), schema.dgraph_out()
+        yield 'synthetic', scale, 'dgraph', [errors, source]
+        yield 'synthetic', scale, 'gqlgen', [directives, source, dgraph_out]
+
+
+def run(mode, inputs, parser, repeat):
+    ''' Returns the best time of each phase, and the output. '''
+    best = dict.fromkeys(PHASES)
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        parsed = parse_deferred_inputs(inputs, parser, jobs=1)
+        t1 = time.perf_counter()
+        sdl = SDL({'--dgraph': mode == 'dgraph'}, parsed=parsed)
+        t2 = time.perf_counter()
+        out = sdl.stringify()
+        t3 = time.perf_counter()
+
+        for phase, t in zip(PHASES, (t1-t0, t2-t1, t3-t2)):
+            best[phase] = t if best[phase] is None else min(best[phase], t)
+
+    best['total'] = sum(best[phase] for phase in PHASES)
+    return best, out
+
+
+def commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def result_key(r):
+    return (r['case'], r['scale'], r['mode'])
+
+
+if __name__ == '__main__':
+    args = docopt(__doc__, version='bench_scale 0')
+    parser = args['--parser']
+    repeat = int(args['--repeat'])
+    scales = [int(s) for s in args['--scales'].split(',')]
+
+    # The semantics warn on unknown types, not relevant here.
+    logger.remove()
+
+    previous = {}
+    if args['--compare']:
+        with open(args['--compare']) as f:
+            previous = {result_key(r): r for r in json.load(f)['results']}
+
+    print('%-10s %5s %-7s %8s %9s %9s %9s %9s %s' % ('case', 'scale', 'mode', 'size',
+                                                     *PHASES, 'total', 'previous' if previous else ''))
+    results = []
+    for case, scale, mode, inputs in cases(scales):
+        times, out = run(mode, inputs, parser, repeat)
+        size = sum(len(text) for text in inputs)
+        r = dict(case=case, scale=scale, mode=mode, bytes=size, output_bytes=len(out), **times)
+        results.append(r)
+
+        line = '%-10s %5s %-7s %7dk %8.3fs %8.3fs %8.3fs %8.3fs' % (case, scale or '', mode, size//1000,
+                                                                   *(r[k] for k in PHASES + ['total']))
+        if result_key(r) in previous:
+            line += ' %7.2fx' % (r['total'] / previous[result_key(r)]['total'])
+        print(line, flush=True)
+
+    if args['--output']:
+        with open(args['--output'], 'w') as f:
+            json.dump(dict(commit=commit(),
+                           date=datetime.now().isoformat(timespec='seconds'),
+                           python=platform.python_version(),
+                           parser=parser,
+                           repeat=repeat,
+                           results=results), f, indent=2)
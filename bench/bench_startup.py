@@ -0,0 +1,84 @@
+#!/bin/python3
+
+'''Measure the startup time of gqlast.py
+
+Usage:
+    bench_startup.py [--repeat N] [--top N] [--budget MS]
+
+Report the import time of gqlast (from `python -X importtime`) with its most
+expensive imports, and the wall time of gqlast.py on a one-type schema.
+Exit with an error if the import time of gqlast, without the tatsu package, is above
+the budget. The tatsu package (imported at load by both parsers for their AST types)
+takes most of the import time: 50 to 70 ms of the 62 to 88 ms of the whole import,
+depending on the run, when the budget was set. Without it, the import took 13 to 19 ms.
+
+Options:
+    --repeat N     Number of runs, the best one is reported [default: 5].
+    --top N        Number of imports to show [default: 10].
+    --budget MS    Import time budget of gqlast without tatsu, in milliseconds [default: 30].
+'''
+
+import os
+import sys
+import time
+import tempfile
+import subprocess
+from docopt import docopt
+
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+TINY_SCHEMA = 'type A {\n  a: Int\n}\n'
+
+# Bytecode is written (as for a regular run), so that the runs after the first one use it.
+ENV = {k: v for k, v in os.environ.items() if k != 'PYTHONDONTWRITEBYTECODE'}
+
+
+def import_times():
+    ''' Returns the (self, cumulative) import time in microseconds of each module imported by gqlast. '''
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import gqlast'],
+                         cwd=ROOT, env=ENV, capture_output=True, text=True, check=True).stderr
+    times = {}
+    for line in out.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def run_time(args):
+    t0 = time.perf_counter()
+    subprocess.run([sys.executable, 'gqlast.py'] + args, cwd=ROOT, env=ENV,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - t0
+
+
+if __name__ == '__main__':
+    args = docopt(__doc__, version='bench_startup 0')
+    repeat = int(args['--repeat'])
+    top = int(args['--top'])
+    budget = float(args['--budget'])
+
+    # Warm up the bytecode cache.
+    import_times()
+
+    own = lambda t: t['gqlast'][1] - t['tatsu'][1]
+    best = min((import_times() for _ in range(repeat)), key=own)
+    total = own(best) / 1000
+    print('import gqlast: %.1f ms, without tatsu: %.1f ms (budget: %.0f ms)' % (best['gqlast'][1] / 1000, total, budget))
+    print()
+    print('%-40s %9s %9s' % ('module', 'self', 'cumul'))
+    for name, (self_us, cumulative_us) in sorted(best.items(), key=lambda x: x[1][0], reverse=True)[:top]:
+        print('%-40s %7.1fms %7.1fms' % (name, self_us / 1000, cumulative_us / 1000))
+
+    print()
+    with tempfile.NamedTemporaryFile('w', suffix='.graphql') as f:
+        f.write(TINY_SCHEMA)
+        f.flush()
+        for parser in ('fast', 'tatsu'):
+            t = min(run_time(['--no-cache', '--parser', parser, f.name]) for _ in range(repeat))
+            print('gqlast.py --parser %-6s one-type schema: %.1f ms' % (parser, t * 1000))
+
+    if total > budget:
+        sys.exit('Import time (without tatsu) above the budget: %.1f ms > %.0f ms' % (total, budget))
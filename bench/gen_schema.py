@@ -0,0 +1,252 @@
+#!/bin/python3
+
+'''Generate synthetic GraphQL schemas
+
+Usage:
+    gen_schema.py [--scale N] [--interfaces N] [--types N] [--implementing N] [--fields N]
+                  [--x-directives N] [--w-directives N] [--hooks N] [--enums N] [--no-duplicates]
+                  SOURCE [DGRAPH_OUT]
+
+Write a source schema (like graphql/fractal6.graphql) to SOURCE and the schema
+Dgraph would generate from it (like gen_dgraph_out/schema.graphql) to DGRAPH_OUT.
+The default counts are the ones of graphql/fractal6.graphql, they are multiplied by --scale.
+
+Options:
+    --scale N         Multiply the counts of interfaces, types, hooks and enums [default: 1].
+    --interfaces N    Number of interfaces [default: 1].
+    --types N         Number of types [default: 24].
+    --implementing N  Number of types implementing an interface [default: 8].
+    --fields N        Number of fields per type [default: 9].
+    --x-directives N  Number of fields with a @x_* directive per type [default: 2].
+    --w-directives N  Number of fields with a @w_* directive per type [default: 1].
+    --hooks N         Number of types with a @hook_ directive [default: 9].
+    --enums N         Number of enums [default: 15].
+    --no-duplicates   Do not redefine the types in DGRAPH_OUT (as Dgraph does).
+'''
+
+from docopt import docopt
+
+
+_x_directives = ['@x_add(r:"ref")', '@x_alter(r:"isOwner", f:"createdBy")', '@x_patch', '@x_alter']
+_w_directives = ['@w_alter(a:"lower")', '@w_add(a:"upper")', '@w_patch(a:"lower")']
+
+_auth = '''@auth(
+  query: { or: [
+    # Authorize root
+    { rule: "{ $USERTYPE: {eq: \\"Root\\"} }" },
+    # Authorize author
+    { rule: """query ($USERNAME: String!) {
+      query%s {
+        createdBy(filter: {username: {eq: $USERNAME}}) { username }
+      }
+    }""" }
+  ]}
+)'''
+
+_dgraph_header = '''directive @search(by: [DgraphIndex!]) on FIELD_DEFINITION
+
+directive @auth(password: AuthRule, query: AuthRule, add: AuthRule, update: AuthRule, delete: AuthRule) on OBJECT | INTERFACE
+
+directive @id on FIELD_DEFINITION
+
+scalar DateTime
+
+input AuthRule {
+  and: [AuthRule]
+  or: [AuthRule]
+  not: AuthRule
+  rule: String
+}
+
+'''
+
+
+class Schema:
+    ''' A synthetic schema: a source schema and the schema generated by Dgraph for it. '''
+
+    def __init__(self, interfaces=1, types=24, implementing=8, fields=9,
+                 x_directives=2, w_directives=1, hooks=9, enums=15, duplicates=True):
+        self.interfaces = ['Post%d' % i for i in range(interfaces)]
+        self.types = ['Item%d' % i for i in range(types)]
+        self.enums = ['Kind%d' % i for i in range(enums)]
+        self.implementing = min(implementing, types) if interfaces else 0
+        self.fields = fields
+        self.x_directives = x_directives
+        self.w_directives = w_directives
+        self.hooks = hooks
+        self.duplicates = duplicates
+
+    def interface_of(self, i):
+        if i < self.implementing:
+            return self.interfaces[i % len(self.interfaces)]
+
+    def interface_fields(self):
+        ''' Returns the (name, type, directives) fields of the interfaces. '''
+        return [
+            ('id', 'ID!', ''),
+            ('createdBy', 'User!', ''),
+            ('createdAt', 'DateTime!', '@search'),
+            ('updatedAt', 'DateTime', _x_directives[1]),
+            ('message', 'String', '@search(by: [fulltext]) ' + _x_directives[1]),
+        ]
+
+    def type_fields(self, i):
+        ''' Returns the (name, type, directives) own fields of the i-th type. '''
+        fields = []
+        for j in range(self.fields):
+            if j == 0 and i > 0:
+                name, type_ = 'parent', self.types[i-1]
+            elif j == 1 and self.enums:
+                name, type_ = 'kind', self.enums[i % len(self.enums)] + '!'
+            elif j == 2:
+                name, type_ = 'children', '[%s!]' % self.types[(i+1) % len(self.types)]
+            else:
+                name, type_ = 'field%d' % j, ['String', 'Int', 'DateTime', 'Boolean'][j % 4]
+
+            directives = []
+            if j % 3 == 1:
+                directives.append('@search')
+            if j < self.x_directives:
+                directives.append(_x_directives[(i+j) % len(_x_directives)])
+            elif j < self.x_directives + self.w_directives:
+                directives.append(_w_directives[(i+j) % len(_w_directives)])
+
+            fields.append((name, type_, ' '.join(directives)))
+
+        return fields
+
+    def all_fields(self, name):
+        if name in self.interfaces:
+            return self.interface_fields()
+        i = self.types.index(name)
+        fields = self.type_fields(i)
+        if self.interface_of(i):
+            fields = self.interface_fields() + fields
+        return fields
+
+    @staticmethod
+    def object_name(type_):
+        ''' Returns the object type name of a field type, or None for scalars. '''
+        name = type_.strip('[]!')
+        if name in ('ID', 'String', 'Int', 'DateTime', 'Boolean') or name.startswith('Kind'):
+            return None
+        return name
+
+    def source(self):
+        ''' Returns the source schema (hand-written like). '''
+        out = ['# Synthetic schema: %d interfaces, %d types, %d enums\n\n'
+               % (len(self.interfaces), len(self.types), len(self.enums))]
+
+        out.append('type User {\n  id: ID!\n  username: String! @id\n}\n\n')
+
+        for e in self.enums:
+            out.append('enum %s {\n  A\n  B\n  C\n}\n\n' % e)
+
+        for itf in self.interfaces:
+            out.append('interface %s %s{\n' % (itf, _auth % itf))
+            for name, type_, directives in self.interface_fields():
+                out.append('  %s: %s %s\n' % (name, type_, directives))
+            out.append('}\n\n')
+
+        for i, t in enumerate(self.types):
+            implements = ' implements %s' % self.interface_of(i) if self.interface_of(i) else ''
+            hook = ' @hook_' if i < self.hooks else ''
+            out.append('type %s%s %s%s {\n' % (t, implements, _auth % t, hook))
+            for name, type_, directives in self.type_fields(i):
+                out.append('  %s: %s %s\n' % (name, type_, directives))
+            out.append('}\n\n')
+
+        return ''.join(out)
+
+    def dgraph_out(self):
+        ''' Returns the schema generated by Dgraph: types redefined with arguments,
+            inputs, queries and mutations.
+        '''
+        out = [_dgraph_header]
+        names = ['User'] + self.interfaces + self.types
+
+        for name in names:
+            fields = self.all_fields(name) if name != 'User' else [('id', 'ID!', ''), ('username', 'String!', '')]
+            if self.duplicates:
+                kind = 'interface' if name in self.interfaces else 'type'
+                implements = ''
+                if name in self.types and self.interface_of(self.types.index(name)):
+                    implements = ' implements %s' % self.interface_of(self.types.index(name))
+                out.append('%s %s%s {\n' % (kind, name, implements))
+                for f, type_, _ in fields:
+                    obj = self.object_name(type_)
+                    if obj and type_.startswith('['):
+                        out.append('  %s(filter: %sFilter, first: Int, offset: Int): %s\n' % (f, obj, type_))
+                    elif obj:
+                        out.append('  %s(filter: %sFilter): %s\n' % (f, obj, type_))
+                    else:
+                        out.append('  %s: %s\n' % (f, type_))
+                out.append('}\n\n')
+
+            ref_fields = [(f, type_.replace(self.object_name(type_), self.object_name(type_) + 'Ref')
+                           if self.object_name(type_) else type_) for f, type_, _ in fields if f != 'id']
+
+            out.append('input Add%sInput {\n' % name)
+            out.extend('  %s: %s\n' % (f, type_) for f, type_ in ref_fields)
+            out.append('}\n\n')
+
+            out.append('input %sFilter {\n  id: [ID!]\n  has: [%sHasFilter]\n  and: [%sFilter]\n  or: [%sFilter]\n  not: %sFilter\n}\n\n'
+                       % (name, name, name, name, name))
+
+            out.append('enum %sHasFilter {\n' % name)
+            out.extend('  %s\n' % f for f, _ in ref_fields)
+            out.append('}\n\n')
+
+            out.append('input %sPatch {\n' % name)
+            out.extend('  %s: %s\n' % (f, type_.rstrip('!')) for f, type_ in ref_fields)
+            out.append('}\n\n')
+
+            out.append('input %sRef {\n  id: ID\n' % name)
+            out.extend('  %s: %s\n' % (f, type_.rstrip('!')) for f, type_ in ref_fields)
+            out.append('}\n\n')
+
+            out.append('type Add%sPayload {\n  %s(filter: %sFilter, first: Int, offset: Int): [%s]\n  numUids: Int\n}\n\n'
+                       % (name, name[0].lower() + name[1:], name, name))
+
+        out.append('type Query {\n')
+        for name in names:
+            out.append('  get%s(id: ID!): %s\n' % (name, name))
+            out.append('  query%s(filter: %sFilter, first: Int, offset: Int): [%s]\n' % (name, name, name))
+        out.append('}\n\n')
+
+        out.append('type Mutation {\n')
+        for name in names:
+            if name in self.interfaces:
+                continue
+            out.append('  add%s(input: [Add%sInput!]!): Add%sPayload\n' % (name, name, name))
+            out.append('  update%s(input: Update%sInput!): Update%sPayload\n' % (name, name, name))
+            out.append('  delete%s(filter: %sFilter!): Delete%sPayload\n' % (name, name, name))
+        out.append('}\n\n')
+
+        return ''.join(out)
+
+
+def scaled_schema(scale=1, **counts):
+    ''' Returns a Schema with the counts of interfaces, types, hooks and enums multiplied by scale. '''
+    for k in ('interfaces', 'types', 'implementing', 'hooks', 'enums'):
+        if k in counts:
+            counts[k] *= scale
+    defaults = dict(interfaces=1, types=24, implementing=8, hooks=9, enums=15)
+    for k, v in defaults.items():
+        counts.setdefault(k, v * scale)
+    return Schema(**counts)
+
+
+if __name__ == '__main__':
+    args = docopt(__doc__, version='gen_schema 0')
+
+    counts = {k: int(args['--'+k.replace('_', '-')]) for k in
+              ('interfaces', 'types', 'implementing', 'fields', 'x_directives', 'w_directives', 'hooks', 'enums')}
+    schema = scaled_schema(int(args['--scale']), duplicates=not args['--no-duplicates'], **counts)
+
+    with open(args['SOURCE'], 'w') as f:
+        f.write(schema.source())
+
+    if args['DGRAPH_OUT']:
+        with open(args['DGRAPH_OUT'], 'w') as f:
+            f.write(schema.dgraph_out())
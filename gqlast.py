@@ -3,34 +3,102 @@
 '''Graphql format manipulation
 
 Usage:
-    gqlast.py [--debug] [--dgraph] [--nv] [FILE ...]
+    gqlast.py [--debug] [--dgraph] [--nv] [--no-cache] [--cache-dir DIR] [--cache-size MB] [--incremental] [--parser NAME] [--low-memory] [--jobs N] [--out-dgraph OUT] [--out-gqlgen OUT] [--check] [--profile] [--profile-rules STACKS] [--diff-against PREVIOUS] [--graph] [--affected DEFS] [--expand-dgraph] [--watch] [FILE ...]
+    gqlast.py --serve ADDRESS [--parser NAME] [--low-memory] [--jobs N]
 
-Parse the FILE input and apply transformations:
+Parse the FILE inputs (in parallel, as if they were concatenated) and apply transformations
+(a definition can come after the definitions depending on it, see SDL.apply_semantics):
 * Add interface attributes on implemented types.
 * remove duplicate type and inherits input arguments.
 * move/copy directives based on their name (see graphql/directives.graphql).
 * Remove comments.
 
+With --out-dgraph and/or --out-gqlgen, the targets are generated from a single parse
+of the inputs. A FILE prefixed with `dgraph:` or `gqlgen:` is an input of this target only,
+the other FILE are inputs of every target.
 
 Options:
     -d --debug     Show debug informations.
     --dgraph       Filter schema for dgraph.
     --nv           Silent output.
+    --no-cache     Do not use (nor update) the parse cache.
+    --cache-dir DIR  Parse cache directory (default: .cache/gqlast next to this file).
+                   The runs that do not write a schema (--check, --diff-against) only read it.
+    --cache-size MB  Size of the parse cache, the least recently used entries are
+                   evicted [default: 64].
+    --incremental  Only regenerate the definitions that changed since the previous run.
+    --parser NAME  Parser to use: `tatsu` (generated from gram/graphql.ebnf) or `fast`
+                   (hand-written, see gram/sdlparser.py) [default: tatsu].
+    --low-memory   Bound the memory of the tatsu parser: only memoize the left recursive rules
+                   (see new_parser). The outputs are the same.
+    -j --jobs N    Number of processes parsing the FILE inputs (default: one per FILE,
+                   up to the number of CPUs). With the tatsu parser, or more processes than
+                   FILE inputs, the definitions of the inputs are shared out between the processes. With --serve, the number
+                   of parsers (default: the number of CPUs).
+    --out-dgraph OUT  Write the schema filtered for dgraph to OUT.
+    --out-gqlgen OUT  Write the schema for gqlgen to OUT.
+                   The outputs are written atomically, and only if their content changed.
+    --check        Do not write the --out-dgraph/--out-gqlgen outputs, exit with an error
+                   if one of them is not up to date.
+    --profile      Report the time and peak memory of each phase (read, parse, semantic, stringify)
+                   and the semantic counters as JSON, on the last line of stderr.
+                   With --incremental, the parse phase includes the semantic phase.
+    --diff-against PREVIOUS  Instead of the schema, print the changes from the PREVIOUS generated
+                   schema to the schema generated from FILE, as JSON: the definitions, fields,
+                   @search indexes and @hasInverse edges added, removed or changed, and the
+                   predicates to reindex (see SchemaDiff).
+    --graph        Instead of the schema, print the dependency graph of the FILE inputs
+                   as JSON (see SchemaGraph).
+    --affected DEFS  Instead of the schema, print the definitions and the operations (Query.FIELD,
+                   Mutation.FIELD) of the FILE inputs affected by a change of the comma separated
+                   definitions DEFS, as JSON: their implementing types, inputs and operations
+                   (transitively), and the definitions and operations referencing one of them
+                   (not transitively: the schema is cyclic, the referencing definitions
+                   are not followed further).
+    --expand-dgraph  Instead of the schema, print the schema Dgraph generates from the --dgraph
+                   schema (with its queries, mutations, filters and inputs, see DgraphSchema),
+                   without a running Dgraph.
+    --serve ADDRESS  Serve the transformations over HTTP on ADDRESS, either HOST:PORT (HOST
+                   a loopback address, localhost by default) or the path of a Unix socket
+                   (an existing socket is replaced, not another kind of file): POST the SDL text
+                   to /dgraph or /gqlgen to get it transformed.
+                   The requests are handled concurrently by a pool of --jobs parsers.
+    --watch        Regenerate the --out-dgraph/--out-gqlgen targets each time their inputs change,
+                   incrementally and with a parser built once (see WatchSDL).
+    --profile-rules STACKS  Report the call counts, cumulative and self time of the grammar rules
+                   and of the semantic actions (with the memo hit rate of the rules) on stderr,
+                   and write the collapsed stacks to STACKS (see flamegraph.pl). Disables the cache.
 '''
 
+import os
 import sys
 import re
 import itertools
-from loguru import logger
-from collections import OrderedDict, defaultdict
-from copy import deepcopy
-from pprint import pprint
-from docopt import docopt
-from tatsu import compile
-from tatsu.util import asjsons
+import time
+from collections import OrderedDict, Counter, defaultdict, namedtuple
+from contextlib import contextmanager
 from tatsu.ast import AST
 
-from gram.graphql import GRAPHQLParser
+from gram.sdlparser import SDLParser
+
+# Slow imports are done on demand, only by the code that needs them:
+# * the tatsu generated parser (gram.graphql), see new_parser,
+# * loguru, see _Logger,
+# * the process pool, inotify, http server and debug modules,
+# * the modules of the cache (hashlib, pickle, zlib), of the profiles (json, resource, tracemalloc),
+#   of the server (queue, threading) and of the scheduling of the semantics (heapq).
+
+
+class _Logger:
+    ''' Import loguru on the first message. '''
+
+    def __getattr__(self, name):
+        global logger
+        from loguru import logger
+        return getattr(logger, name)
+
+
+logger = _Logger()
 
 sys.setrecursionlimit(10**4)
 
@@ -38,6 +106,23 @@ sys.setrecursionlimit(10**4)
 _dgraph_directives = ['id', 'search', 'hasInverse', 'remote', 'custom', 'auth', 'lambda', 'generate', 'secret', 'dgraph', 'default', 'cacheControl', 'withSubscription']
 _hook_prefix = "hook_"
 _input_names = ["input", "filter"]
+# Inputs generated by Dgraph for a type: group 1 or 2 is the type name.
+_derived_input = re.compile(r'Add(\w*)Input$|(\w*)(?:Patch|Filter|Ref)$')
+
+# Rules of the top-level definitions, by their name in the type_system_definition rule.
+# Their semantics depend on the definitions parsed before them (duplicates, interfaces...)
+# and on the target (see DeferredSemantics).
+_definition_rules = OrderedDict([
+    ('schema_definition', 'schema_definition'),
+    ('directive_definition', 'directive_definition'),
+    ('interface_definition', 'interface_type_definition'),
+    ('enum_definition', 'enum_type_definition'),
+    ('type_definition', 'object_type_definition'),
+    ('extension_definition', 'type_system_extension'),
+    ('input_definition', 'input_object_type_definition'),
+    ('union_definition', 'union_type_definition'),
+    ('scalar_definition', 'scalar_type_definition'),
+])
 
 # IMPROVMENT:
 # * Show the line when an assert error occurs...
@@ -48,13 +133,205 @@ class AST2(AST):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-    def clear(self):
-        for k in list(self):
-            del self[k]
+    @classmethod
+    def cast(cls, ast):
+        ''' Returns ast as an AST2, the type is changed in place (no copy). '''
+        if type(ast) is not cls:
+            object.__setattr__(ast, '__class__', cls)
+        return ast
+
+    def __reduce__(self):
+        # Keep the AST2 type when pickled (see ParseCache)
+        return (AST2, (), None, None, iter(self.items()))
+
+
+# Top-level definition chunk of a SDL text (see scan_definitions).
+# * kind: the definition keyword (type, interface, input, enum, union, directive, scalar, schema, extend).
+# * name: the definition name ('@name' for directives).
+# * start, end: span of the definition in the text, including its leading comments and description.
+# * header: the words at the top level of the definition (ie outside braces, parenthesis and strings).
+SDLChunk = namedtuple('SDLChunk', 'kind name start end header')
+
+_definition_keywords = ('type', 'interface', 'input', 'enum', 'union', 'directive', 'scalar', 'schema', 'extend')
+
+_sdl_token = re.compile(r'''
+    (?P<string>"""[\s\S]*?"""|"(?:[^"\\\n]|\\.)*")
+  | (?P<comment>\#[^\n]*)
+  | (?P<open>[{(\[])
+  | (?P<close>[})\]])
+  | (?P<name>[_A-Za-z][_0-9A-Za-z]*)
+  | (?P<punct>[^\s"\#{}()\[\]_A-Za-z])
+''', re.X)
+
+# Next token that matters inside braces, parenthesis and brackets: the text before it is skipped
+# at once (a quote is skipped when it does not start a string).
+_sdl_nested_token = re.compile(r'''
+    [^"\#{}()\[\]]*
+    (?:
+      (?P<string>"""[\s\S]*?"""|"(?:[^"\\\n]|\\.)*")
+    | (?P<comment>\#[^\n]*)
+    | (?P<open>[{(\[])
+    | (?P<close>[})\]])
+    | (?P<quote>")
+    )
+''', re.X)
+
+
+def scan_definitions(text):
+    ''' Split a SDL text in top-level definitions chunks without parsing it.
+        The scanner is aware of braces, strings and comments, and the chunks
+        cover the whole text (the leading comments and description of a definition
+        belong to its chunk).
+        Returns a list of SDLChunk.
+    '''
+
+    chunks = []
+    depth = 0
+    lead = None # start of the comments/description preceding a definition
+    prev = None # previous top-level token
+    cur = None
+
+    pos = 0
+    while True:
+        if depth > 0:
+            m = _sdl_nested_token.match(text, pos)
+        else:
+            m = _sdl_token.search(text, pos)
+        if m is None:
+            break
+        pos = m.end()
+        kind = m.lastgroup
+        value = m.group(kind)
+        if kind == 'open':
+            depth += 1
+        elif kind == 'close':
+            depth -= 1
+        if depth > 0 or kind == 'close':
+            lead = None
+            continue
+
+        if kind in ('comment', 'string'):
+            if lead is None:
+                lead = m.start()
+            continue
+
+        if kind == 'name' and value in _definition_keywords and prev != '@':
+            start = m.start() if lead is None else lead
+            if cur is None:
+                start = 0
+            else:
+                chunks.append(cur._replace(end=start))
+            cur = SDLChunk(value, None, start, None, [])
+        elif cur is not None:
+            cur.header.append(value)
+
+        lead = None
+        prev = value
+
+    if cur is None:
+        if text.strip():
+            # Comments only
+            chunks.append(SDLChunk(None, '', 0, len(text), []))
+        return chunks
+
+    chunks.append(cur._replace(end=len(text)))
+
+    # Name the definitions.
+    for i, c in enumerate(chunks):
+        names = [x for x in c.header if _sdl_token.fullmatch(x).lastgroup == 'name']
+        if c.kind == 'directive':
+            name = '@' + names[0] if names else ''
+        elif c.kind == 'schema':
+            name = 'schema'
+        elif c.kind == 'extend':
+            name = 'extend ' + ' '.join(names[:2])
+        else:
+            name = names[0] if names else ''
+        chunks[i] = c._replace(name=name)
+
+    return chunks
+
+
+def skip_duplicates(inputs, kinds):
+    ''' Returns the inputs without the duplicate definitions of the given kinds (the definitions
+        following a definition of the same kind and name, in the order of the inputs), and the
+        number of definitions removed from each input. The removed definitions are not parsed.
+
+        The definitions are found by scanning the inputs (see scan_definitions), only the inputs
+        in which a name is defined at the beginning of a line more than once overall are scanned.
+    '''
+    inputs = list(inputs)
+    skipped = [0] * len(inputs)
+    if not kinds:
+        return inputs, skipped
+
+    head = re.compile(r'^(%s)\s+(\w+)' % '|'.join(kinds), re.M)
+    heads = [head.findall(text) for text in inputs]
+    count = Counter(itertools.chain.from_iterable(heads))
+    duplicates = set(k for k, n in count.items() if n > 1)
+    if not duplicates:
+        return inputs, skipped
+
+    seen = set()
+    for i, text in enumerate(inputs):
+        if not duplicates.intersection(heads[i]):
+            continue
+
+        chunks = []
+        for c in scan_definitions(text):
+            key = (c.kind, c.name)
+            if c.kind in kinds and key in seen:
+                skipped[i] += 1
+            else:
+                seen.add(key)
+                chunks.append(text[c.start:c.end])
+        if skipped[i]:
+            inputs[i] = ''.join(chunks)
+
+    return inputs, skipped
+
+
+def schedule(deps):
+    ''' Returns the order in which to process definitions, given for each definition (in the
+        order of the inputs) the indices of the definitions it depends on.
+        The order is the order of the inputs, except that a definition is delayed until its
+        dependencies are processed. Dependency cycles are broken in the order of the inputs.
+    '''
+    import heapq
+
+    waiting = [set(d) - {i} for i, d in enumerate(deps)]
+    dependents = defaultdict(list)
+    for i, d in enumerate(waiting):
+        for j in d:
+            dependents[j].append(i)
+
+    ready = [i for i, d in enumerate(waiting) if not d]
+    heapq.heapify(ready)
+    done = [False] * len(deps)
+    order = []
+    while len(order) < len(deps):
+        if ready:
+            i = heapq.heappop(ready)
+        else:
+            # Cycle
+            i = next(i for i, d in enumerate(done) if not d)
+        if done[i]:
+            continue
+
+        done[i] = True
+        order.append(i)
+        for j in dependents[i]:
+            waiting[j].discard(i)
+            if not waiting[j] and not done[j]:
+                heapq.heappush(ready, j)
+
+    return order
 
 
 class SemanticFilter:
-    ''' Semantic based on the EBNF Grammar defined at gram/graphql.ebnf '''
+    ''' Semantic based on the EBNF Grammar defined at gram/graphql.ebnf.
+        The definitions are the IR of the parsed inputs (see to_ir), modified in place.
+    '''
 
     def __init__(self):
 
@@ -62,232 +339,164 @@ class SemanticFilter:
         self.interfaces = OrderedDict()
         self.types = OrderedDict()
         self.inputs = OrderedDict()
-        self.enums = []
-        self.unions = []
+        self.enums = set()
+        self.unions = set()
         # Also :
         # {type}__directive : [query level directives] | Seek @_hook_prefix directive
         # {type}__implements : [implemented interfaces]
+        # {type}__fields : {field name: field data} | Lookup of the {type} field data
 
-        # Directives definition to append to the schema
+        # Directives definition to append to the schema (see push_extra_directive)
         self.extra_directives = []
+        self._extra_directives = {}
 
-    @staticmethod
-    def get_name(ast):
-        return '' if not ast else ast._name.name
+        # Definitions per kind and operation counters (see stats).
+        self.definitions = Counter()
+        self.counters = Counter()
+
+    # The directive definitions added by these definitions are printed first, in this order,
+    # so that the schema does not depend on the order of the definitions (see extra_key).
+    extra_order = ('Mutation', 'Query')
+
+    @classmethod
+    def extra_key(cls, name):
+        return cls.extra_order.index(name) if name in cls.extra_order else len(cls.extra_order)
+
+    def stats(self):
+        ''' Returns the counters reported by --profile. '''
+        return {'definitions': dict(self.definitions), 'counters': dict(self.counters)}
 
     @staticmethod
-    def get_fields(ast):
-        ''' Returns the fields of a object.
+    def get_fields(definition):
+        ''' Returns the fields of a object (the list of the definition).
             * remove comments
         '''
-        if not ast._fields or len(ast._fields) != 3:
+        if definition.fields is None:
             raise ValueError("""Parsing error: field not found. Please check your grammar and be cautious with multiline comments.
-                         AST: %s""" % ast)
-        fields = ast._fields[1]
+                         Definition: %s""" % definition.name)
+        fields = definition.fields
 
         # Filter Comments
-        to_remove = [i for i, f in enumerate(fields) if not f.field.get('_name')]
-        for i in to_remove[::-1]:
-            fields.pop(i)
+        fields[:] = [f for f in fields if isinstance(f, (Field, Argument))]
 
         return fields
 
-    @staticmethod
-    def get_args(field):
-        ''' field is an ast.
-            Returns an ast representing the args
-        '''
-
-        if field.get('args'):
-            assert(field.args[0] == '(')
-            assert(field.args[-1] == ')')
-            return field.args
-        else:
-            return None
-
-    @classmethod
-    def get_directives(cls, field):
-        ''' field is an ast.
-            Returns an ast representing the directives
-        '''
-
-        if field.get('_directives'):
-            return field._directives
-        else:
-            cls._ast_set(field, '_directives', [])
-            return field._directives
-
-    @staticmethod
-    def _ast_set(ast, rule_name, value, pos=None):
-        assert(isinstance(ast, AST))
-        items = list(ast.items())
-        if pos:
-            # DEBUG AST, assume empty rule are push at the end
-            i = list(ast).index(rule_name)
-            items.pop(i)
-            assert(list(ast)[pos] != rule_name)
-            assert(i > pos)
-            items = items[:pos] + [(rule_name, value)] + items[pos:]
-
-        ast.clear()
-
-        for k, _v in items:
-            v = _v
-            if k == rule_name:
-                v = value
-            ast[k] = v
-
-    def populate_data(self, data_type, name, ast, filter_directives=True):
+    def populate_data(self, data_type, name, definition, filter_directives=True):
         # LOG DEBUG
         #print('Populate: %s %s' % (data_type, name))
         data = getattr(self, data_type)
         data[name] = []
-        self._populate_data(data, name, ast, filter_directives=filter_directives)
+        data[name+'__fields'] = {}
+        self._populate_data(data, name, definition, filter_directives=filter_directives)
         return
 
-    def _populate_data(self, data, name, ast, filter_directives=True):
-        ''' Populate data from ast parsing. '''
+    def _populate_data(self, data, name, definition, filter_directives=True):
+        ''' Populate data from a definition. '''
 
         # Populate Types Directives
-        data[name+'__directives'] = []
-        if ast.get('_directives'):
-            to_remove = []
-            for i, d in enumerate(ast._directives):
-                if not d:
-                    continue
-
-                data[name+'__directives'].append(d)
-                if d._name.name == _hook_prefix:
-                    to_remove.append(i)
-
-            for i in to_remove[::-1]:
-                ast._directives.pop(i)
+        data[name+'__directives'] = list(definition.directives)
+        if any(d.name == _hook_prefix for d in definition.directives):
+            definition.directives = tuple(d for d in definition.directives if d.name != _hook_prefix)
 
         # add interfaces info
-        if ast.get('_implements'):
-            data[name+'__implements'] = ast._implements[1].name
+        if definition.interfaces:
+            data[name+'__implements'] = definition.interfaces[0]
 
         # Populate fields
-        fields = self.get_fields(ast)
+        fields = self.get_fields(definition)
         for f in fields:
             self._push_field(name, f, data, filter_directives)
 
         return
-    def _push_field(self, name, f, data, filter_directives=False, update=False):
-        field = f.field
+    def _push_field(self, name, field, data, filter_directives=False, update=False):
 
         # Add field
-        field_data = {'name': self.get_name(field),
-                      'args': self.get_args(field), # list of AST
-                      'directives': [], # list of AST
+        field_data = {'name': field.name,
+                      'args': field.args, # tuple of Argument
+                      'directives': list(field.directives), # list of Directive
                       # -- keep pointer to propagate modifications
-                      'ast': f, # AST
+                      'field': field, # Field or Argument
                      }
 
-        # Feed and filter directives
-        if field.get('_directives'):
-            to_remove = []
-            for i, d in enumerate(field._directives):
-                if not d:
-                    continue
-
-                # build directive lookup
-                dn = self.get_name(d)
-                field_data['directives'].append({
-                    'name': dn,
-                    'ast': d,
-                })
-                if dn.startswith('x_') or dn.startswith('w_'):
-                    to_remove.append(i)
-
-            # filter directives
-            if filter_directives:
-                for i in to_remove[::-1]:
-                    field._directives.pop(i)
+        # filter directives
+        if filter_directives and any(d.name.startswith(('x_', 'w_')) for d in field.directives):
+            field.directives = tuple(d for d in field.directives if not d.name.startswith(('x_', 'w_')))
 
         if update:
             # There should be at list one field already in this object.
-            # extra will be added athe end of the stringify functions for this field
-            data[name][-1]['ast']['extra'] = f
+            # extra will be printed after this field (see Field.line)
+            anchor = data[name][-1]['field']
+            anchor.extra += (field,)
         else:
             data[name].append(field_data)
+            data[name+'__fields'].setdefault(field_data['name'], field_data)
 
         return field_data
 
-    def inherit_interface(self, ast):
+    def inherit_interface(self, definition):
         '''Inherits implemented interface '''
 
-        if not ast._implements:
+        if not definition.interfaces:
             return
 
-        if len(ast._implements) > 2:
+        if len(definition.interfaces) > 1:
             # @debug: multiple inheritance will break.
             raise NotImplementedError('Review this code for multiple inheritance.')
         else:
-            interface_name = ast._implements[1].name
+            interface_name = definition.interfaces[0]
 
         # LOG DEBUG
-        #print('%s Inheriting interface %s : ' % (ast._name.name,  interface_name))
+        #print('%s Inheriting interface %s : ' % (definition.name,  interface_name))
         #pprint(self.interfaces[interface_name])
 
-        # Get ast fields...
-        fields = self.get_fields(ast)
-        field_names = [self.get_name(f.field) for f in fields]
+        # Get fields...
+        fields = self.get_fields(definition)
+        field_names = set(f.name for f in fields)
         for itf_fd in self.interfaces[interface_name]:
-            fd = itf_fd['ast']
-            name = self.get_name(fd.field)
-            if name in field_names:
+            if itf_fd['name'] in field_names:
                 continue
 
             # LOG DEBUG
-            #print('%s inherited %s field from %s' % (ast._name.name, name, interface_name))
+            #print('%s inherited %s field from %s' % (definition.name, itf_fd['name'], interface_name))
 
             # Inherit a  field
-            # deepcopy prevent the parent AST to be modified later, when
-            # working on the child AST.
-            fields.append(deepcopy(fd))
-
-            # Current field
-            curfd = [x.field for x in fields if name == self.get_name(x.field)][0]
+            # The field is copied, so that the interface is not modified when working on the type.
+            field = itf_fd['field'].copy()
 
             # Inherit a directive
-            directives = itf_fd['directives']
-            if not curfd._directives and directives:
-                self._ast_set(curfd, '_directives', [x['ast'] for x in  directives])
+            if not field.directives and not field.dropped and itf_fd['directives']:
+                field.directives = tuple(itf_fd['directives'])
                 # LOG DEBUG
-                #print('%s inherited %s directive from %s' % (curfd._name.name, len(directives), interface_name))
+                #print('%s inherited %s directive from %s' % (field.name, len(field.directives), interface_name))
+
+            fields.append(field)
+            self.counters['fields_inherited'] += 1
 
 
         return
 
-    def inherit_interface_dgraph(self, ast):
+    def inherit_interface_dgraph(self, definition):
         '''Inherits implemented interface.
             * if field is already defined in interface, removed it. Dgraph will throw an error otherwie.
             * If type if empty add a dummy field.
         '''
 
-        if not ast._implements:
+        if not definition.interfaces:
             return
 
-        if len(ast._implements) > 2:
+        if len(definition.interfaces) > 1:
             raise NotImplementedError('Review this code for multiple inheritance.')
         else:
-            interface_name = ast._implements[1].name
+            interface_name = definition.interfaces[0]
 
-        # Get ast fields
-        fields = self.get_fields(ast)
-        fd_names = [self.get_name(f['ast'].field) for f in self.interfaces[interface_name]]
-        to_remove = []
-        for i, f in enumerate(fields):
-            if self.get_name(f.field) in fd_names:
-                to_remove.append(i)
-
-        for i in to_remove[::-1]:
-            fields.pop(i)
+        # Get fields
+        fields = self.get_fields(definition)
+        fd_names = self.interfaces[interface_name+'__fields']
+        fields[:] = [f for f in fields if f.name not in fd_names]
 
         if len(fields) == 0:
             # Dgraph need at least one field.
-            fields.append(AST(field='_VOID: String'))
+            fields.append(Line('_VOID: String'))
 
         return
 
@@ -298,7 +507,7 @@ class SemanticFilter:
         for data_type in data_types_in:
             data_in = getattr(self, data_type)
             if name_in in data_in:
-                _fields = data_in[name_in]
+                _fields = data_in[name_in+'__fields']
                 # LOG DEBUG
                 #print('Entering input copy %s -> %s ' % (name_in, name_out))
                 break
@@ -309,24 +518,24 @@ class SemanticFilter:
 
         data_out = getattr(self, data_type_out)
         for f in data_out[name_out]:
-            for _f in _fields:
-                if f['name'] != _f['name']:
-                    continue
+            _f = _fields.get(f['name'])
+            if not _f:
+                continue
 
-                for d in _f['directives']:
-                    dn = d['name']
-                    if re.search(directive_name, dn) and (not with_args or with_args and d['ast']._args):
-                        if not f['ast'].field._directives:
-                            self._ast_set(f['ast'].field, '_directives', [])
+            field = f['field']
+            directives = list(field.directives)
+            for d in _f['directives']:
+                if re.search(directive_name, d.name) and (not with_args or with_args and d.args):
+                    directives.append(d)
+                    self.counters['directives_copied'] += 1
+                    # LOG DEBUG
+                    #print('directives %s  copied in %s' % (d.name, name_out+'.'+field.name))
 
-                        f['ast'].field['_directives'].append(d['ast'])
-                        # LOG DEBUG
-                        #print('directives %s  copied in %s' % (d['ast']._name.name, name_out+'.'+self.get_name(f['ast'].field)))
+            if set_default and not directives and not field.dropped:
+                # Protect the object from Patch queries by default...
+                directives.append(Directive('x_patch_ro'))
 
-                if set_default and not f['ast'].field._directives:
-                    # Protect the object from Patch queries by default...
-                    ro = AST2({'_cst__bb': '@', '_name': AST2({'name': 'x_patch_ro'}), '_args': None})
-                    self._ast_set(f['ast'].field, '_directives', [ro])
+            field.directives = tuple(directives)
 
         return
 
@@ -347,91 +556,424 @@ class SemanticFilter:
                 type_ = groups[1]
                 if type_ in data_in:
                     for directive_ in data_in[type_ + '__directives']:
-                        if directive_._name.name != _hook_prefix:
+                        if directive_.name != _hook_prefix:
                             continue
-                        pre_directive = directive_.copy()
-                        post_directive = directive_.copy()
+                        field = f['field']
 
                         # Add Pre Hook (Input) (Query + Mutations)
                         pre_directive_name = _hook_prefix +  op + type_ + 'Input'
-                        self._ast_set(pre_directive, '_name', pre_directive_name) # @warning: breaks the original Grammar syntax.
-                        args = list(self.get_args(f['ast'].field)) # tuple are non mutable !
-                        # Directive should apply on either input or filter argument (not on eventual upsert)
-                        for i, a in enumerate(args):
-                            if isinstance(a, dict) and hasattr(a, "field") and self.get_name(a.field) in _input_names:
-                                args.insert(i+1, pre_directive)
-                                break
-
-                        self._ast_set(f['ast'].field, 'args', args)
+                        pre_directive = Directive(pre_directive_name, directive_.args)
+                        # Directive should apply on either input or filter argument (not on eventual upsert),
+                        # the first argument, before the pre hooks already added.
+                        # The arguments are shared with the duplicates, they are replaced.
+                        if field.args and field.args[0].name in _input_names:
+                            arg = field.args[0]
+                            i = len(arg.directives)
+                            while i > 0 and arg.directives[i-1].name.startswith(_hook_prefix) and arg.directives[i-1].name.endswith('Input'):
+                                i -= 1
+                            arg = Argument(arg.name, arg.type, arg.default,
+                                           arg.directives[:i] + (pre_directive,) + arg.directives[i:], arg.dropped)
+                            field.args = (arg,) + field.args[1:]
+
+                        self.counters['hook_directives'] += 1
 
                         # Push the directive definition
-                        if pre_directive_name not in self.extra_directives:
-                            directive_definition = "directive @%s on ARGUMENT_DEFINITION" % (pre_directive_name)
-                            self.extra_directives.append(directive_definition)
+                        directive_definition = "directive @%s on ARGUMENT_DEFINITION" % (pre_directive_name)
+                        self.push_extra_directive(directive_definition, name_out)
 
                         # Only add Post Hook for Mutation queries
                         if op in ('add', 'update', 'delete'):
                             # Add Post Hook (Query or Mutation Field)
                             post_directive_name = _hook_prefix + op + type_
-                            self._ast_set(post_directive, '_name', post_directive_name) # @warning: breaks the original Grammar syntax.
-                            #post_directive['cst'] = post_directive_name
-                            post_directives = self.get_directives(f['ast'].field)
+                            post_directive = Directive(post_directive_name, directive_.args)
+                            post_directives = list(field.directives)
                             post_directives.insert(len(post_directives)-1, post_directive)
+                            field.directives = tuple(post_directives)
+                            self.counters['hook_directives'] += 1
 
                             # Push the directive definition
-                            if post_directive_name not in self.extra_directives:
-                                directive_definition = "directive @%s on FIELD_DEFINITION" % (post_directive_name)
-                                self.extra_directives.append(directive_definition)
+                            directive_definition = "directive @%s on FIELD_DEFINITION" % (post_directive_name)
+                            self.push_extra_directive(directive_definition, name_out)
 
 
-    def update_fields(self, data_type, name, ast):
+    def push_extra_directive(self, directive_definition, name):
+        ''' Append a directive definition, added by the definition name, to the schema (once). '''
+        if directive_definition not in self._extra_directives:
+            self._extra_directives[directive_definition] = name
+            self.extra_directives.append(directive_definition)
+
+    def iter_extra_directives(self):
+        ''' Returns the directive definitions to append to the schema, in the order of extra_order. '''
+        return sorted(self.extra_directives, key=lambda d: self.extra_key(self._extra_directives[d]))
+
+    def update_fields(self, data_type, name, definition):
         """ Add new fields if not present on object.
             Update arguments eventually.
         """
 
+        self.counters['duplicates_dropped'] += 1
+
         data = getattr(self, data_type)
-        field_names = [x.get('name') for x in data[name]]
+        fields = data[name+'__fields']
+        field_names = set(fields)
         interface_name = data.get(name+'__implements')
         if interface_name and data_type != "interfaces":
-            field_names += [x.get('name') for x in getattr(self, 'interfaces')[interface_name]]
+            field_names.update(getattr(self, 'interfaces')[interface_name+'__fields'])
+
+        if not fields:
+            return
 
         # LOG DEBUG
         #print('Updating Doublon: %s interface: %s, fields: %s' % (name, interface_name, field_names))
-        for f in data[name]:
-            # Iterates over the fields of the 'duplicated' object <f>
-            for _ff in self.get_fields(ast):
-                _field = _ff.field
-                _name = self.get_name(_field)
-
-                if _name not in field_names and _name not in ['_VOID']:
-                    # Add a new field.
-                    self._push_field(name, _ff, data, update=True)
-                    field_names.append(_name)
-
-                elif f['name'] == _name:
-                    # Update a field
-                    args = f['args']
-                    new_args = self.get_args(_field)
-                    if not args and new_args:
-                        # Update args(input/filter); if the arguments don't already exists
-                        # and if the  new field has non empty arguments.
-                        self._ast_set(f['ast'].field, 'args', new_args)
-                        # We don't need that anymore since the ASR is ordered now ?
-                        #pos = list(_field).index('args')
-                        #self._ast_set(f['ast'].field, 'args', new_args, pos)
+        for _field in self.get_fields(definition):
+            # Iterates over the fields of the 'duplicated' object
+            _name = _field.name
+
+            if _name not in field_names and _name not in ['_VOID']:
+                # Add a new field.
+                self._push_field(name, _field, data, update=True)
+                field_names.add(_name)
+                self.counters['duplicate_fields_added'] += 1
+
+            elif _name in fields:
+                # Update a field
+                f = fields[_name]
+                if not f['args'] and _field.args:
+                    # Update args(input/filter); if the arguments don't already exists
+                    # and if the  new field has non empty arguments.
+                    f['field'].args = _field.args
         return
 
 
+class ParseCache:
+    ''' On-disk cache of the parsing results (definitions + SemanticFilter state).
+
+        Entries are keyed on the hash of the input text, of the parsers (gram/graphql.py, gram/sdlparser.py)
+        and of the semantics (class name and gqlast.py source), so any change to one
+        of them is a cache miss. Entries are pickled and compressed.
+        * entries built with another parser or semantics code are evicted as stale.
+        * the entries take at most {max_bytes} bytes (least recently used are evicted).
+        * a read_only cache is not written (get only).
+    '''
+
+    def __init__(self, path, max_bytes=64 * 2**20, read_only=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.read_only = read_only
+
+    @staticmethod
+    def _hash_file(path):
+        import hashlib
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    # Hash of the code, computed once per process: the code of a running process does not change
+    # (--watch restarts when it does).
+    _code_hash = None
+
+    def code_hash(self):
+        ''' Hash of the code that produces the cached data (parser + semantics). '''
+        if ParseCache._code_hash is None:
+            import hashlib
+            h = hashlib.sha256()
+            gram_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gram')
+            for parser_file in ('graphql.py', 'sdlparser.py'):
+                h.update(self._hash_file(os.path.join(gram_dir, parser_file)).encode())
+            h.update(self._hash_file(__file__).encode())
+            ParseCache._code_hash = h.hexdigest()[:16]
+        return ParseCache._code_hash
+
+    def key(self, text, semantics):
+        import hashlib
+        text_hash = hashlib.sha256(text.encode()).hexdigest()
+        return '%s-%s-%s' % (type(semantics).__name__, self.code_hash(), text_hash)
+
+    def _file(self, key):
+        return os.path.join(self.path, key + '.pickle.z')
+
+    def get(self, key):
+        import pickle
+        import zlib
+        fn = self._file(key)
+        try:
+            with open(fn, 'rb') as f:
+                data = pickle.loads(zlib.decompress(f.read()))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning('Corrupted cache entry removed: %s (%s)' % (fn, e))
+            self._remove(fn)
+            return None
+
+        # Mark as recently used
+        try:
+            os.utime(fn)
+        except FileNotFoundError:
+            # Evicted by another run.
+            pass
+        return data
+
+    def put(self, key, data):
+        if self.read_only:
+            return
+        import pickle
+        import zlib
+        os.makedirs(self.path, exist_ok=True)
+        fn = self._file(key)
+        tmp = '%s.%d.tmp' % (fn, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(zlib.compress(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)))
+        os.replace(tmp, fn)
+        self.evict(key)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # Removed by another run (the cache directory is shared by concurrent runs).
+            pass
+
+    def evict(self, key):
+        ''' Remove stale entries and the least recently used ones above max_bytes
+            (the entry of key is kept). The entries removed meanwhile by another run are skipped.
+        '''
+        code = key.split('-')[1]
+        entries = []
+        for fn in os.listdir(self.path):
+            if not fn.endswith('.pickle.z'):
+                continue
+            path = os.path.join(self.path, fn)
+            if fn.split('-')[1] != code:
+                self._remove(path)
+            else:
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+
+        entries.sort(reverse=True)
+        size = 0
+        for _, entry_size, path in entries:
+            size += entry_size
+            if size > self.max_bytes and path != self._file(key):
+                self._remove(path)
+
+
+def new_cache(settings):
+    ''' Returns the parse cache, or None if caching is disabled. The runs that do not
+        write a schema (--check, --diff-against) only read it.
+    '''
+    if settings.get('--no-cache') or settings.get('--profile-rules'):
+        return None
+    path = settings.get('--cache-dir') or os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'gqlast')
+    return ParseCache(path, int(settings.get('--cache-size') or 64) * 2**20,
+                      read_only=bool(settings.get('--check') or settings.get('--diff-against')))
+
+
+class Profile:
+    ''' Wall time and peak memory of the phases of a run (see --profile).
+
+        The peak memory is the peak resident set size of the process during the phase,
+        reset at the start of each phase through /proc/self/clear_refs (Linux).
+        Elsewhere, the memory is traced with tracemalloc, which slows down the phases.
+        Only the current process is accounted (not the workers parsing the inputs).
+        When disabled, the phases are not measured.
+    '''
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.phases = OrderedDict()
+        self.info = OrderedDict()
+        if not enabled:
+            return
+
+        try:
+            self._reset_rss_peak()
+            self.info['memory'] = 'rss'
+        except OSError:
+            import tracemalloc
+            self.info['memory'] = 'tracemalloc'
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+    @staticmethod
+    def _reset_rss_peak():
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+
+    @staticmethod
+    def _rss_peak():
+        with open('/proc/self/status') as f:
+            m = re.search(r'^VmHWM:\s+(\d+) kB', f.read(), re.M)
+        return int(m.group(1)) * 1024
+
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+
+        rss = self.info['memory'] == 'rss'
+        if rss:
+            self._reset_rss_peak()
+        else:
+            import tracemalloc
+            tracemalloc.reset_peak()
+
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            t = time.perf_counter() - t0
+            peak = self._rss_peak() if rss else tracemalloc.get_traced_memory()[1]
+            self.phases[name] = {'time': round(t, 6), 'peak_memory': peak}
+
+    def report(self, stats, file=sys.stderr):
+        ''' Write the phases, the stats (see SemanticFilter.stats) and the
+            maximum resident set size of the process as JSON, on a single line.
+        '''
+        if not self.enabled:
+            return
+
+        import json
+        import resource
+        data = OrderedDict(self.info)
+        data['phases'] = self.phases
+        data['max_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        data.update(stats)
+        file.write(json.dumps(data) + '\n')
+
+
+class RuleProfiler:
+    ''' Call counts, cumulative and self time of the grammar rules and of the semantic
+        actions (see --profile-rules), and memo hit/miss of the rules (tatsu parser only).
+
+        The parser and the semantics are instrumented in place by wrapping their
+        methods on the instance (see instrument_parser and instrument_semantics).
+        Recursive calls are counted once in the cumulative time.
+    '''
+
+    _rule_re = re.compile(r'^_([a-zA-Z]\w*)_$')
+
+    def __init__(self):
+        # name -> [calls, cumulative time, self time]
+        self.stats = OrderedDict()
+        self.memos = defaultdict(Counter)
+        # stack string -> self time (collapsed stacks)
+        self.stacks = Counter()
+        self._stack = []
+        self._starts = []
+        self._children = []
+
+    def _enter(self, name):
+        self._stack.append(name)
+        self._children.append(0.)
+        self._starts.append(time.perf_counter())
+
+    def _exit(self):
+        t = time.perf_counter() - self._starts.pop()
+        self_time = t - self._children.pop()
+        self.stacks[';'.join(self._stack)] += self_time
+        name = self._stack.pop()
+        if self._children:
+            self._children[-1] += t
+
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = [0, 0., 0.]
+        stats[0] += 1
+        stats[2] += self_time
+        if name not in self._stack:
+            stats[1] += t
+
+    def wrap(self, name, func):
+        def wrapper(*args, **kwargs):
+            self._enter(name)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._exit()
+        return wrapper
+
+    def instrument_parser(self, parser):
+        if hasattr(parser, '_memo_for'):
+            # Tatsu parser: every rule goes through ParseContext._call.
+            call, memo_for = parser._call, parser._memo_for
+
+            def _call(ruleinfo):
+                self._enter(ruleinfo.name)
+                try:
+                    return call(ruleinfo)
+                finally:
+                    self._exit()
+
+            def _memo_for(key):
+                memo = memo_for(key)
+                self.memos[key.rule.name]['miss' if memo is None else 'hit'] += 1
+                return memo
+
+            parser._call, parser._memo_for = _call, _memo_for
+        else:
+            # Hand-written parser: one `_{rule}_` method per rule.
+            for attr in dir(parser):
+                m = self._rule_re.match(attr)
+                if m and callable(getattr(parser, attr)):
+                    setattr(parser, attr, self.wrap(m.group(1), getattr(parser, attr)))
+        return parser
+
+    def instrument_semantics(self, semantics):
+        ''' Wrap the methods of the semantics and of its SemanticFilter, reported as
+            {class}.{method} and {class}.sf.{method} ({class} the class of the semantics).
+        '''
+        name = type(semantics).__name__
+        for prefix, obj in ((name, semantics), (name + '.sf', semantics.sf)):
+            for attr in dir(type(obj)):
+                if attr.startswith('__') or not callable(getattr(obj, attr)):
+                    continue
+                setattr(obj, attr, self.wrap('%s.%s' % (prefix, attr), getattr(obj, attr)))
+        return semantics
+
+    def report(self, stacks_file, file=sys.stderr, limit=40):
+        ''' Print the most expensive rules and actions by self time, and write
+            the collapsed stacks (in microseconds, see flamegraph.pl) to stacks_file.
+        '''
+        print('%-40s %8s %10s %10s %8s %8s %6s' % ('rule', 'calls', 'cumtime', 'selftime', 'hits', 'misses', 'hit%'), file=file)
+        ranking = sorted(self.stats.items(), key=lambda x: x[1][2], reverse=True)
+        for name, (calls, cum, self_time) in ranking[:limit]:
+            memo = self.memos.get(name)
+            if memo:
+                hits, misses = memo['hit'], memo['miss']
+                rate = '%5.1f%%' % (100 * hits / (hits + misses))
+            else:
+                hits = misses = rate = '-'
+            print('%-40s %8d %9.3fs %9.3fs %8s %8s %6s' % (name, calls, cum, self_time, hits, misses, rate), file=file)
+
+        with open(stacks_file, 'w') as f:
+            for stack, t in self.stacks.items():
+                us = int(t * 1e6)
+                if us:
+                    f.write('%s %d\n' % (stack, us))
+
+
 class GraphqlSemantics:
 
-    ''' Base GQL semantic'''
+    ''' Base GQL semantic.
+        The parser actions (the rules on characters and numbers) apply on the AST, the rules
+        of the target semantics on the IR of the definitions (see SDL.apply_semantics).
+    '''
+
+    # Kinds of the definitions whose duplicates are dropped by the semantics without being used:
+    # they can be removed before parsing (see skip_duplicates).
+    dropped_duplicates = ()
 
     def __init__(self):
         self.sf = SemanticFilter()
 
     def _default(self, ast):
         if isinstance(ast, AST):
-            ast = AST2(ast)
+            ast = AST2.cast(ast)
         return ast
 
     def CHARACTER(self, ast):
@@ -459,27 +1001,26 @@ class GqlgenSemantics(GraphqlSemantics):
         * filter doublon
     '''
 
-    def interface_type_definition(self, ast):
+    dropped_duplicates = ('enum', 'union', 'input')
+
+    def interface_type_definition(self, definition):
         ''' Interface handle
             * filter out doublon
         '''
-        assert(isinstance(ast, AST))
-        ast = AST2(ast)
+        assert(isinstance(definition, Interface))
 
-        name = self.sf.get_name(ast)
+        name = definition.name
         # Watch out duplicate !
         if name in self.sf.interfaces:
-            self.sf.update_fields('interfaces', name, ast)
+            self.sf.update_fields('interfaces', name, definition)
             return None
         else:
-            self.sf.populate_data('interfaces', name, ast)
+            self.sf.populate_data('interfaces', name, definition)
 
         # rename interface to type for gqlgen compatibility !
-        self.sf._ast_set(ast, '_cst', 'type')
+        return Type(name, (), definition.directives, definition.fields)
 
-        return ast
-
-    def object_type_definition(self, ast):
+    def object_type_definition(self, definition):
         ''' Type handle
         * add or updated (doublon) types: Doublon occurs because Type are present twice, once from the file
              where the type is defined, and twice from the generated schema from dgraph.
@@ -487,42 +1028,40 @@ class GqlgenSemantics(GraphqlSemantics):
              while Dgraph can bring new properties.
         * inherit from interfaces fields and directives if not already presents
         '''
-        assert(isinstance(ast, AST))
-        ast = AST2(ast)
+        assert(isinstance(definition, Type))
 
-        name = self.sf.get_name(ast)
+        name = definition.name
         # Watch out duplicate !
         if name in self.sf.types:
-            self.sf.update_fields('types', name, ast)
+            self.sf.update_fields('types', name, definition)
             return None
         else:
-            self.sf.inherit_interface(ast)
-            self.sf.populate_data('types', name, ast)
+            self.sf.inherit_interface(definition)
+            self.sf.populate_data('types', name, definition)
 
         # remove interface gqlgen compatibility !
-        self.sf._ast_set(ast, '_implements', None)
+        definition.interfaces = ()
 
         if name in ('Mutation', 'Query'):
             self.sf.copy_hook_directives(['types', 'interfaces'], name, 'types')
 
-        return ast
+        return definition
 
-    def input_object_type_definition(self, ast):
+    def input_object_type_definition(self, definition):
         ''' Input handle
             * filter out doublon
             * add filtered directive
                 - @x_* directive work with *Patch input (we assumed that AddInput are managed by the BLA).
                 - @w_* directive work with Add*Input, *Patch and *Filter inputs (used to alter a input field).
         '''
-        assert(isinstance(ast, AST))
-        ast = AST2(ast)
+        assert(isinstance(definition, Input))
 
-        name = self.sf.get_name(ast)
+        name = definition.name
         # Watch out duplicate !
         if name in self.sf.inputs:
             return None
         else:
-            self.sf.populate_data('inputs', name, ast, filter_directives=False)
+            self.sf.populate_data('inputs', name, definition, filter_directives=False)
 
         type_name = None
         if name.startswith('Add') and name.endswith('Input'):
@@ -555,46 +1094,46 @@ class GqlgenSemantics(GraphqlSemantics):
                 self.sf.copy_directives(type_name, ['types', 'interfaces'], name, 'inputs', r'^w_')
                 self.sf.copy_directives(type_name, ['types', 'interfaces'], name, 'inputs', r'^x_')
 
-        return ast
+        return definition
 
-    def enum_type_definition(self, ast):
+    def enum_type_definition(self, definition):
         ''' Enum handle
             * filter out doublon
         '''
 
-        assert(not isinstance(ast, AST))
+        assert(isinstance(definition, Enum))
 
-        name = ast[1].name
+        name = definition.name
         # Watch out duplicate !
         if name in self.sf.enums:
             return None
         else:
-            self.sf.enums.append(name)
+            self.sf.enums.add(name)
 
-        return ast
+        return definition
 
-    def union_type_definition(self, ast):
+    def union_type_definition(self, definition):
         ''' Union handle
             * filter out doublon
         '''
 
-        assert(not isinstance(ast, AST))
+        assert(isinstance(definition, Union))
 
-        name = ast[1].name
+        name = definition.name
         # Watch out duplicate !
         if name in self.sf.unions:
             return None
         else:
-            self.sf.unions.append(name)
+            self.sf.unions.add(name)
 
-        return ast
+        return definition
 
-    def directive(self, ast):
+    def directive(self, directive):
         ''' Filter non-dgraph directive. '''
-        if ast._name.name in _dgraph_directives:
-            return ''
+        if directive.name in _dgraph_directives:
+            return None
         else:
-            return ast
+            return directive
 
 
 class DgraphSemantics(GraphqlSemantics):
@@ -605,50 +1144,740 @@ class DgraphSemantics(GraphqlSemantics):
         * filter doublon
     '''
 
-    def interface_type_definition(self, ast):
+    def interface_type_definition(self, definition):
         ''' Interface handle
             * filter or doublon
         '''
-        assert(isinstance(ast, AST))
-        ast = AST2(ast)
+        assert(isinstance(definition, Interface))
 
-        name = self.sf.get_name(ast)
+        name = definition.name
         # Watch out duplicate !
         if name in self.sf.interfaces:
-            self.sf.update_fields('interfaces', name, ast)
+            self.sf.update_fields('interfaces', name, definition)
             return None
         else:
-            self.sf.populate_data('interfaces', name, ast)
+            self.sf.populate_data('interfaces', name, definition)
 
-        return ast
+        return definition
 
-    def object_type_definition(self, ast):
+    def object_type_definition(self, definition):
         '''Type handle
             * filter on doublon
             * add implemented interfaces fields if not already presents
         '''
-        assert(isinstance(ast, AST))
-        ast = AST2(ast)
-        name = self.sf.get_name(ast)
+        assert(isinstance(definition, Type))
+        name = definition.name
 
         # Watch out duplicate !
         if name in self.sf.types:
-            self.sf.update_fields('types', name, ast)
+            self.sf.update_fields('types', name, definition)
             return None
         else:
             # Here, this method will remove attribute.
             # Dgraph want the same field of the interface or nothing.
-            self.sf.populate_data('types', name, ast)
-            self.sf.inherit_interface_dgraph(ast)
+            self.sf.populate_data('types', name, definition)
+            self.sf.inherit_interface_dgraph(definition)
 
-        return ast
+        return definition
 
-    def directive(self, ast):
+    def directive(self, directive):
         ''' Filter out non-dgraph directive. '''
-        if ast._name.name in _dgraph_directives:
-            return ast
+        if directive.name in _dgraph_directives:
+            return directive
         else:
-            return ''
+            return None
+
+
+class DeferredSemantics(GraphqlSemantics):
+
+    ''' Semantic that leaves the directives and the top-level definitions untouched.
+        The parsed AST does not depend on the target (dgraph or gqlgen), the rules
+        of the target semantics are applied afterwards on its IR (see to_ir and SDL.apply_semantics).
+        Every input is parsed with it: the inputs can be parsed in worker processes,
+        a parse shared between targets, and the rules applied in two passes.
+    '''
+
+    _deferred_rules = ['directive'] + list(_definition_rules.values())
+
+    def __getattr__(self, name):
+        if name in self._deferred_rules:
+            return lambda ast: ast
+        raise AttributeError(name)
+
+
+def new_parser(name, low_memory=False):
+    ''' Returns a new parser. With low_memory, the tatsu parser only memoizes the left recursive
+        rules (implements_interfaces, whose results are kept apart anyway): its memo table holds
+        an entry per position and rule tried, and the schemas hardly need it to backtrack.
+    '''
+    if name == 'tatsu':
+        from gram.graphql import GRAPHQLParser
+        parser = GRAPHQLParser()
+        if low_memory:
+            memoize = parser._memoize
+            parser._memoize = lambda key, memo: memoize(key, memo) if key.rule.is_leftrec else memo
+        return parser
+    elif name == 'fast':
+        return SDLParser()
+    else:
+        raise ValueError('Unknown parser: %s' % name)
+
+
+def parse_errors():
+    ''' Returns the classes of the syntax errors raised by the parsers (see new_parser). '''
+    from tatsu.exceptions import FailedParse
+    from gram.sdlparser import ParseError
+    return (FailedParse, ParseError)
+
+
+# Parsers worth skipping the duplicate definitions for (see skip_duplicates): the hand-written
+# parser parses the few dropped duplicates faster than the inputs are scanned.
+_skipping_parsers = ('tatsu',)
+
+
+# Parsers whose memory grows with the text parsed (the memo table of the PEG parser generated
+# by TatSu): they parse the top-level definitions one by one (see parse_deferred).
+_chunked_parsers = ('tatsu',)
+
+
+def split_definitions(text):
+    ''' Returns the texts of the top-level definitions of text (see scan_definitions),
+        or [text] if it has no definition.
+    '''
+    chunks = scan_definitions(text)
+    if not chunks or chunks[0].kind is None:
+        return [text]
+    return [text[c.start:c.end] for c in chunks]
+
+
+def parse_definitions(texts, parser_name, parser=None, low_memory=False):
+    ''' Parse each text with DeferredSemantics, returns the IR of their definitions (see to_ir):
+        the AST of a text is dropped once converted. A blank text has no definition.
+    '''
+    parser = parser or new_parser(parser_name, low_memory)
+    return [to_ir(parser.parse(text, rule_name='start', semantics=DeferredSemantics(), parseinfo=False))
+            if text.strip() else [] for text in texts]
+
+
+def parse_deferred(text, parser_name, chunked=None, parser=None, low_memory=False):
+    ''' Parse text without applying the target rules (see DeferredSemantics), returns the IR
+        of its definitions. If chunked (default: for the parsers in _chunked_parsers), the top-level
+        definitions are parsed one by one: the memory of the parser then depends on the largest
+        definition rather than on the whole text.
+    '''
+    if not text.strip():
+        # The start rule needs a definition (the inputs are parsed one by one).
+        return []
+    if chunked is None:
+        chunked = parser_name in _chunked_parsers
+    if not chunked:
+        return parse_definitions([text], parser_name, parser, low_memory)[0]
+
+    try:
+        return list(itertools.chain.from_iterable(
+            parse_definitions(split_definitions(text), parser_name, parser, low_memory)))
+    except parse_errors():
+        pass
+    # Report the error with its location in the text.
+    return parse_deferred(text, parser_name, chunked=False, parser=parser, low_memory=low_memory)
+
+
+def parse_deferred_inputs(inputs, parser_name, jobs=None, low_memory=False):
+    ''' Parse the inputs with DeferredSemantics, in a process pool if jobs > 1
+        (default: one process per input, up to the number of CPUs).
+        The inputs of a chunked parser (see parse_deferred), or of any parser when there are
+        less inputs than processes, are split in definitions, sent to the processes in batches
+        of about the same size.
+    '''
+    jobs = int(jobs or min(len(inputs), os.cpu_count() or 1))
+    if jobs <= 1:
+        return [parse_deferred(text, parser_name, low_memory=low_memory) for text in inputs]
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(jobs) as pool:
+        if parser_name not in _chunked_parsers and len(inputs) >= jobs:
+            return list(pool.map(parse_deferred, inputs, itertools.repeat(parser_name),
+                                 itertools.repeat(None), itertools.repeat(None), itertools.repeat(low_memory)))
+
+        chunks = [split_definitions(text) for text in inputs]
+        batch_size = sum(map(len, inputs)) / (jobs * 4)
+        batches = [[]]
+        size = 0
+        for text in itertools.chain.from_iterable(chunks):
+            if size >= batch_size:
+                batches.append([])
+                size = 0
+            batches[-1].append(text)
+            size += len(text)
+
+        try:
+            parsed = iter(list(itertools.chain.from_iterable(
+                pool.map(parse_definitions, batches, itertools.repeat(parser_name),
+                         itertools.repeat(None), itertools.repeat(low_memory)))))
+        except parse_errors():
+            # Report the error with its location in the input.
+            for text in inputs:
+                parse_deferred(text, parser_name, chunked=False, low_memory=low_memory)
+            raise
+
+    return [list(itertools.chain.from_iterable(next(parsed) for _ in c)) for c in chunks]
+
+
+# Compact representation (IR) of the definitions of a schema, built from the AST of each
+# definition as soon as it is parsed (see parse_definitions): the semantics and the printers
+# work on the IR, the AST is not kept. The nodes have slots and interned names, and print
+# themselves as SDL prints the AST they come from (see the sdl methods), spacing quirks included.
+# Values (default values, directive arguments, descriptions) are kept printed.
+
+class Node:
+    ''' Base of the IR nodes. '''
+
+    __slots__ = ()
+
+    # Key of a definition in the type_system_definition rule (see _definition_rules),
+    # None for the other nodes.
+    kind = None
+
+    def __repr__(self):
+        return '<%s %s>' % (type(self).__name__, self.sdl().strip())
+
+
+class Directive(Node):
+    ''' A directive: @name(arg:value, ...), args is a tuple of (name, printed value). '''
+
+    __slots__ = ('name', 'args')
+
+    def __init__(self, name, args=()):
+        self.name = name
+        self.args = args
+
+    def sdl(self):
+        if not self.args:
+            return ' @' + self.name
+        return ' @%s(%s)' % (self.name, ', '.join(name + ':' + value for name, value in self.args))
+
+
+class Argument(Node):
+    ''' An argument of a field or of a directive definition, or a field of an input.
+        default is the printed default value, or None.
+        dropped is the number of directives removed by the directive rule (see SDL.apply_directives):
+        the semantics only see a field without directives if it had none to start with.
+    '''
+
+    __slots__ = ('name', 'type', 'default', 'directives', 'dropped')
+
+    # The fields of an input have no arguments (see SemanticFilter).
+    args = ()
+
+    def __init__(self, name, type, default=None, directives=(), dropped=0):
+        self.name = name
+        self.type = type
+        self.default = default
+        self.directives = directives
+        self.dropped = dropped
+
+    def sdl(self):
+        return '%s%s%s%s' % (self.name, _ir_type_sdl(self.type), '' if self.default is None else '=' + self.default,
+                             ''.join(d.sdl() for d in self.directives))
+
+    def line(self):
+        return '\n  ' + self.sdl()
+
+
+class Field(Node):
+    ''' A field of a type or of an interface, args is a tuple of Argument.
+        extra is a tuple of the fields added from a duplicate definition (see SemanticFilter.update_fields),
+        printed after the field and an empty line. dropped: see Argument.
+    '''
+
+    __slots__ = ('name', 'type', 'args', 'directives', 'extra', 'dropped')
+
+    def __init__(self, name, type, args=(), directives=(), extra=(), dropped=0):
+        self.name = name
+        self.type = type
+        self.args = args
+        self.directives = directives
+        self.extra = extra
+        self.dropped = dropped
+
+    def copy(self):
+        return Field(self.name, self.type, self.args, self.directives, self.extra, self.dropped)
+
+    def sdl(self):
+        args = '(%s)' % ', '.join(a.sdl() for a in self.args) if self.args else ''
+        return '%s%s%s%s' % (self.name, args, _ir_type_sdl(self.type), ''.join(d.sdl() for d in self.directives))
+
+    def line(self):
+        if not self.extra:
+            return '\n  ' + self.sdl()
+        return '\n  %s\n%s' % (self.sdl(), ''.join(f.line() for f in self.extra))
+
+
+class EnumValue(Node):
+    ''' A value of an enum with a description (printed) or directives. The other values are names. '''
+
+    __slots__ = ('name', 'description', 'directives')
+
+    def __init__(self, name, description=None, directives=()):
+        self.name = name
+        self.description = description
+        self.directives = directives
+
+    def sdl(self):
+        name = self.name if self.description is None else self.description + ' ' + self.name
+        return name + ''.join(d.sdl() for d in self.directives)
+
+    def line(self):
+        # Only a line starting with a name is indented.
+        return ('\n  ' if self.description is None else '\n') + self.sdl()
+
+
+class Comment(Node):
+    ''' A Dgraph.Authorization comment, the only comments printed by SDL. '''
+
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text
+
+    def sdl(self):
+        return '\n\n' + self.text
+
+    def line(self):
+        return '\n' + self.sdl()
+
+
+class Line(Node):
+    ''' A member printed as is, on a line of its own (see SemanticFilter.inherit_interface_dgraph). '''
+
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text
+
+    def sdl(self):
+        return self.text
+
+    def line(self):
+        return '\n' + self.text
+
+
+class Type(Node):
+    ''' A type definition. fields is a list of Field, or None for a type without braces.
+        A None field is an empty line and a Comment a kept comment (see _ir_members).
+        ampersand is set for `implements & Name`.
+    '''
+
+    __slots__ = ('name', 'interfaces', 'directives', 'fields', 'ampersand')
+    keyword = 'type'
+    kind = 'type_definition'
+
+    def __init__(self, name, interfaces=(), directives=(), fields=None, ampersand=False):
+        self.name = name
+        self.interfaces = interfaces
+        self.directives = directives
+        self.fields = fields
+        self.ampersand = ampersand
+
+    def sdl(self):
+        out = ['\n\n', self.keyword, ' ', self.name]
+        if self.interfaces:
+            # SDL prints no space before implements for several interfaces.
+            amp = '&' if self.ampersand else ''
+            if len(self.interfaces) == 1:
+                out.append(' implements%s %s' % (amp, self.interfaces[0]))
+            else:
+                out.append('implements%s %s' % (amp, '& '.join(self.interfaces)))
+        out.extend(d.sdl() for d in self.directives)
+        if self.fields is not None:
+            out.append(_ir_block(self.fields, space=bool(self.fields) and isinstance(self.fields[0], (Field, Argument))))
+        return ''.join(out)
+
+
+class Interface(Type):
+    __slots__ = ()
+    keyword = 'interface'
+    kind = 'interface_definition'
+
+
+class Input(Type):
+    ''' An input definition, its fields are Argument. '''
+
+    __slots__ = ()
+    keyword = 'input'
+    kind = 'input_definition'
+
+
+class Enum(Node):
+    ''' An enum definition, values is a tuple of names and EnumValue (see _ir_members), or None
+        for an enum without braces. space is set when SDL prints a space before the brace.
+    '''
+
+    __slots__ = ('name', 'description', 'directives', 'values', 'space')
+    kind = 'enum_definition'
+
+    def __init__(self, name, description=None, directives=(), values=None, space=True):
+        self.name = name
+        self.description = description
+        self.directives = directives
+        self.values = values
+        self.space = space
+
+    def sdl(self):
+        values = '' if self.values is None else _ir_block(self.values, self.space)
+        return '\n\n%senum %s%s%s' % (self.description or '', self.name, ''.join(d.sdl() for d in self.directives), values)
+
+
+class Union(Node):
+    ''' A union definition, members is a tuple of type names. pipe is set for `= | Name`. '''
+
+    __slots__ = ('name', 'description', 'directives', 'members', 'pipe')
+    kind = 'union_definition'
+
+    def __init__(self, name, description=None, directives=(), members=(), pipe=False):
+        self.name = name
+        self.description = description
+        self.directives = directives
+        self.members = members
+        self.pipe = pipe
+
+    def sdl(self):
+        members = '=%s %s' % ('|' if self.pipe else '', '| '.join(self.members)) if self.members else ''
+        return '\n\n%sunion %s%s%s' % (self.description or '', self.name, ''.join(d.sdl() for d in self.directives), members)
+
+
+class Scalar(Node):
+    __slots__ = ('name', 'description', 'directives')
+    kind = 'scalar_definition'
+
+    def __init__(self, name, description=None, directives=()):
+        self.name = name
+        self.description = description
+        self.directives = directives
+
+    def sdl(self):
+        return '\n\n%sscalar %s%s' % (self.description or '', self.name, ''.join(d.sdl() for d in self.directives))
+
+
+class DirectiveDefinition(Node):
+    ''' A directive definition, args is a tuple of Argument and locations a tuple of names. '''
+
+    __slots__ = ('name', 'args', 'locations')
+    kind = 'directive_definition'
+
+    def __init__(self, name, args=(), locations=()):
+        self.name = name
+        self.args = args
+        self.locations = locations
+
+    def sdl(self):
+        args = '(%s)' % ', '.join(a.sdl() for a in self.args) if self.args else ''
+        return '\n\ndirective @%s%s on %s' % (self.name, args, '|'.join(self.locations))
+
+
+class Raw(Node):
+    ''' A definition of a kind the IR does not model (schema, extensions, executable definitions),
+        kept as parsed and printed by SDL.
+    '''
+
+    __slots__ = ('node', 'kind')
+
+    def __init__(self, node, kind=None):
+        self.node = node
+        self.kind = kind
+
+    def sdl(self):
+        return ''.join(SDL.iter_definitions([self.node]))
+
+
+def _ir_block(members, space):
+    ''' Returns the printed braces of members: the space before the brace is only printed by SDL
+        when the first member starts with a name (or after the name of an enum without directives).
+    '''
+    lines = ''.join('\n' if m is None else '\n  ' + m if isinstance(m, str) else m.line() for m in members)
+    return '%s{%s\n}' % (' ' if space else '', lines)
+
+
+def _ir_type_sdl(type_):
+    ''' Returns a type as printed by SDL after the colon of a field or an argument:
+        the space goes before the innermost bracket of a list type.
+    '''
+    depth = len(type_) - len(type_.lstrip('['))
+    if depth <= 1:
+        return ': ' + type_
+    return ':%s %s' % (type_[:depth-1], type_[depth-1:])
+
+
+def _ir_name(ast):
+    if not isinstance(ast, dict) or list(ast) != ['name']:
+        raise ValueError('Not a name: %r' % (ast,))
+    return sys.intern(ast['name'])
+
+
+def _ir_check_keys(ast, keys):
+    if not isinstance(ast, dict) or tuple(ast) != keys:
+        raise ValueError('Unexpected node: %r' % (ast,))
+
+
+def _ir_is_comment(ast):
+    ''' Returns True for a comment or a description (COMMENTS rule). '''
+    return isinstance(ast, dict) and len(ast) == 1 and ('comment' in ast or 'doc' in ast)
+
+
+def _ir_comment(ast):
+    ''' Returns the Comment of a Dgraph.Authorization comment, None for the comments SDL drops. '''
+    if ast.get('comment'):
+        text = ''.join(ast['comment'])
+        if text.startswith('# Dgraph.Authorization'):
+            return Comment(text)
+    return None
+
+
+def _ir_value(ast):
+    ''' Returns a value (or a description) as printed by SDL after a colon or an equal sign. '''
+    out = []
+
+    def walk(o):
+        if isinstance(o, str):
+            out.append('\n}' if o == '}' else o)
+        elif isinstance(o, (list, tuple)):
+            for x in o:
+                walk(x)
+        elif _ir_is_comment(o):
+            comment = _ir_comment(o)
+            if comment:
+                out.append(comment.sdl())
+        elif isinstance(o, dict) and list(o) == ['_join']:
+            out.append(o['_join'])
+        else:
+            name = _ir_name(o)
+            out.append(name if out and out[-1] in ('[', '(', '@') else ' ' + name)
+
+    walk(ast)
+    return ''.join(out)
+
+
+def _ir_type(ast):
+    ''' Returns the text of a type: Name, Name!, [Type], [Type]! '''
+    if isinstance(ast, dict) and list(ast) == ['_type']:
+        return _ir_type(ast['_type'])
+    if isinstance(ast, (list, tuple)):
+        if len(ast) == 2 and ast[1] == '!':
+            return _ir_type(ast[0]) + '!'
+        if len(ast) == 3 and ast[0] == '[' and ast[2] == ']':
+            return '[%s]' % _ir_type(ast[1])
+        raise ValueError('Unexpected type: %r' % (ast,))
+    return _ir_name(ast)
+
+
+def _ir_directives(ast):
+    ''' Returns the directives of a definition, a field or an argument. '''
+    directives = []
+    for d in ast or ():
+        _ir_check_keys(d, ('_cst__bb', '_name', '_args'))
+        directives.append(Directive(_ir_name(d['_name']), _ir_arguments(d['_args'])))
+    return tuple(directives)
+
+
+def _ir_arguments(ast):
+    ''' Returns the (name, printed value) arguments of a directive. '''
+    if not ast:
+        return ()
+    if ast[0] != '(' or ast[-1] != ')':
+        raise ValueError('Unexpected arguments: %r' % (ast,))
+
+    if len(ast) != 4 or any(x[0] != ',' for x in ast[2]):
+        raise ValueError('Unexpected arguments: %r' % (ast,))
+
+    args = []
+    for arg in [ast[1]] + [x[1] for x in ast[2]]:
+        # {LINE_COMMENT} name ':' value
+        if len(arg) < 4 or arg[2] != ':' or not all(_ir_is_comment(c) for c in arg[0]):
+            raise ValueError('Unexpected argument: %r' % (arg,))
+        if any(_ir_comment(c) for c in arg[0]):
+            raise ValueError('Dgraph.Authorization comments are not supported before a directive argument: %r' % (arg,))
+        args.append((_ir_name(arg[1]), _ir_value(arg[3:])))
+    return tuple(args)
+
+
+def _ir_input_values(ast):
+    ''' Returns the Argument of an arguments definition: '(' {field} ')'. '''
+    if not ast:
+        return ()
+    if ast[0] != '(' or ast[-1] != ')':
+        raise ValueError('Unexpected arguments: %r' % (ast,))
+
+    args = []
+    for a in itertools.chain.from_iterable(x if isinstance(x, (list, tuple)) else [x] for x in ast[1:-1]):
+        if isinstance(a, (list, tuple)) and len(a) == 2 and a[0] == ',':
+            a = a[1]
+        _ir_check_keys(a, ('field',))
+        args.append(_ir_input_value(a['field']))
+    return tuple(args)
+
+
+def _ir_input_value(ast):
+    _ir_check_keys(ast, ('_name', '_cst', '_type', '_dv', '_directives'))
+    default = None
+    if ast['_dv']:
+        default = _ir_value(ast['_dv'][1:])
+    return Argument(_ir_name(ast['_name']), sys.intern(_ir_type(ast['_type'])), default, _ir_directives(ast['_directives']))
+
+
+def _ir_field(ast):
+    _ir_check_keys(ast, ('_name', 'args', '_cst', '_type', '_directives'))
+    return Field(_ir_name(ast['_name']), sys.intern(_ir_type(ast['_type'])),
+                 _ir_input_values(ast['args']), _ir_directives(ast['_directives']))
+
+
+def _ir_enum_value(ast):
+    if isinstance(ast, dict):
+        return _ir_name(ast)
+    description = None
+    if ast and not isinstance(ast[0], dict):
+        description, ast = _ir_value(ast[0]), ast[1:]
+    if len(ast) not in (1, 2):
+        raise ValueError('Unexpected enum value: %r' % (ast,))
+    return EnumValue(_ir_name(ast[0]), description, _ir_directives(ast[1] if len(ast) == 2 else None))
+
+
+def _ir_members(ast, member):
+    ''' Returns the members of a '{' ... '}' block converted by member, the Comment
+        of the kept comments and None for the others (an empty line).
+    '''
+    if not ast or len(ast) != 3 or ast[0] != '{' or ast[2] != '}':
+        raise ValueError('Unexpected block: %r' % (ast,))
+
+    members = []
+    for m in ast[1]:
+        _ir_check_keys(m, ('field',))
+        members.append(_ir_comment(m['field']) if _ir_is_comment(m['field']) else member(m['field']))
+    return members
+
+
+def _ir_implements(ast):
+    ''' Returns the interfaces of implements_interfaces, and whether the first one follows an ampersand. '''
+    if len(ast) == 3 and isinstance(ast[0], (list, tuple)) and ast[1] == '&':
+        interfaces, ampersand = _ir_implements(ast[0])
+        return interfaces + (_ir_name(ast[2]),), ampersand
+    if len(ast) == 2 and ast[0] == 'implements':
+        return (_ir_name(ast[1]),), False
+    if len(ast) == 3 and ast[0] == 'implements' and ast[1] == '&':
+        return (_ir_name(ast[2]),), True
+    raise ValueError('Unexpected interfaces: %r' % (ast,))
+
+
+def _ir_object(ast):
+    keyword = ast.get('_cst') if isinstance(ast, dict) else None
+    interfaces, ampersand = (), False
+    if keyword == 'type':
+        _ir_check_keys(ast, ('_cst', '_name', '_implements', '_directives', '_fields'))
+        if ast['_implements']:
+            interfaces, ampersand = _ir_implements(ast['_implements'])
+    else:
+        _ir_check_keys(ast, ('_cst', '_name', '_directives', '_fields'))
+
+    cls = {'type': Type, 'interface': Interface, 'input': Input}[keyword]
+    fields = None
+    if ast['_fields'] is not None:
+        fields = _ir_members(ast['_fields'], _ir_input_value if cls is Input else _ir_field)
+    return cls(_ir_name(ast['_name']), interfaces, _ir_directives(ast['_directives']), fields, ampersand)
+
+
+def _ir_unnamed(ast, keyword, last):
+    ''' Returns the description (printed), name, directives and last element of the
+        [description] keyword name [directives] [last] definitions, last starting with the last token.
+    '''
+    if not isinstance(ast, (list, tuple)):
+        raise ValueError('Unexpected %s: %r' % (keyword, ast))
+    description = None
+    if ast and ast[0] != keyword:
+        description, ast = _ir_value(ast[0]), ast[1:]
+    if len(ast) < 2 or ast[0] != keyword:
+        raise ValueError('Unexpected %s: %r' % (keyword, ast))
+
+    name, rest = _ir_name(ast[1]), list(ast[2:])
+    directives = None
+    tail = None
+    if rest and rest[-1] and rest[-1][0] == last:
+        tail = rest.pop()
+    if rest:
+        directives = rest.pop(0)
+    if rest:
+        raise ValueError('Unexpected %s: %r' % (keyword, ast))
+    return description, name, directives, tail
+
+
+def _ir_enum(ast):
+    description, name, directives, values = _ir_unnamed(ast, 'enum', '{')
+    if values is not None:
+        values = tuple(_ir_members(values, _ir_enum_value))
+    # SDL prints a space before the brace after the name, or after the directives if the first
+    # value starts with a name.
+    space = directives is None or bool(values) and (isinstance(values[0], str) or
+                                                    isinstance(values[0], EnumValue) and values[0].description is None)
+    return Enum(name, description, _ir_directives(directives), values, space)
+
+
+def _ir_union(ast):
+    description, name, directives, members = _ir_unnamed(ast, 'union', '=')
+    pipe = False
+    if members is not None:
+        # '=' ['|'] first {'|' name}
+        members = list(members[1:])
+        if members[0] == '|':
+            pipe = True
+            members.pop(0)
+        if len(members) != 2 or any(x[0] != '|' for x in members[1]):
+            raise ValueError('Unexpected union: %r' % (ast,))
+        members = (_ir_name(members[0]),) + tuple(_ir_name(x[1]) for x in members[1])
+    return Union(name, description, _ir_directives(directives), members or (), pipe)
+
+
+def _ir_scalar(ast):
+    description, name, directives, _ = _ir_unnamed(ast, 'scalar', None)
+    return Scalar(name, description, _ir_directives(directives))
+
+
+def _ir_directive_definition(ast):
+    _ir_check_keys(ast, ('_directive__ba', '_cst', '_name', 'args', '_cst__bs', '_locations'))
+    first, others = ast['_locations']
+    return DirectiveDefinition(_ir_name(ast['_name']), _ir_input_values(ast['args']),
+                               (first,) + tuple(x[1] for x in others))
+
+
+# Converters of the definitions modeled by the IR, by kind (see to_ir).
+_ir_definitions = {
+    'directive_definition': _ir_directive_definition,
+    'interface_definition': _ir_object,
+    'enum_definition': _ir_enum,
+    'type_definition': _ir_object,
+    'input_definition': _ir_object,
+    'union_definition': _ir_union,
+    'scalar_definition': _ir_scalar,
+}
+
+
+def to_ir(ast):
+    ''' Returns the IR of the top-level definitions of an AST parsed with DeferredSemantics.
+        The definitions of the other kinds than _ir_definitions are kept as Raw,
+        the comments dropped by SDL are left out.
+    '''
+    definitions = []
+    for node in ast:
+        if _ir_is_comment(node):
+            comment = _ir_comment(node)
+            if comment:
+                definitions.append(comment)
+        elif isinstance(node, dict) and 'type_definition' in node:
+            kind = next(k for k, v in node.items() if v is not None)
+            if kind in _ir_definitions:
+                definitions.append(_ir_definitions[kind](node[kind]))
+            else:
+                definitions.append(Raw(node, kind))
+        else:
+            definitions.append(Raw(node))
+    return definitions
 
 
 class SDL:
@@ -673,59 +1902,300 @@ class SDL:
         Reports to the methods documentation for further informantion.
     '''
 
-    def __init__(self, settings):
+    def __init__(self, settings, parsed=None):
         self.s = settings
+        self.profile = Profile(settings.get('--profile'))
+        self.rule_profiler = None
+
+        if parsed is not None:
+            # Inputs already parsed with DeferredSemantics (see MultiSDL)
+            self.semantics = self.new_semantics()
+            self.definitions = self.apply_semantics(parsed)
+            self.sf = self.semantics.sf
+            return
+
+        with self.profile.phase('read'):
+            self._inputs = self.read_inputs()
+        self.semantics = self.new_semantics()
+
+        cache = self.new_cache()
+        if cache:
+            key = cache.key('\0'.join(self._inputs), self.semantics)
+            cached = cache.get(key)
+            self.profile.info['cache'] = 'hit' if cached else 'miss'
+            if cached:
+                self.definitions, self.semantics.sf = cached
+                self.sf = self.semantics.sf
+                return
+
+        inputs = self.skip_duplicates(self._inputs)
+        target = ''.join(inputs)
+
+        if self.s.get('--profile-rules'):
+            # Parse the inputs in this process.
+            parser = self.new_parser()
+            self.rule_profiler = RuleProfiler()
+            self.rule_profiler.instrument_parser(parser)
+            self.rule_profiler.instrument_semantics(self.semantics)
+            deferred = self.rule_profiler.instrument_semantics(DeferredSemantics())
+            with self.profile.phase('parse'):
+                definitions = to_ir(parser.parse(target,
+                                                 rule_name='start',
+                                                 semantics=deferred,
+                                                 parseinfo=False))
+            with self.profile.phase('semantic'):
+                self.definitions = self.apply_semantics([definitions])
+        elif len(inputs) > 1 or int(self.s.get('--jobs') or 1) > 1:
+            self.definitions = self.parse_inputs(inputs)
+        else:
+            # The parser (and its buffer) is released once the text is parsed.
+            with self.profile.phase('parse'):
+                definitions = parse_deferred(target, self.s.get('--parser') or 'tatsu',
+                                             low_memory=self.s.get('--low-memory'))
+            with self.profile.phase('semantic'):
+                self.definitions = self.apply_semantics([definitions])
+
+        self.sf = self.semantics.sf
+
+        if cache:
+            cache.put(key, (self.definitions, self.sf))
 
+    def read_inputs(self):
         if not self.s['FILE']:
             raise ValueError('You must provide a GraphQL FILE argument.')
-        else:
-            infile = self.s['FILE'][0]
 
-        self._grammar = open('gram/graphql.ebnf').read()
-        self._target = open(infile).read()
+        inputs = []
+        for infile in self.s['FILE']:
+            with open(infile) as f:
+                inputs.append(f.read())
+
+        return inputs
+
+    def skip_duplicates(self, inputs):
+        ''' Returns the inputs without the duplicate definitions dropped by the semantics
+            (see skip_duplicates), they are counted as dropped.
+        '''
+        if (self.s.get('--parser') or 'tatsu') not in _skipping_parsers:
+            return inputs
+        inputs, skipped = skip_duplicates(inputs, self.semantics.dropped_duplicates)
+        self.semantics.sf.counters['definitions_dropped'] += sum(skipped)
+        return inputs
+
+    def parse_inputs(self, inputs):
+        ''' Parse the inputs in a process pool and merge their definitions in order.
+            The semantics are applied once every input is parsed (see apply_semantics),
+            so they see the definitions in the same order as for the concatenated inputs.
+        '''
+        with self.profile.phase('parse'):
+            parsed = parse_deferred_inputs(inputs, self.s.get('--parser') or 'tatsu', self.s.get('--jobs'),
+                                           self.s.get('--low-memory'))
+        with self.profile.phase('semantic'):
+            return self.apply_semantics(parsed)
+
+    def apply_semantics(self, parsed):
+        ''' Apply the deferred rules of the semantics on the definitions of the inputs parsed with
+            DeferredSemantics (see to_ir) and returns the merged definitions to print (the definitions
+            are modified in place).
+
+            The rules are applied in two passes, so that the result does not depend on the
+            order of the definitions in the inputs:
+            1. the definitions are indexed by name (see definition_dependencies),
+            2. the directive rule is applied on every definition, then the definition rules are
+               applied on each definition after the definitions it depends on (see schedule).
+        '''
+        definitions = list(itertools.chain.from_iterable(parsed))
+        deps = self.definition_dependencies(definitions)
+
+        for definition in definitions:
+            self.apply_directives(definition)
+
+        applied = [None] * len(definitions)
+        for i in schedule(deps):
+            applied[i] = self.apply_definition(definitions[i])
+        return [d for d in applied if d is not None]
+
+    @staticmethod
+    def definition_dependencies(definitions):
+        ''' Returns the indices of the definitions each definition depends on:
+            * the previous definition of the same name, for a duplicate,
+            * the interfaces implemented by a type,
+            * the type, interface or union of an Add*Input, *Patch, *Filter and *Ref input,
+            * the types and interfaces with a hook directive, for the Query and Mutation types.
+        '''
+        kinds = {'type_definition': 'types', 'interface_definition': 'types', 'union_definition': 'types',
+                 'input_definition': 'inputs', 'enum_definition': 'enums'}
+        index = []
+        last = {}
+        first = {}
+        hooked = []
+        for i, definition in enumerate(definitions):
+            key = definition.kind
+            if key not in kinds:
+                index.append(None)
+                continue
+
+            name = definition.name
+            index.append((key, name, definition))
+
+            previous = last.get((key, name))
+            last[(key, name)] = i
+            if previous is None:
+                first.setdefault((kinds[key], name), []).append(i)
+                if isinstance(definition, Type) and any(d.name == _hook_prefix for d in definition.directives):
+                    hooked.append(i)
+
+        deps = []
+        last = {}
+        for i, entry in enumerate(index):
+            d = []
+            deps.append(d)
+            if entry is None:
+                continue
+
+            key, name, definition = entry
+            previous = last.get((key, name))
+            last[(key, name)] = i
+            if previous is not None:
+                d.append(previous)
+                continue
+
+            if key == 'type_definition':
+                for x in definition.interfaces:
+                    d.extend(j for j in first.get(('types', x), []) if index[j][0] == 'interface_definition')
+                if name in ('Query', 'Mutation'):
+                    d.extend(hooked)
+            elif key == 'input_definition':
+                m = _derived_input.match(name)
+                if m:
+                    d.extend(first.get(('types', m.group(1) or m.group(2)), []))
+
+        return deps
+
+    def apply_directives(self, definition):
+        ''' Apply the directive rule on the directives of a definition, of its members and of their
+            arguments: the directives for which it returns None are removed.
+        '''
+        action = getattr(self.semantics, 'directive', None)
+        if action is None:
+            return definition
+
+        if isinstance(definition, Raw):
+            # Directives of the AST
+            stack = [definition.node]
+            while stack:
+                n = stack.pop()
+                children = n.values() if isinstance(n, dict) else n
+                for i, c in enumerate(children):
+                    if isinstance(n, list) and isinstance(c, AST) and '_cst__bb' in c:
+                        if action(Directive(_ir_name(c['_name']), _ir_arguments(c['_args']))) is None:
+                            n[i] = ''
+                    elif isinstance(c, (dict, list, tuple)):
+                        stack.append(c)
+            return definition
+
+        def apply(node):
+            if node.directives:
+                directives = tuple(d for d in map(action, node.directives) if d is not None)
+                if len(directives) != len(node.directives):
+                    if isinstance(node, (Field, Argument)):
+                        node.dropped += len(node.directives) - len(directives)
+                    node.directives = directives
+
+        nodes = [definition]
+        for member in getattr(definition, 'fields', None) or getattr(definition, 'values', None) or ():
+            if isinstance(member, (Field, Argument, EnumValue)):
+                nodes.append(member)
+                nodes.extend(getattr(member, 'args', ()))
+        nodes.extend(getattr(definition, 'args', ()))
+        for node in nodes:
+            if hasattr(node, 'directives'):
+                apply(node)
+        return definition
+
+    def apply_definition(self, definition):
+        ''' Apply the rule of its kind on a definition (see _definition_rules), returns the definition
+            to print or None (a duplicate filtered out by the rule).
+        '''
+        kind = definition.kind
+        if kind is None:
+            return definition
+
+        action = getattr(self.semantics, _definition_rules[kind], None)
+        if action:
+            definition = action(definition)
+        if definition is None:
+            self.semantics.sf.counters['definitions_dropped'] += 1
+        else:
+            self.semantics.sf.definitions[kind] += 1
+        return definition
 
+    def new_semantics(self):
         if self.s['--dgraph']:
-            self.semantics = DgraphSemantics()
+            return DgraphSemantics()
         else:
-            self.semantics = GqlgenSemantics()
+            return GqlgenSemantics()
 
-        #self.parser = compile(self._grammar)
-        self.parser = GRAPHQLParser()
+    def new_parser(self):
+        return new_parser(self.s.get('--parser') or 'tatsu', self.s.get('--low-memory'))
 
-        self.ast = self.parser.parse(self._target,
-                                     rule_name='start',
-                                     semantics=self.semantics,
-                                     parseinfo=False)
+    def new_cache(self):
+        return new_cache(self.s)
 
-        self.sf = self.semantics.sf
+    @classmethod
+    def iter_definitions(cls, ast):
+        ''' Yield the printed form of each top-level definition of a parsed AST.
+            Definitions are printed independently of each others (the concatenation
+            is the same as printing them together).
+        '''
+        for defn in ast:
+            out = ['\n']
+            printed = ''.join(cls._emit([defn], out)) + ''.join(out)
+            yield printed[1:]
+
+    # Number of output chunks kept in memory by the emitter. The spacing rules
+    # only look back at the last three chunks, the rest can be flushed.
+    _tail_size = 8
+
+    def stringify(self, ast=None):
+        return ''.join(self.iter_sdl(ast))
+
+    def iter_sdl(self, ast=None):
+        ''' Yield the SDL output by chunks, walking the AST once.
+            The output is built in a bounded tail buffer (see _emit) so that
+            time and memory grow linearly with the size of the schema.
+            The schema (ast is None) is printed from its definitions (see to_ir).
+        '''
+        if ast is None:
+            yield '\n'
+            yield ''.join(x + '\n' for x in self.sf.iter_extra_directives())
+            for definition in self.definitions:
+                yield definition.sdl()
+            return
 
-    def stringify(self, ast=None, out=None, root=False,
-                  _prev=None, _next=None, ignore_nl=False):
+        out = ['\n']
+        yield from self._emit(ast, out)
+        yield ''.join(out)
 
-        nl = '\n'
+    @classmethod
+    def _emit(cls, ast, out, _prev=None, _next=None, ignore_nl=False):
+        ''' Push the chunks of ast in {out}, the tail of the output.
+            Flushed chunks are yielded.
+        '''
 
-        # Init
-        if ast is None:
-            root = True
-            ast = [
-                list(map(lambda x:x+'\n', self.sf.extra_directives)),
-                self.ast
-            ]
-            out = [nl]
+        nl = '\n'
 
         # filter empty things
-        out = [x for x in out if x != '']
+        # (empty chunks only live at the end of the tail until the next call)
+        out[:] = [x for x in out if x != '']
+        if len(out) > cls._tail_size:
+            n = len(out) - cls._tail_size
+            yield ''.join(out[:n])
+            del out[:n]
 
         for nth, o in enumerate(ast):
             if isinstance(o, dict): # AST like
                 keys = list(o)
-                update = False
-                if len(keys) != len(set(keys)):
-                    # @DEBUG: duplicate keys in AST (caused by AST updates!)
-                    raise ValueError('Related to tatsu.AST issue #164..')
-
-                if len(keys) > 1:
-                    update = True
+                update = len(keys) > 1
 
                 for ith, k in enumerate(keys):
                     pack = k.split('__')
@@ -750,7 +2220,7 @@ class SDL:
                             out.append(' ')
                     elif code == 'ba':
                         # Blank After (space)
-                        v += ' '
+                        v = v + ' '
                     elif code == 'bs':
                         # Blank Suround (space)
                         if isinstance(v, str):
@@ -768,17 +2238,17 @@ class SDL:
                         try:
                             comment = ''.join(o.comment)
                         except:
-                            # bug in non dgraph...@debug
+                            # bug in non dgraph...@debug
                             continue
 
                         if o.comment and comment.startswith('# Dgraph.Authorization'):
                             # keep comments
-                            out += '\n\n'
+                            out.extend(nl*2)
                         else: # ignore comments
                             continue
                     elif _type == 'args':
                         ignore_nl = True
-                    elif _type in ('name'):
+                    elif _type == 'name':
                         # Manage space between names
 
                         if out[-1] == '\n':
@@ -802,8 +2272,6 @@ class SDL:
                         elif _next and isinstance(_next, (tuple, list)) and _next[0] == 'implements':
                             v += ' '
 
-                        #print('dict-- ', k, v, _prev, _next)
-
                     elif _type.startswith('_'):
                         # Don't append newline for rulename that starts with '_'.
                         pass
@@ -815,11 +2283,10 @@ class SDL:
                         if not ignore_nl:
                             out.append(nl)
 
-                    out = self.stringify([v], # removing list breaks the space logics
-                                         out,
-                                         _prev=_prev, _next=_next,
-                                         ignore_nl=ignore_nl,
-                               )
+                    yield from cls._emit([v], # removing list breaks the space logics
+                                          out,
+                                          _prev=_prev, _next=_next,
+                                          ignore_nl=ignore_nl)
 
             elif isinstance(o, (list, tuple)):
                 # Assume Closure
@@ -830,10 +2297,10 @@ class SDL:
                     if mth > 0:
                         _prev = o[mth-1]
 
-                    out = self.stringify([oo], # removing list breaks the space logics
-                                         out,
-                                         _prev=_prev, _next=_next,
-                                         ignore_nl=ignore_nl)
+                    yield from cls._emit([oo], # removing list breaks the space logics
+                                          out,
+                                          _prev=_prev, _next=_next,
+                                          ignore_nl=ignore_nl)
             elif isinstance(o, str):
                 if o == '}':
                     o = '\n'+o
@@ -841,22 +2308,1284 @@ class SDL:
             else:
                 raise NotImplementedError('Unknown type: %s' % type(o))
 
-        if root:
-            out = ''.join(out)
 
-        return out
+class IncrementalSDL(SDL):
+    ''' Incremental version of SDL.
 
+        The input is splitted in top-level definitions (see scan_definitions) and each
+        definition is fingerprinted with the definitions it depends on (see dependencies).
+        Only the definitions whose fingerprint changed since the previous run (dirty definitions)
+        are printed again, others are taken from the printed form saved by the previous run.
+        Parsing is done chunk by chunk, for the dirty definitions and their dependencies only.
+    '''
 
-if __name__ == '__main__':
-    args = docopt(__doc__, version='0.0')
-    parser = SDL(args)
-    sdl = parser.stringify()
+    def __init__(self, settings, previous=None, parser=None):
+        ''' previous: state of the previous run (see self.state), loaded from the cache if not given.
+            parser: parser to reuse (see WatchSDL).
+        '''
+        self.s = settings
+        self.profile = Profile(settings.get('--profile'))
+        self.rule_profiler = None
+
+        with self.profile.phase('read'):
+            inputs = self.read_inputs()
+            self._target = ''.join(inputs)
+            self.input_sizes = [len(text) for text in inputs]
+            del inputs
+        self.semantics = self.new_semantics()
+        self.sf = self.semantics.sf
+
+        self.chunks = scan_definitions(self._target)
+        self.units = OrderedDict()
+        for c in self.chunks:
+            self.units.setdefault(c.name, []).append(c)
+
+        self.deps = self.dependencies()
+        self.fingerprints = {}
+        for name in self.units:
+            self.fingerprint(name)
+
+        # Load the previous run
+        cache = None
+        if previous is None:
+            cache = self.new_cache()
+        if cache:
+            key = '%s-%s-incremental' % (type(self.semantics).__name__, cache.code_hash())
+            previous = cache.get(key)
+        if not previous:
+            previous = {'fingerprints': {}, 'printed': {}, 'extra': {}}
+
+        self.dirty = [n for n in self.units if previous['fingerprints'].get(n) != self.fingerprints[n]]
+        needed = self.closure(self.dirty)
+
+        self.printed = {n: previous['printed'][n] for n in self.units if n not in self.dirty}
+        self.extra = {n: previous['extra'].get(n, []) for n in self.units if n not in self.dirty}
+
+        self.profile.info['dirty'] = len(self.dirty)
+
+        # Parse chunk by chunk and apply the semantics on the definitions of each chunk,
+        # the semantic state is shared. A chunk is parsed after the chunks it depends on
+        # (see SDL.apply_semantics).
+        # The duplicates dropped by the semantics are not parsed (see skip_duplicates).
+        dropped = set()
+        seen = set()
+        for i, c in enumerate(self.chunks):
+            if c.kind in self.semantics.dropped_duplicates:
+                if (c.kind, c.name) in seen:
+                    dropped.add(i)
+                seen.add((c.kind, c.name))
+
+        parser_name = self.s.get('--parser') or 'tatsu'
+        parser = parser or self.new_parser()
+        parsed = {}
+        with self.profile.phase('parse'):
+            for i in schedule(self.chunk_dependencies()):
+                c = self.chunks[i]
+                if c.name not in needed:
+                    continue
+                if i in dropped:
+                    self.sf.counters['definitions_dropped'] += 1
+                    if c.name in self.dirty:
+                        parsed[i] = []
+                    continue
+
+                n_extra = len(self.sf.extra_directives)
+                definitions = []
+                try:
+                    chunk = parse_deferred(self._target[c.start:c.end], parser_name, chunked=False, parser=parser)
+                except parse_errors():
+                    self.raise_parse_error(c, parser)
+                    raise
+                for definition in chunk:
+                    definition = self.apply_definition(self.apply_directives(definition))
+                    if definition is not None:
+                        definitions.append(definition)
+                if c.name in self.dirty:
+                    parsed[i] = definitions
+                    self.extra.setdefault(c.name, []).extend(self.sf.extra_directives[n_extra:])
+
+        # Print once everything is parsed, as duplicates update the first definition.
+        self.definitions = []
+        for i in sorted(parsed):
+            self.definitions.extend(parsed[i])
+            self.printed.setdefault(self.chunks[i].name, []).append(''.join(d.sdl() for d in parsed[i]))
+
+        self.state = {'fingerprints': self.fingerprints,
+                      'printed': self.printed,
+                      'extra': self.extra}
+        if cache:
+            cache.put(key, self.state)
+
+    def raise_parse_error(self, c, parser):
+        ''' Parse the chunk c again at its place in its input (the text before it blanked), to raise
+            its syntax error with its location in the input, naming it.
+        '''
+        start = 0
+        for infile, size in zip(self.s['FILE'], self.input_sizes):
+            if c.start < start + size:
+                break
+            start += size
+        text = re.sub(r'[^\n]', ' ', self._target[start:c.start]) + self._target[c.start:c.end]
+        parser.parse(text, rule_name='start', semantics=DeferredSemantics(), parseinfo=False, filename=infile)
+
+    def dependencies(self):
+        ''' Returns the definitions needed to compute each definition:
+            * the interfaces implemented by a type,
+            * the type of the Add*Input, *Patch, *Filter and *Ref inputs,
+            * the types with a hook directive for the Query and Mutation types.
+        '''
+
+        hooked = []
+        for name, chunks in self.units.items():
+            for c in chunks:
+                directives = [c.header[i+1] for i, x in enumerate(c.header[:-1]) if x == '@']
+                if c.kind in ('type', 'interface') and _hook_prefix in directives:
+                    hooked.append(name)
+                    break
+
+        deps = OrderedDict()
+        for name, chunks in self.units.items():
+            d = []
+            for c in chunks:
+                if c.kind == 'type' and 'implements' in c.header:
+                    for x in c.header[c.header.index('implements')+1:]:
+                        if x == '@':
+                            break
+                        elif x != '&':
+                            d.append(x)
+                elif c.kind == 'input':
+                    m = _derived_input.match(name)
+                    if m:
+                        d.append(m.group(1) or m.group(2))
+
+            if name in ('Query', 'Mutation'):
+                d.extend(hooked)
+
+            deps[name] = [x for x in OrderedDict.fromkeys(d) if x in self.units and x != name]
+
+        return deps
+
+    def chunk_dependencies(self):
+        ''' Returns the indices of the chunks each chunk depends on: the previous chunk
+            of the same definition, or the first chunk of the definitions it depends on.
+        '''
+        first = {}
+        last = {}
+        deps = []
+        for i, c in enumerate(self.chunks):
+            if c.name in last:
+                deps.append([last[c.name]])
+            else:
+                first[c.name] = i
+                deps.append(None)
+            last[c.name] = i
+
+        return [[first[x] for x in self.deps[c.name]] if d is None else d for c, d in zip(self.chunks, deps)]
+
+    def fingerprint(self, name, _stack=()):
+        ''' Hash of the definition text and of the fingerprint of its dependencies. '''
+        if name in self.fingerprints:
+            return self.fingerprints[name]
+
+        import hashlib
+        h = hashlib.sha256()
+        for c in self.units[name]:
+            h.update(self._target[c.start:c.end].encode())
+            h.update(b'\0')
+
+        for d in self.deps[name]:
+            if d in _stack:
+                continue
+            h.update(d.encode())
+            h.update(self.fingerprint(d, _stack + (name,)).encode())
+
+        self.fingerprints[name] = h.hexdigest()
+        return self.fingerprints[name]
+
+    def closure(self, names):
+        ''' Returns the given definitions and their (transitive) dependencies. '''
+        needed = set()
+        stack = list(names)
+        while stack:
+            name = stack.pop()
+            if name in needed:
+                continue
+            needed.add(name)
+            stack.extend(self.deps[name])
+
+        return needed
+
+    def iter_sdl(self, ast=None):
+        if ast is not None:
+            yield from super().iter_sdl(ast)
+            return
+
+        extra_directives = []
+        for name in sorted(self.units, key=SemanticFilter.extra_key):
+            for d in self.extra[name]:
+                if d not in extra_directives:
+                    extra_directives.append(d)
 
-    if not args['--nv']:
-        print(sdl)
+        yield from super().iter_sdl([list(map(lambda x:x+'\n', extra_directives))])
 
-    if args['--debug']:
-        print(args)
-        print()
-        #asj = asjsons(ast)
-        pprint(parser.ast, indent=2)
+        occurence = defaultdict(int)
+        for c in self.chunks:
+            yield self.printed[c.name][occurence[c.name]]
+            occurence[c.name] += 1
+
+
+def read_output(path):
+    ''' Returns the content of an output file, or None if it does not exist. '''
+    try:
+        with open(path) as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def write_output(path, text):
+    ''' Write text to path atomically, and only if the content of path differs:
+        an unchanged output keeps its mtime, so that the tools depending on it
+        (gqlgen, elm-graphql, make) do not rebuild.
+        Returns True if path was written.
+    '''
+    if read_output(path) == text:
+        return False
+
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'w') as f:
+        f.write(text)
+    if os.path.exists(path):
+        os.chmod(tmp, os.stat(path).st_mode)
+    os.replace(tmp, path)
+    return True
+
+
+class MultiSDL:
+    ''' Generate several targets from a single parse of the inputs.
+
+        Each input is parsed once with DeferredSemantics, then each target
+        applies its semantics on its own copy of the parsed inputs (see SDL.apply_semantics).
+    '''
+
+    # target name -> --dgraph flag
+    targets = OrderedDict([('dgraph', True), ('gqlgen', False)])
+
+    def __init__(self, settings):
+        self.s = settings
+
+        self.profile = Profile(settings.get('--profile'))
+        self.outputs = OrderedDict((t, settings['--out-'+t]) for t in self.targets if settings.get('--out-'+t))
+        # Outputs not up to date (see --check).
+        self.stale = []
+        # Duplicate definitions removed before parsing, by target (see skip_duplicates).
+        self.skipped = Counter()
+        self.files = self.target_files()
+        self.parsed = self.parse_files()
+
+    def parse_files(self):
+        ''' Returns the definitions of each input file, parsed with DeferredSemantics.
+            The definitions of each input are taken from the parse cache, or stored in it.
+        '''
+        paths = list(OrderedDict.fromkeys(p for files in self.files.values() for p in files))
+        texts = OrderedDict()
+        with self.profile.phase('read'):
+            for path in paths:
+                with open(path) as f:
+                    texts[path] = f.read()
+
+        parser = self.s.get('--parser') or 'tatsu'
+        if parser in _skipping_parsers:
+            # The duplicates dropped by a target are removed from the inputs of this target only.
+            for target, files in self.files.items():
+                semantics = DgraphSemantics if self.targets[target] else GqlgenSemantics
+                inputs, skipped = skip_duplicates([texts[p] for p in files], semantics.dropped_duplicates)
+                for path, text, n in zip(files, inputs, skipped):
+                    if n and not any(path in f for t, f in self.files.items() if t != target):
+                        texts[path] = text
+                        self.skipped[target] += n
+
+        cache = new_cache(self.s)
+        parsed = OrderedDict()
+        if cache:
+            keys = {path: cache.key(text, DeferredSemantics()) for path, text in texts.items()}
+            for path in paths:
+                parsed[path] = cache.get(keys[path])
+            self.profile.info['cache'] = '%d/%d hits' % (sum(x is not None for x in parsed.values()), len(paths))
+
+        missing = [path for path in paths if parsed.get(path) is None]
+        if missing:
+            with self.profile.phase('parse'):
+                definitions = parse_deferred_inputs([texts[p] for p in missing], parser, self.s.get('--jobs'),
+                                                    self.s.get('--low-memory'))
+            for path, d in zip(missing, definitions):
+                parsed[path] = d
+                if cache:
+                    cache.put(keys[path], d)
+        return parsed
+
+    def target_files(self):
+        ''' Returns the input files of each target. '''
+        if not self.s['FILE']:
+            raise ValueError('You must provide a GraphQL FILE argument.')
+
+        files = OrderedDict((t, []) for t in self.outputs)
+        for arg in self.s['FILE']:
+            target, sep, path = arg.partition(':')
+            if sep and target in self.targets:
+                if target in files:
+                    files[target].append(path)
+            else:
+                for f in files.values():
+                    f.append(arg)
+        return files
+
+    def generate(self):
+        ''' Build the SDL of each target and write it to its output file if it changed
+            (with --check, the outputs that would change are listed in self.stale instead).
+        '''
+        sdls = OrderedDict()
+        for i, (target, out) in enumerate(self.outputs.items()):
+            parsed = [self.parsed[p] for p in self.files[target]]
+            if i < len(self.outputs) - 1:
+                # The semantics modify the definitions in place, work on a copy.
+                with self.profile.phase('copy.'+target):
+                    import pickle
+                    parsed = pickle.loads(pickle.dumps(parsed, protocol=pickle.HIGHEST_PROTOCOL))
+
+            settings = dict(self.s, **{'--dgraph': self.targets[target], 'FILE': self.files[target]})
+            with self.profile.phase('semantic.'+target):
+                sdls[target] = SDL(settings, parsed=parsed)
+                sdls[target].sf.counters['definitions_dropped'] += self.skipped[target]
+            with self.profile.phase('stringify.'+target):
+                sdl = sdls[target].stringify()
+            if self.s.get('--check'):
+                if read_output(out) != sdl + '\n':
+                    self.stale.append(out)
+            else:
+                write_output(out, sdl + '\n')
+
+        return sdls
+
+    def report(self, sdls):
+        ''' Report the profile of the run with the stats of each target (see --profile). '''
+        self.profile.report({'targets': OrderedDict((t, sdl.sf.stats()) for t, sdl in sdls.items())})
+
+
+class SchemaDiff:
+    ''' Compare two generated schemas definition by definition (see --diff-against).
+
+        The definitions are matched by name, and the fields of the types, interfaces
+        and inputs by name. The change set is a list of changes:
+            {"op": "add" | "remove" | "change", "kind": KIND, "name": NAME, ["type": TYPE,] ["old": TEXT,] ["new": TEXT]}
+        where KIND is a definition keyword (type, input, enum...), "field", or one of the
+        tracked directives (search, hasInverse) for the changes of their arguments on a field;
+        "type" is the definition of the field. "reindex" lists the existing predicates (Type.field)
+        whose index or type changes, which Dgraph has to reindex.
+    '''
+
+    # Directives tracked on the fields.
+    directives = ('search', 'hasInverse')
+
+    _definition_re = re.compile(r'(?:"(?:""[\s\S]*?""|[^"]*)")?\s*(extend\s+)?(\w+)(?:\s+(@?\w+))?')
+
+    def __init__(self, parser='tatsu'):
+        self.parser_name = parser
+
+    @staticmethod
+    def text(sdl):
+        return ' '.join(sdl.split())
+
+    def definitions(self, text):
+        ''' Returns the definitions of a schema by (kind, name), the first one of duplicates. '''
+        definitions = OrderedDict()
+        for d in self.iter_definitions(text):
+            definitions.setdefault((d['kind'], d['name']), d)
+        return definitions
+
+    def iter_definitions(self, text):
+        ''' Yields the definitions of a schema: {"text", "kind", "name"}, with the
+            "header" (implements and directives) and the "fields" of the definitions having fields.
+        '''
+        for definition in parse_deferred(text, self.parser_name):
+            if definition.kind is None:
+                continue
+            d = {'text': self.text(definition.sdl())}
+            extend, kind, name = self._definition_re.match(d['text']).groups()
+            d['kind'] = 'extend ' + kind if extend else kind
+            d['name'] = name or kind
+
+            if isinstance(definition, Type) and definition.fields:
+                header = []
+                if definition.interfaces:
+                    header.append('implements ' + ' '.join(definition.interfaces))
+                if definition.directives:
+                    header.append(self.text(''.join(x.sdl() for x in definition.directives)))
+                d['header'] = ' '.join(header)
+                d['fields'] = OrderedDict()
+                for field in definition.fields:
+                    if not isinstance(field, (Field, Argument)):
+                        continue
+                    d['fields'][field.name] = {
+                        'text': self.text(field.sdl()),
+                        'type': field.type,
+                        'directives': {x.name: self.text(x.sdl()) for x in field.directives},
+                    }
+
+            yield d
+
+    def diff(self, old_text, new_text):
+        ''' Returns the change set from the old_text schema to the new_text schema. '''
+        old, new = self.definitions(old_text), self.definitions(new_text)
+        changes = []
+        reindex = []
+
+        for key in list(new) + [k for k in old if k not in new]:
+            o, n = old.get(key), new.get(key)
+            if o and n and o['text'] == n['text']:
+                continue
+
+            kind, name = key
+            if not o or not n or 'fields' not in o or 'fields' not in n:
+                op = 'change' if o and n else 'add' if n else 'remove'
+                changes.append(self.change(op, kind, name, o and o['text'], n and n['text']))
+                self.diff_fields(changes, reindex, name, (o or {}).get('fields', {}), (n or {}).get('fields', {}), existing=False)
+                continue
+
+            if o['header'] != n['header']:
+                changes.append(self.change('change', kind, name, o['header'], n['header']))
+            self.diff_fields(changes, reindex, name, o['fields'], n['fields'])
+
+        return OrderedDict([('noop', not changes), ('changes', changes), ('reindex', reindex)])
+
+    def diff_fields(self, changes, reindex, type_name, old, new, existing=True):
+        ''' Append the changes of the fields of type_name to changes, and the predicates
+            to reindex (only for an existing type) to reindex.
+        '''
+        for name in list(new) + [k for k in old if k not in new]:
+            o, n = old.get(name), new.get(name)
+            if o and n and o['text'] == n['text']:
+                continue
+
+            op = 'change' if o and n else 'add' if n else 'remove'
+            changes.append(self.change(op, 'field', name, o and o['text'], n and n['text'], type_name))
+
+            o_directives = o['directives'] if o else {}
+            n_directives = n['directives'] if n else {}
+            for directive in self.directives:
+                od, nd = o_directives.get(directive), n_directives.get(directive)
+                if od == nd:
+                    continue
+                dop = 'change' if od and nd else 'add' if nd else 'remove'
+                changes.append(self.change(dop, directive, name, od, nd, type_name))
+                if existing and o and n and directive == 'search':
+                    reindex.append('%s.%s' % (type_name, name))
+
+            if existing and o and n and o['type'] != n['type']:
+                reindex.append('%s.%s' % (type_name, name))
+
+        reindex[:] = list(OrderedDict.fromkeys(reindex))
+
+    @staticmethod
+    def change(op, kind, name, old, new, type_name=None):
+        c = OrderedDict([('op', op), ('kind', kind), ('name', name)])
+        if type_name:
+            c['type'] = type_name
+        if old is not None:
+            c['old'] = old
+        if new is not None:
+            c['new'] = new
+        return c
+
+
+class SchemaGraph:
+    ''' Dependency graph of a schema (see --graph and --affected).
+
+        The graph is built from the inputs rather than from the generated schema, which has
+        no interfaces for gqlgen; the edges of every occurrence of a duplicate definition are kept.
+        The nodes are the definitions, and the operations: the fields of Query and Mutation,
+        named Query.FIELD and Mutation.FIELD. An edge goes from a node to a node depending on it:
+        * implements: from an interface to the types implementing it,
+        * input: from a type to its Add*Input, *Patch, *Filter and *Ref inputs,
+        * operation: from a type to its get*, query*, add*, update* and delete* operations,
+        * field: from a definition to the definitions and operations having a field
+          (or an argument, or a union member) of this type.
+    '''
+
+    operations = ('Query', 'Mutation')
+
+    _operation_re = re.compile(r'(?:get|query|add|update|delete)(\w+)$')
+    _type_re = re.compile(r':\s*\[*\s*(\w+)')
+
+    def __init__(self, text, parser='tatsu'):
+        # name -> kind (the kind of an operation is the name of its type)
+        self.nodes = OrderedDict()
+        # name -> {dependent: reason}
+        self.edges = defaultdict(OrderedDict)
+
+        definitions = list(SchemaDiff(parser).iter_definitions(text))
+        for d in definitions:
+            if d['kind'] in ('directive', 'schema'):
+                continue
+            if d['name'] in self.operations:
+                for field in d.get('fields', ()):
+                    self.nodes['%s.%s' % (d['name'], field)] = d['name']
+            else:
+                self.nodes.setdefault(d['name'], d['kind'].split()[-1])
+
+        for d in definitions:
+            if d['kind'] in ('directive', 'schema'):
+                continue
+            self.add_edges(d)
+
+    def add_edges(self, d):
+        name = d['name']
+        if d['kind'].endswith('union'):
+            for member in re.findall(r'\w+', d['text'].partition('=')[2]):
+                self.add_edge(member, name, 'field')
+
+        if 'fields' not in d:
+            return
+
+        header = d['header'].partition('@')[0].split()
+        if header[:1] == ['implements']:
+            for itf in header[1:]:
+                self.add_edge(itf, name, 'implements')
+
+        if d['kind'].endswith('input'):
+            m = _derived_input.match(name)
+            if m:
+                self.add_edge(m.group(1) or m.group(2), name, 'input')
+
+        for field_name, field in d['fields'].items():
+            dependent = name
+            if name in self.operations:
+                dependent = '%s.%s' % (name, field_name)
+                m = self._operation_re.match(field_name)
+                if m:
+                    self.add_edge(m.group(1), dependent, 'operation')
+
+            # Argument and field types, without the directives.
+            for type_name in self._type_re.findall(field['text'].partition(' @')[0]):
+                self.add_edge(type_name, dependent, 'field')
+
+    def add_edge(self, name, dependent, reason):
+        if name in self.nodes and dependent in self.nodes and name != dependent:
+            self.edges[name].setdefault(dependent, reason)
+
+    def export(self):
+        ''' Returns the graph as {"nodes": {NAME: KIND}, "edges": [[NAME, DEPENDENT, REASON]]}. '''
+        edges = [[name, dependent, reason] for name in self.nodes for dependent, reason in self.edges[name].items()]
+        return OrderedDict([('nodes', self.nodes), ('edges', edges)])
+
+    def affected(self, changed):
+        ''' Returns the definitions and operations affected by the changed definitions, in the
+            order of the schema: the changed definitions, the nodes depending on them, transitively,
+            through the implements, input and operation edges, and the nodes having a field of
+            one of these types (the field edges are not followed further: the schema is cyclic).
+        '''
+        unknown = [name for name in changed if name not in self.nodes]
+        if unknown:
+            raise ValueError('Unknown definitions: %s' % ', '.join(unknown))
+
+        seen = set(changed)
+        stack = list(changed)
+        while stack:
+            for dependent, reason in self.edges[stack.pop()].items():
+                if reason != 'field' and dependent not in seen:
+                    seen.add(dependent)
+                    stack.append(dependent)
+        seen.update([dependent for name in seen for dependent in self.edges[name]])
+
+        nodes = [n for n in self.nodes if n in seen]
+        return OrderedDict([
+            ('changed', list(changed)),
+            ('definitions', [n for n in nodes if self.nodes[n] not in self.operations]),
+            ('operations', [n for n in nodes if self.nodes[n] in self.operations]),
+        ])
+
+
+class DgraphSchema:
+    ''' The GraphQL schema Dgraph generates from a Dgraph input schema (see --expand-dgraph),
+        computed locally instead of fetched from a running Dgraph (`make dgraph`).
+
+        The types and interfaces are redefined with the arguments of their fields and their
+        aggregate fields, and get their inputs (Add*Input, *Filter, *HasFilter, *Order, *Patch, *Ref,
+        Update*Input), payloads (Add*Payload, Update*Payload, Delete*Payload, *AggregateResult)
+        and operations (get*, query*, aggregate*, add*, update*, delete*). The inputs depend on
+        the directives of the fields:
+        * @search(by: [INDEX...]): the field is in the *Filter input, with the filter of its indexes,
+        * @id: the field is an argument of get*, it is not in the *Patch input, and add* has an upsert argument,
+        * @hasInverse(field: NAME): the inverse field must exist on the field type (checked only),
+        * @withSubscription (on a type): its get*, query* and aggregate* are also subscriptions.
+        The directives changing what Dgraph generates in other ways (see unsupported) are rejected.
+        The definitions Dgraph adds to every schema (directives, scalars, builtin filters) are
+        read from gram/dgraph.graphql. The definitions are printed sorted by name (case insensitive),
+        after the directives, as Dgraph does.
+    '''
+
+    builtins = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gram', 'dgraph.graphql')
+
+    scalars = ('ID', 'String', 'Int', 'Int64', 'Float', 'Boolean', 'DateTime', 'Point', 'Polygon', 'MultiPolygon')
+    # Scalars with a *Min and *Max aggregate, and the type of their *Sum and *Avg aggregates.
+    aggregates = OrderedDict([('String', None), ('DateTime', None), ('Int', ('Int', 'Float')),
+                              ('Int64', ('Int64', 'Float')), ('Float', ('Float', 'Float'))])
+    # Filter of the scalars, by index (None is the default index).
+    filters = {
+        'String': {None: 'StringTermFilter', 'hash': 'StringHashFilter', 'exact': 'StringExactFilter',
+                   'term': 'StringTermFilter', 'fulltext': 'StringFullTextFilter',
+                   'regexp': 'StringRegExpFilter', 'trigram': 'StringRegExpFilter'},
+        'Int': {None: 'IntFilter'},
+        'Int64': {None: 'Int64Filter'},
+        'Float': {None: 'FloatFilter'},
+        'Boolean': {None: 'Boolean'},
+        'DateTime': {None: 'DateTimeFilter'},
+        'Point': {None: 'PointGeoFilter'},
+        'Polygon': {None: 'PolygonGeoFilter'},
+        'MultiPolygon': {None: 'PolygonGeoFilter'},
+    }
+    # Fields of the enum filters, by index.
+    enum_filters = OrderedDict([('hash', ['eq: {0}', 'in: [{0}]']),
+                                ('exact', ['eq: {0}', 'in: [{0}]', 'le: {0}', 'lt: {0}', 'ge: {0}', 'gt: {0}']),
+                                ('regexp', ['regexp: String'])])
+
+    # Directives whose effect on the generated schema is not reproduced.
+    unsupported = ('lambda', 'custom', 'remote', 'generate', 'secret', 'cascade', 'dgraph')
+
+    Field = namedtuple('DgraphField', 'name type base list directives')
+
+    def __init__(self, text, parser='tatsu'):
+        self.objects = OrderedDict()  # name -> {"kind", "implements", "fields", "directives"}
+        self.enums = OrderedDict()    # name -> values
+        self.unions = OrderedDict()   # name -> member types
+        self.directives = []          # the text of the builtin directive definitions
+        self.definitions = {}         # name -> text
+
+        with open(self.builtins) as f:
+            for block in f.read().strip().split('\n\n'):
+                if block.startswith('directive'):
+                    self.directives.append(block)
+                else:
+                    self.definitions[re.search(r'^\w+ (\w+)', block, re.M).group(1)] = block
+
+        for d in SchemaDiff(parser).iter_definitions(text):
+            if d['kind'] == 'enum':
+                self.enums[d['name']] = re.findall(r'\w+', d['text'].partition('{')[2])
+            elif d['kind'] == 'union':
+                self.unions[d['name']] = re.findall(r'\w+', d['text'].partition('=')[2])
+            elif d['kind'] in ('type', 'interface') and 'fields' in d:
+                header, _, directives = d['header'].partition('@')
+                self.objects[d['name']] = {
+                    'kind': d['kind'],
+                    'implements': re.findall(r'\w+', header)[1:],
+                    'directives': re.findall(r'@(\w+)', '@' + directives) if directives else [],
+                    'fields': [self.Field(name, f['type'], f['type'].strip('[]! '), f['type'].startswith('['),
+                                          f['directives']) for name, f in d['fields'].items()],
+                }
+                self.check_directives(d['name'], self.objects[d['name']])
+            elif d['kind'] not in ('directive', 'schema'):
+                raise ValueError('Unsupported definition in a Dgraph schema: %s %s' % (d['kind'], d['name']))
+
+        self.generate()
+
+    def check_directives(self, name, obj):
+        ''' Raise a ValueError on the unsupported directives of an object and of its fields. '''
+        for directive in obj['directives']:
+            if directive in self.unsupported:
+                raise ValueError('Unsupported directive in a Dgraph schema: @%s on %s' % (directive, name))
+        for f in obj['fields']:
+            for directive in f.directives:
+                if directive in self.unsupported:
+                    raise ValueError('Unsupported directive in a Dgraph schema: @%s on %s.%s' % (directive, name, f.name))
+
+    @staticmethod
+    def lower_first(name):
+        return name[:1].lower() + name[1:]
+
+    @staticmethod
+    def block(keyword, name, lines):
+        return '%s %s {\n%s\n}' % (keyword, name, '\n'.join('  ' + line for line in lines))
+
+    def fields(self, name):
+        ''' Returns the fields of an object, the ones of its interfaces first. '''
+        obj = self.objects[name]
+        fields = OrderedDict()
+        for itf in obj['implements']:
+            for f in self.fields(itf):
+                fields.setdefault(f.name, f)
+        for f in obj['fields']:
+            fields.setdefault(f.name, f)
+        return list(fields.values())
+
+    def has_id(self, name):
+        return any(f.base == 'ID' for f in self.fields(name))
+
+    def id_fields(self, name):
+        return [f for f in self.fields(name) if 'id' in f.directives]
+
+    def orderable(self, name):
+        return [f for f in self.fields(name) if not f.list and f.base in self.aggregates]
+
+    def input_type(self, f, suffix='Ref', nullable=False):
+        ''' Returns the type of a field in an input, the objects and unions replaced by their suffix input. '''
+        type_ = f.type
+        if f.base in self.objects or f.base in self.unions:
+            type_ = type_.replace(f.base, f.base + suffix)
+        if nullable:
+            type_ = type_.rstrip('!')
+        return type_
+
+    def list_args(self, name):
+        order = ', order: %sOrder' % name if self.orderable(name) else ''
+        return '(filter: %sFilter%s, first: Int, offset: Int)' % (name, order)
+
+    def field_line(self, f):
+        if f.base in self.objects and f.list:
+            return '%s%s: %s' % (f.name, self.list_args(f.base), f.type)
+        if f.base in self.unions and f.list:
+            return '%s(filter: %sFilter, first: Int, offset: Int): %s' % (f.name, f.base, f.type)
+        if f.base in self.objects or f.base in self.unions:
+            return '%s(filter: %sFilter): %s' % (f.name, f.base, f.type)
+        return '%s: %s' % (f.name, f.type)
+
+    def filter_type(self, f):
+        ''' Returns the filter of a field in the *Filter input (generating it if needed), or None. '''
+        search = f.directives.get('search')
+        if f.base == 'ID' or (search is None and 'id' not in f.directives):
+            return None
+        indexes = re.findall(r'\w+', search)[2:] if search else []
+
+        if f.base in self.enums:
+            indexes = list(OrderedDict.fromkeys(indexes or ['hash']))
+            name = '%s_%s' % (f.base, '_'.join(indexes))
+            lines = [line.format(f.base) for index in indexes for line in self.enum_filters[index]]
+            self.definitions[name] = self.block('input', name, OrderedDict.fromkeys(lines))
+            return name
+
+        if f.base not in self.filters:
+            raise ValueError('Field %s of type %s can not be searched.' % (f.name, f.base))
+        if f.base == 'String':
+            if search is None:
+                indexes = ['hash']
+            elif 'id' in f.directives and indexes and not {'hash', 'exact'} & set(indexes):
+                indexes = ['hash'] + indexes
+        filters = list(OrderedDict.fromkeys(self.filters[f.base].get(i, self.filters[f.base][None])
+                                            for i in indexes or [None]))
+        name = '_'.join(filters)
+        if len(filters) > 1:
+            lines = [line for filter_ in filters for line in self.definitions[filter_].split('\n')[1:-1]]
+            self.definitions[name] = '\n'.join(['input %s {' % name] + list(OrderedDict.fromkeys(lines)) + ['}'])
+        return name
+
+    def check_inverse(self, name, f):
+        inverse = re.findall(r'\w+', f.directives['hasInverse'])[2:]
+        target = self.objects.get(f.base)
+        fields = {x.name: x for x in self.fields(f.base)} if target else {}
+        if not inverse or inverse[0] not in fields:
+            raise ValueError('@hasInverse of %s.%s: no field %s in %s.' % (name, f.name, inverse[:1], f.base))
+        if fields[inverse[0]].base not in [name] + self.objects[name]['implements']:
+            raise ValueError('@hasInverse of %s.%s: %s.%s is not of type %s.' % (name, f.name, f.base, inverse[0], name))
+
+    def generate(self):
+        queries, mutations, subscriptions = [], [], []
+
+        for name, obj in self.objects.items():
+            fields = self.fields(name)
+            interface = obj['kind'] == 'interface'
+            lower = self.lower_first(name)
+            for f in fields:
+                if 'hasInverse' in f.directives:
+                    self.check_inverse(name, f)
+
+            header = name + (' implements ' + ' & '.join(obj['implements']) if obj['implements'] else '')
+            lines = [self.field_line(f) for f in fields]
+            lines += ['%sAggregate(filter: %sFilter): %sAggregateResult' % (f.name, f.base, f.base)
+                      for f in fields if f.list and f.base in self.objects]
+            self.definitions[name] = self.block(obj['kind'], header, lines)
+
+            # Filter, has filter and order
+            lines = ['id: [ID!]'] if self.has_id(name) else []
+            filters = [(f.name, self.filter_type(f)) for f in fields]
+            lines += ['%s: %s' % (field, filter_) for field, filter_ in filters if filter_]
+            lines += ['has: [%sHasFilter]' % name, 'and: [%sFilter]' % name, 'or: [%sFilter]' % name, 'not: %sFilter' % name]
+            self.definitions[name + 'Filter'] = self.block('input', name + 'Filter', lines)
+            self.definitions[name + 'HasFilter'] = self.block('enum', name + 'HasFilter', [f.name for f in fields if f.base != 'ID'])
+            if self.orderable(name):
+                self.definitions[name + 'Order'] = self.block('input', name + 'Order', [
+                    'asc: %sOrderable' % name, 'desc: %sOrderable' % name, 'then: %sOrder' % name])
+                self.definitions[name + 'Orderable'] = self.block('enum', name + 'Orderable', [f.name for f in self.orderable(name)])
+
+            # Aggregate result
+            lines = ['count: Int']
+            for f in self.orderable(name):
+                lines += ['%sMin: %s' % (f.name, f.base), '%sMax: %s' % (f.name, f.base)]
+                if self.aggregates[f.base]:
+                    lines += ['%sSum: %s' % (f.name, self.aggregates[f.base][0]), '%sAvg: %s' % (f.name, self.aggregates[f.base][1])]
+            self.definitions[name + 'AggregateResult'] = self.block('type', name + 'AggregateResult', lines)
+
+            # Mutation inputs and payloads
+            own = [f for f in fields if f.base != 'ID']
+            self.definitions[name + 'Patch'] = self.block('input', name + 'Patch', [
+                '%s: %s' % (f.name, self.input_type(f, nullable=True)) for f in own if 'id' not in f.directives])
+            if interface and self.has_id(name):
+                lines = ['id: ID!']
+            else:
+                lines = ['id: ID'] if self.has_id(name) else []
+                lines += ['%s: %s' % (f.name, self.input_type(f, nullable=True)) for f in own]
+            self.definitions[name + 'Ref'] = self.block('input', name + 'Ref', lines)
+            self.definitions['Update%sInput' % name] = self.block('input', 'Update%sInput' % name, [
+                'filter: %sFilter!' % name, 'set: %sPatch' % name, 'remove: %sPatch' % name])
+
+            payload = '%s%s: [%s]' % (lower, self.list_args(name), name)
+            for kind in ('Update', 'Delete') if interface else ('Add', 'Update', 'Delete'):
+                lines = [payload] + (['msg: String'] if kind == 'Delete' else []) + ['numUids: Int']
+                self.definitions['%s%sPayload' % (kind, name)] = self.block('type', '%s%sPayload' % (kind, name), lines)
+            if not interface:
+                self.definitions['Add%sInput' % name] = self.block('input', 'Add%sInput' % name, [
+                    '%s: %s' % (f.name, self.input_type(f)) for f in own])
+
+            # Operations
+            operations = []
+            ids = self.id_fields(name)
+            if ids:
+                args = (['id: ID'] if self.has_id(name) else []) + ['%s: %s' % (f.name, f.base) for f in ids]
+                operations.append('get%s(%s): %s' % (name, ', '.join(args), name))
+            elif self.has_id(name):
+                operations.append('get%s(id: ID!): %s' % (name, name))
+            operations.append('query%s%s: [%s]' % (name, self.list_args(name), name))
+            operations.append('aggregate%s(filter: %sFilter): %sAggregateResult' % (name, name, name))
+            queries += operations
+            if 'withSubscription' in obj['directives']:
+                subscriptions += operations
+
+            if not interface:
+                upsert = ', upsert: Boolean' if ids else ''
+                mutations.append('add%s(input: [Add%sInput!]!%s): Add%sPayload' % (name, name, upsert, name))
+            mutations.append('update%s(input: Update%sInput!): Update%sPayload' % (name, name, name))
+            mutations.append('delete%s(filter: %sFilter!): Delete%sPayload' % (name, name, name))
+
+        for name, values in self.enums.items():
+            self.definitions[name] = self.block('enum', name, values)
+
+        for name, members in self.unions.items():
+            self.definitions[name] = 'union %s = %s' % (name, ' | '.join(members))
+            self.definitions[name + 'Filter'] = self.block('input', name + 'Filter', ['memberTypes: [%sType!]' % name] + [
+                '%sFilter: %sFilter' % (self.lower_first(m), m) for m in members])
+            self.definitions[name + 'Ref'] = self.block('input', name + 'Ref', [
+                '%sRef: %sRef' % (self.lower_first(m), m) for m in members])
+            self.definitions[name + 'Type'] = self.block('enum', name + 'Type', members)
+
+        for name, operations in (('Query', queries), ('Mutation', mutations), ('Subscription', subscriptions)):
+            if operations:
+                self.definitions[name] = self.block('type', name, operations)
+
+    def stringify(self):
+        definitions = self.directives + [self.definitions[k] for k in sorted(self.definitions, key=str.lower)]
+        return ''.join(d + '\n\n' for d in definitions)
+
+
+class DirWatcher:
+    ''' Wait for changes of the files of some directories (not recursive),
+        with inotify on Linux, by polling their modification time elsewhere.
+    '''
+
+    # IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+    _inotify_mask = 0x8 | 0x40 | 0x80 | 0x200
+
+    def __init__(self, dirs, interval=0.5, debounce=0.02):
+        self.dirs = [os.path.abspath(d) for d in dirs]
+        self.interval = interval
+        self.debounce = debounce
+
+        try:
+            self._fd, self._wds = self._inotify_init()
+        except (OSError, AttributeError):
+            self._fd = None
+            self._mtimes = self._scan()
+
+    def _inotify_init(self):
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        fd = libc.inotify_init1(os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        wds = {}
+        for d in self.dirs:
+            wd = libc.inotify_add_watch(fd, d.encode(), self._inotify_mask)
+            if wd < 0:
+                os.close(fd)
+                raise OSError(ctypes.get_errno(), 'inotify_add_watch failed: %s' % d)
+            wds[wd] = d
+
+        return fd, wds
+
+    def _read_events(self, timeout=None):
+        ''' Returns the paths changed within timeout seconds. '''
+        import select
+        import struct
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return set()
+
+        data = os.read(self._fd, 65536)
+        paths = set()
+        i = 0
+        while i < len(data):
+            # struct inotify_event
+            wd, mask, cookie, length = struct.unpack_from('iIII', data, i)
+            name = data[i+16:i+16+length].rstrip(b'\0').decode()
+            i += 16 + length
+            if wd in self._wds and name:
+                paths.add(os.path.join(self._wds[wd], name))
+
+        return paths
+
+    def _scan(self):
+        mtimes = {}
+        for d in self.dirs:
+            if not os.path.isdir(d):
+                continue
+            for entry in os.scandir(d):
+                if entry.is_file():
+                    st = entry.stat()
+                    mtimes[entry.path] = (st.st_mtime_ns, st.st_size)
+        return mtimes
+
+    def wait(self):
+        ''' Block until files change and returns their paths. '''
+        if self._fd is not None:
+            paths = set()
+            while not paths:
+                paths = self._read_events()
+            # Gather the events of a same save (editors may write several files).
+            more = self._read_events(self.debounce)
+            while more:
+                paths |= more
+                more = self._read_events(self.debounce)
+            return paths
+
+        while True:
+            time.sleep(self.interval)
+            mtimes = self._scan()
+            paths = {p for p in set(mtimes) | set(self._mtimes) if mtimes.get(p) != self._mtimes.get(p)}
+            self._mtimes = mtimes
+            if paths:
+                return paths
+
+
+class WatchSDL(MultiSDL):
+    ''' Regenerate the targets each time their inputs change (see --watch).
+
+        The targets are regenerated incrementally (see IncrementalSDL), from the state
+        of the previous run kept in memory and with a parser built once.
+        A change of the parser (gram/) or of this file restarts the process.
+    '''
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.parser = new_parser(settings.get('--parser') or 'tatsu', settings.get('--low-memory'))
+        self.states = {}
+        self.inputs = set(os.path.abspath(p) for files in self.files.values() for p in files)
+        self.code_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gram')
+
+    def parse_files(self):
+        # The inputs are parsed by generate.
+        return {}
+
+    def generate(self):
+        sdls = OrderedDict()
+        for target, out in self.outputs.items():
+            settings = dict(self.s, **{'--dgraph': self.targets[target], 'FILE': self.files[target]})
+            sdls[target] = IncrementalSDL(settings, previous=self.states.get(target), parser=self.parser)
+            self.states[target] = sdls[target].state
+            write_output(out, sdls[target].stringify() + '\n')
+
+        return sdls
+
+    def regenerate(self):
+        t0 = time.perf_counter()
+        try:
+            self.generate()
+        except Exception as e:
+            # Keep watching, the input may be saved in the middle of an edit.
+            logger.error('%s: %s' % (type(e).__name__, e))
+            return
+
+        logger.info('Regenerated %s in %d ms' % (', '.join(self.outputs.values()), (time.perf_counter() - t0) * 1000))
+
+    def is_code(self, path):
+        return path == os.path.abspath(__file__) or \
+            os.path.dirname(path) == self.code_dir and path.endswith(('.py', '.ebnf'))
+
+    def watch(self):
+        dirs = set(os.path.dirname(p) for p in self.inputs)
+        dirs.update([self.code_dir, os.path.dirname(self.code_dir)])
+        watcher = DirWatcher(sorted(dirs))
+
+        self.regenerate()
+        while True:
+            paths = watcher.wait()
+            if any(map(self.is_code, paths)):
+                logger.info('Parser changed, restarting.')
+                os.execv(sys.executable, [sys.executable] + sys.argv)
+            elif paths & self.inputs:
+                self.regenerate()
+
+
+class Transformer:
+    ''' Transform SDL texts without going through the command line:
+
+        >>> t = Transformer(target='dgraph', parser='fast')
+        >>> out = t.transform(open('graphql/fractal6.graphql'))
+
+        The parser is built once and reused by every call, while the semantics
+        (and the SemanticFilter state) are new for each call. The calls are serialized
+        on the parser, use one Transformer per thread to transform concurrently.
+    '''
+
+    def __init__(self, target='gqlgen', parser='tatsu', low_memory=False):
+        self.target = self.check_target(target)
+        self.parser_name = parser
+        self.parser = new_parser(parser, low_memory)
+        import threading
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def check_target(target):
+        if target not in MultiSDL.targets:
+            raise ValueError('Unknown target: %s (expected %s)' % (target, ' or '.join(MultiSDL.targets)))
+        return target
+
+    @staticmethod
+    def read(source):
+        ''' Returns the text of source: a string, a file object or a list of them (concatenated). '''
+        if isinstance(source, str):
+            return source
+        elif hasattr(source, 'read'):
+            return source.read()
+        else:
+            return ''.join(map(Transformer.read, source))
+
+    def parse(self, text):
+        # Between the parses, the tatsu parser keeps the last definition parsed (see parse_deferred).
+        with self._lock:
+            return parse_deferred(text, self.parser_name, parser=self.parser)
+
+    def transform(self, source, target=None):
+        ''' Returns the SDL of source transformed for target (default: the target of the
+            transformer), as written by the command line (with a final newline).
+        '''
+        target = self.check_target(target or self.target)
+        definitions = self.parse(self.read(source))
+        sdl = SDL({'--dgraph': MultiSDL.targets[target]}, parsed=[definitions])
+        return sdl.stringify() + '\n'
+
+
+def transform(source, target='gqlgen', **options):
+    ''' Returns the SDL of source (a string, a file object or a list of them) transformed
+        for target (dgraph or gqlgen). options are the arguments of Transformer.
+        Use a Transformer to transform several sources with the same parser.
+    '''
+    return Transformer(target, **options).transform(source)
+
+
+class SDLServer:
+    ''' Transform SDL texts sent over HTTP (see --serve).
+
+        The transformers (and their parser) are built once and shared by the requests
+        through a pool, each request has its own semantics (and SemanticFilter).
+    '''
+
+    def __init__(self, settings):
+        import queue
+        self.s = settings
+        self.transformers = queue.Queue()
+        for _ in range(int(settings.get('--jobs') or os.cpu_count() or 1)):
+            self.transformers.put(Transformer(parser=settings.get('--parser') or 'tatsu',
+                                              low_memory=settings.get('--low-memory')))
+
+    def transform(self, text, target):
+        ''' Returns the SDL text transformed for target (dgraph or gqlgen). '''
+        transformer = self.transformers.get()
+        try:
+            return transformer.transform(text, target)
+        finally:
+            self.transformers.put(transformer)
+
+    @staticmethod
+    def is_loopback(host):
+        ''' The server is not meant to be reachable from other hosts. '''
+        if host == 'localhost':
+            return True
+        import ipaddress
+        try:
+            return ipaddress.ip_address(host).is_loopback
+        except ValueError:
+            return False
+
+    def new_server(self, address):
+        import socket
+        import socketserver
+        import stat
+        from http.server import ThreadingHTTPServer
+
+        class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+
+        host, sep, port = address.rpartition(':')
+        if sep and port.isdigit() and '/' not in address:
+            host = host.strip('[]') or 'localhost'
+            if not self.is_loopback(host):
+                raise ValueError('Can not serve on %s: HOST must be a loopback address (localhost, 127.0.0.1, ::1).' % host)
+            if ':' in host:
+                class ThreadingHTTPServer6(ThreadingHTTPServer):
+                    address_family = socket.AF_INET6
+                server = ThreadingHTTPServer6((host, int(port)), sdl_request_handler())
+            else:
+                server = ThreadingHTTPServer((host, int(port)), sdl_request_handler())
+        else:
+            # Replace the socket left by a previous server, but nothing else.
+            if os.path.exists(address):
+                if not stat.S_ISSOCK(os.stat(address).st_mode):
+                    raise ValueError('Can not serve on %s: the file exists and is not a socket.' % address)
+                os.remove(address)
+            server = ThreadingUnixHTTPServer(address, sdl_request_handler())
+        server.sdl_server = self
+        return server
+
+    def serve(self, address):
+        with self.new_server(address) as server:
+            logger.info('Serving on %s' % address)
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                if not isinstance(server.server_address, tuple):
+                    os.remove(address)
+
+
+def sdl_request_handler():
+    ''' Returns the request handler class of SDLServer (http.server is imported on demand). '''
+    from http.server import BaseHTTPRequestHandler
+
+    class SDLRequestHandler(BaseHTTPRequestHandler):
+        ''' POST /{target}: returns the SDL text of the request body transformed for target. '''
+
+        server_version = 'gqlast'
+
+        def do_POST(self):
+            target = self.path.strip('/')
+            if target not in MultiSDL.targets:
+                return self.respond(404, 'Unknown target: %s (expected %s)\n' % (target, ' or '.join(MultiSDL.targets)))
+
+            try:
+                length = int(self.headers.get('Content-Length') or 0)
+                text = self.rfile.read(length).decode()
+                out = self.server.sdl_server.transform(text, target)
+            except Exception as e:
+                return self.respond(400, '%s: %s\n' % (type(e).__name__, e))
+
+            self.respond(200, out)
+
+        def respond(self, code, body):
+            body = body.encode()
+            self.send_response(code)
+            self.send_header('Content-Type', 'text/plain; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def address_string(self):
+            # Unix socket clients have no address.
+            return self.client_address[0] if self.client_address else 'unix'
+
+        def log_message(self, format, *args):
+            logger.debug('%s %s' % (self.address_string(), format % args))
+
+    return SDLRequestHandler
+
+
+if __name__ == '__main__':
+    import json
+    from docopt import docopt
+    args = docopt(__doc__, version='0.0')
+    if args['--serve']:
+        SDLServer(args).serve(args['--serve'])
+    elif args['--watch']:
+        if not (args['--out-dgraph'] or args['--out-gqlgen']):
+            raise ValueError('--watch needs --out-dgraph and/or --out-gqlgen.')
+        if args['--check'] or args['--dgraph']:
+            raise ValueError('--check and --dgraph can not be used with --watch.')
+        WatchSDL(args).watch()
+    elif args['--out-dgraph'] or args['--out-gqlgen']:
+        if (args['--dgraph'] or args['--incremental'] or args['--profile-rules'] or args['--diff-against']
+                or args['--graph'] or args['--affected'] or args['--expand-dgraph']):
+            raise ValueError('--dgraph, --incremental, --profile-rules, --diff-against, --graph, --affected and '
+                             '--expand-dgraph can not be used with --out-dgraph/--out-gqlgen.')
+        multi = MultiSDL(args)
+        sdls = multi.generate()
+        multi.report(sdls)
+
+        if args['--debug']:
+            print(args)
+            from pprint import pprint
+            for sdl in sdls.values():
+                print()
+                pprint(sdl.definitions, indent=2)
+
+        if multi.stale:
+            sys.exit('Outputs not up to date: %s' % ', '.join(multi.stale))
+    elif args['--graph'] or args['--affected']:
+        # The graph is built from the inputs, the schema is not generated.
+        if args['--check'] or args['--incremental'] or args['--diff-against'] or args['--expand-dgraph']:
+            raise ValueError('--check, --incremental, --diff-against and --expand-dgraph '
+                             'can not be used with --graph/--affected.')
+        if not args['FILE']:
+            raise ValueError('You must provide a GraphQL FILE argument.')
+        target = ''
+        for infile in args['FILE']:
+            with open(infile) as f:
+                target += f.read()
+        graph = SchemaGraph(target, args['--parser'] or 'tatsu')
+        if args['--graph']:
+            print(json.dumps(graph.export(), indent=2))
+        else:
+            try:
+                affected = graph.affected(args['--affected'].split(','))
+            except ValueError as e:
+                sys.exit(str(e))
+            print(json.dumps(affected, indent=2))
+    else:
+        if args['--check']:
+            raise ValueError('--check needs --out-dgraph and/or --out-gqlgen.')
+        if args['--expand-dgraph'] and not args['--dgraph']:
+            raise ValueError('--expand-dgraph needs --dgraph.')
+        if args['--incremental']:
+            if args['--profile-rules']:
+                raise ValueError('--profile-rules can not be used with --incremental.')
+            parser = IncrementalSDL(args)
+        else:
+            parser = SDL(args)
+        with parser.profile.phase('stringify'):
+            sdl = parser.stringify()
+        parser.profile.report(parser.sf.stats())
+        if parser.rule_profiler:
+            parser.rule_profiler.report(args['--profile-rules'])
+
+        if args['--diff-against']:
+            with open(args['--diff-against']) as f:
+                previous = f.read()
+            changes = SchemaDiff(args['--parser'] or 'tatsu').diff(previous, sdl)
+            print(json.dumps(changes, indent=2))
+        elif args['--expand-dgraph']:
+            sys.stdout.write(DgraphSchema(sdl, args['--parser'] or 'tatsu').stringify())
+        elif not args['--nv']:
+            print(sdl)
+
+        if args['--debug']:
+            print(args)
+            print()
+            from pprint import pprint
+            pprint(parser.definitions, indent=2)
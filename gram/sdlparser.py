@@ -0,0 +1,609 @@
+'''Hand-written parser for the GraphQL schemas (SDL).
+
+It is a fast alternative to the parser generated from graphql.ebnf (GRAPHQLParser):
+a regex tokenizer feeding a predictive recursive-descent parser. It builds the very same
+AST as the generated parser and calls the semantic actions on the same rules, in the same
+order, so the semantics classes of gqlast.py work unchanged with both parsers.
+
+Only the type system part of the grammar is supported (no queries, fragments, type extensions
+nor float values), which is what the schemas of this repository use.
+'''
+
+import re
+from tatsu.ast import AST
+from tatsu.contexts import closure
+
+
+class ParseError(Exception):
+    pass
+
+
+_token_re = re.compile(r'''
+      (?P<ws>\s+)
+    | (?P<comment>\#[^\r\n]*)
+    | (?P<block>"""(?:[^"]+)?(?:(?:"[^"]|""[^"])[^"]+)*""")
+    | (?P<string>"(?:[^"\\]|\\")*")
+    | (?P<name>[_A-Za-z][_0-9A-Za-z]*)
+    | (?P<int>-?(?:0|[1-9][0-9]*))
+    | (?P<punct>\.\.\.|[!$():=@\[\]{}|&,])
+''', re.X)
+
+_block_parts_re = re.compile(r'""[^"]|"[^"]|[^"]+')
+_characters_re = re.compile(r'\\"|[^"\\]')
+
+_type_system_locations = {
+    'SCHEMA', 'SCALAR', 'OBJECT', 'FIELD_DEFINITION', 'ARGUMENT_DEFINITION', 'INTERFACE',
+    'UNION', 'ENUM', 'ENUM_VALUE', 'INPUT_OBJECT', 'INPUT_FIELD_DEFINITION',
+}
+_executable_locations = {
+    'QUERY', 'MUTATION', 'SUBSCRIPTION', 'FIELD', 'FRAGMENT_DEFINITION', 'FRAGMENT_SPREAD',
+    'INLINE_FRAGMENT',
+}
+_operation_types = {'query', 'mutation', 'subscription'}
+
+# Choices of the type_system_definition rule, in the order of the grammar.
+_type_system_definitions = [
+    ('schema_definition', 'schema'),
+    ('directive_definition', 'directive'),
+    ('interface_definition', 'interface'),
+    ('enum_definition', 'enum'),
+    ('type_definition', 'type'),
+    ('extension_definition', 'extend'),
+    ('input_definition', 'input'),
+    ('union_definition', 'union'),
+    ('scalar_definition', 'scalar'),
+]
+
+_EOF = ('eof', None, None)
+
+
+def tokenize(text):
+    ''' Returns the list of (kind, value, position) tokens of text, whitespaces excluded. '''
+    tokens = []
+    pos = 0
+    match = _token_re.match
+    while pos < len(text):
+        m = match(text, pos)
+        if m is None:
+            raise ParseError('Unexpected character %r %s' % (text[pos], _location(text, pos)))
+        kind = m.lastgroup
+        if kind != 'ws':
+            tokens.append((kind, m.group(), pos))
+        pos = m.end()
+
+    return tokens
+
+
+def _location(text, pos):
+    line = text.count('\n', 0, pos) + 1
+    col = pos - text.rfind('\n', 0, pos)
+    return 'at line %d, column %d' % (line, col)
+
+
+class SDLParser:
+    ''' Drop-in replacement of GRAPHQLParser for the schema files.
+
+        Each rule is implemented by a `_{rule}_` method which builds the node as tatsu does:
+        * rules with named elements return an AST (with all their names defined),
+        * other rules return the tuple of their elements (or the element if there is only one),
+        * a closure is a `closure` list, where the elements made of several nodes are lists
+          (the first one) or closures (the next ones),
+        * optional elements that did not match are not part of the node.
+        The node is then passed to the semantic action of the rule (see _call).
+    '''
+
+    def __init__(self, **settings):
+        self.settings = settings
+
+    def parse(self, text, rule_name='start', semantics=None, parseinfo=False, filename=None, **kwargs):
+        ''' Returns the AST of text, the syntax errors name filename if given. '''
+        rule = getattr(self, '_%s_' % rule_name, None)
+        if rule is None:
+            raise NotImplementedError('Unsupported rule: %s' % rule_name)
+
+        self._text = text
+        self._tokens = tokenize(text)
+        self._pos = 0
+        self._semantics = semantics
+        self._actions = {}
+
+        try:
+            node = rule()
+            if self._pos < len(self._tokens):
+                self._error('end of text')
+            return node
+        except ParseError as e:
+            if filename:
+                raise ParseError('%s: %s' % (filename, e)) from None
+            raise
+        finally:
+            # Do not keep the text and the semantics alive between parses.
+            self._text = self._tokens = self._semantics = None
+            self._actions = {}
+
+    #
+    # Helpers
+    #
+
+    def _call(self, rule, node):
+        ''' Apply the semantic action of rule on node. '''
+        try:
+            action = self._actions[rule]
+        except KeyError:
+            action = getattr(self._semantics, rule, None)
+            if not callable(action):
+                action = getattr(self._semantics, '_default', None)
+            self._actions[rule] = action
+
+        if action is None:
+            return node
+        return action(node)
+
+    def _peek(self, offset=0):
+        try:
+            return self._tokens[self._pos + offset]
+        except IndexError:
+            return _EOF
+
+    def _is(self, value, offset=0):
+        tok = self._peek(offset)
+        return tok[1] == value and tok[0] in ('name', 'punct')
+
+    def _token(self, value):
+        if not self._is(value):
+            self._error(repr(value))
+        self._pos += 1
+        return value
+
+    def _error(self, expected):
+        kind, value, pos = self._peek()
+        if kind == 'eof':
+            raise ParseError('Expecting %s, got end of text' % expected)
+        raise ParseError('Expecting %s, got %r %s' % (expected, value, _location(self._text, pos)))
+
+    @staticmethod
+    def _node(cst):
+        return cst[0] if len(cst) == 1 else tuple(cst)
+
+    @staticmethod
+    def _element(i, nodes):
+        ''' Element of a closure whose block is made of several nodes. '''
+        return nodes if i == 0 else closure(nodes)
+
+    def _has_description(self):
+        ''' Predict an optional description (followed by a name). '''
+        return self._peek()[0] in ('string', 'block') and self._peek(1)[0] == 'name'
+
+    #
+    # Rules
+    #
+
+    def _start_(self):
+        definitions = [self._definition_()]
+        while self._pos < len(self._tokens):
+            definitions.append(self._definition_())
+        return self._call('start', closure(definitions))
+
+    def _definition_(self):
+        kind = self._peek()[0]
+        if kind in ('comment', 'block'):
+            node = self._COMMENTS_()
+        elif kind in ('name', 'string'):
+            node = self._type_system_definition_()
+        else:
+            self._error('a type system definition')
+        return self._call('definition', node)
+
+    def _COMMENTS_(self):
+        if self._peek()[0] == 'comment':
+            node = self._LINE_COMMENT_()
+        else:
+            node = self._DOC_()
+        return self._call('COMMENTS', node)
+
+    def _LINE_COMMENT_(self):
+        kind, value, _ = self._peek()
+        if kind != 'comment':
+            self._error('a comment')
+        self._pos += 1
+        comment = self._call('_LINE_COMMENT', ('#', value[1:]))
+        return self._call('LINE_COMMENT', AST(comment=comment))
+
+    def _DOC_(self):
+        return self._call('DOC', AST(doc=self._BLOCK_STRING_()))
+
+    def _BLOCK_STRING_(self):
+        kind, value, _ = self._peek()
+        if kind != 'block':
+            self._error('a block string')
+        self._pos += 1
+        parts = closure(_block_parts_re.findall(value[3:-3]))
+        return self._call('BLOCK_STRING', ('"""', parts, '"""'))
+
+    def _STRING_(self):
+        kind, value, _ = self._peek()
+        if kind != 'string':
+            self._error('a string')
+        self._pos += 1
+        characters = closure(_characters_re.findall(value[1:-1]))
+        characters = self._call('CHARACTER', AST(_join=characters))
+        return self._call('STRING', ('"', characters, '"'))
+
+    def _string_value_(self):
+        if self._peek()[0] == 'block':
+            node = self._BLOCK_STRING_()
+        else:
+            node = self._STRING_()
+        return self._call('string_value', node)
+
+    def _description_(self):
+        return self._call('description', self._string_value_())
+
+    def _name_(self):
+        kind, value, _ = self._peek()
+        if kind != 'name':
+            self._error('a name')
+        self._pos += 1
+        return self._call('name', AST(name=self._call('_name', value)))
+
+    def _type_system_definition_(self):
+        description = None
+        if self._peek()[0] in ('string', 'block'):
+            description = self._description_()
+
+        keyword = self._peek()[1]
+        for key, kw in _type_system_definitions:
+            if kw == keyword:
+                break
+        else:
+            self._error('a type system definition')
+
+        if key == 'schema_definition':
+            if description is not None:
+                self._error('a type system definition')
+            value = self._schema_definition_()
+        elif key == 'directive_definition':
+            value = self._directive_definition_()
+        elif key == 'interface_definition':
+            value = self._interface_type_definition_()
+        elif key == 'enum_definition':
+            value = self._enum_type_definition_(description)
+        elif key == 'type_definition':
+            value = self._object_type_definition_()
+        elif key == 'input_definition':
+            value = self._input_object_type_definition_()
+        elif key == 'union_definition':
+            value = self._union_type_definition_(description)
+        elif key == 'scalar_definition':
+            value = self._scalar_type_definition_(description)
+        else:
+            raise ParseError('Type system extensions are not supported %s'
+                             % _location(self._text, self._peek()[2]))
+
+        node = AST([(k, value if k == key else None) for k, _ in _type_system_definitions])
+        return self._call('type_system_definition', node)
+
+    def _schema_definition_(self):
+        cst = [self._token('schema')]
+        if self._is('@'):
+            cst.append(self._directives_())
+        cst.append(self._token('{'))
+        operations = [self._root_operation_type_definition_()]
+        while not self._is('}'):
+            operations.append(self._root_operation_type_definition_())
+        cst.append(closure(operations))
+        cst.append(self._token('}'))
+        return self._call('schema_definition', tuple(cst))
+
+    def _root_operation_type_definition_(self):
+        node = (self._operation_type_(), self._token(':'), self._named_type_())
+        return self._call('root_operation_type_definition', node)
+
+    def _operation_type_(self):
+        if self._peek()[1] not in _operation_types:
+            self._error('an operation type')
+        return self._call('operation_type', self._token(self._peek()[1]))
+
+    def _directive_definition_(self):
+        ba = self._token('directive')
+        cst = self._token('@')
+        name = self._name_()
+        args = self._arguments_definition_() if self._is('(') else None
+        bs = self._token('on')
+        locations = self._directive_locations_()
+        node = AST(_directive__ba=ba, _cst=cst, _name=name, args=args, _cst__bs=bs, _locations=locations)
+        return self._call('directive_definition', node)
+
+    def _directive_locations_(self):
+        first = self._directive_location_()
+        others = []
+        while self._is('|'):
+            others.append(self._element(len(others), [self._token('|'), self._directive_location_()]))
+        return self._call('directive_locations', (first, closure(others)))
+
+    def _directive_location_(self):
+        location = self._peek()[1]
+        if location in _type_system_locations:
+            node = self._call('type_system_directive_location', self._token(location))
+        elif location in _executable_locations:
+            node = self._call('executable_directive_location', self._token(location))
+        else:
+            self._error('a directive location')
+        return self._call('directive_location', node)
+
+    def _interface_type_definition_(self):
+        cst = self._token('interface')
+        name = self._name_()
+        directives = self._directives_() if self._is('@') else None
+        fields = self._fields_definition_() if self._is('{') else None
+        node = AST(_cst=cst, _name=name, _directives=directives, _fields=fields)
+        return self._call('interface_type_definition', node)
+
+    def _object_type_definition_(self):
+        cst = self._token('type')
+        name = self._name_()
+        implements = self._implements_interfaces_() if self._is('implements') else None
+        directives = self._directives_() if self._is('@') else None
+        fields = self._fields_definition_() if self._is('{') else None
+        node = AST(_cst=cst, _name=name, _implements=implements, _directives=directives, _fields=fields)
+        return self._call('object_type_definition', node)
+
+    def _implements_interfaces_(self):
+        cst = [self._token('implements')]
+        if self._is('&'):
+            cst.append(self._token('&'))
+        cst.append(self._named_type_())
+        node = self._call('implements_interfaces', tuple(cst))
+        # Left recursion
+        while self._is('&'):
+            node = (node, self._token('&'), self._named_type_())
+            node = self._call('implements_interfaces', node)
+        return node
+
+    def _input_object_type_definition_(self):
+        cst = self._token('input')
+        name = self._name_()
+        directives = self._directives_() if self._is('@') else None
+        fields = self._input_fields_definition_() if self._is('{') else None
+        node = AST(_cst=cst, _name=name, _directives=directives, _fields=fields)
+        return self._call('input_object_type_definition', node)
+
+    def _enum_type_definition_(self, description=None):
+        cst = [] if description is None else [description]
+        cst.append(self._token('enum'))
+        cst.append(self._name_())
+        if self._is('@'):
+            cst.append(self._directives_())
+        if self._is('{'):
+            cst.append(self._enum_values_definition_())
+        return self._call('enum_type_definition', tuple(cst))
+
+    def _union_type_definition_(self, description=None):
+        cst = [] if description is None else [description]
+        cst.append(self._token('union'))
+        cst.append(self._name_())
+        if self._is('@'):
+            cst.append(self._directives_())
+        if self._is('='):
+            cst.append(self._union_member_types_())
+        return self._call('union_type_definition', tuple(cst))
+
+    def _union_member_types_(self):
+        cst = [self._token('=')]
+        if self._is('|'):
+            cst.append(self._token('|'))
+        cst.append(self._named_type_())
+        others = []
+        while self._is('|'):
+            others.append(self._element(len(others), [self._token('|'), self._named_type_()]))
+        cst.append(closure(others))
+        return self._call('union_member_types', tuple(cst))
+
+    def _scalar_type_definition_(self, description=None):
+        cst = [] if description is None else [description]
+        cst.append(self._token('scalar'))
+        cst.append(self._name_())
+        if self._is('@'):
+            cst.append(self._directives_())
+        return self._call('scalar_type_definition', tuple(cst))
+
+    def _fields_definition_(self):
+        start = self._token('{')
+        fields = [self._field_definition_wrapper()]
+        while not self._is('}'):
+            fields.append(self._field_definition_wrapper())
+        node = (start, closure(fields), self._token('}'))
+        return self._call('fields_definition', node)
+
+    def _field_definition_wrapper(self):
+        return self._call('_field_definition', AST(field=self._field_definition_()))
+
+    def _field_definition_(self):
+        kind = self._peek()[0]
+        if kind == 'comment' or (kind == 'block' and not self._has_description()):
+            return self._call('field_definition', self._COMMENTS_())
+
+        if kind in ('string', 'block'):
+            self._description_()
+        name = self._name_()
+        args = self._arguments_definition_() if self._is('(') else None
+        cst = self._token(':')
+        type = self._type_()
+        directives = self._directives_() if self._is('@') else None
+        node = AST(_name=name, args=args, _cst=cst, _type=type, _directives=directives)
+        return self._call('field_definition', node)
+
+    def _arguments_definition_(self):
+        start = self._token('(')
+        first = self._input_value_definition_wrapper()
+        others = []
+        while self._is(','):
+            others.append(self._element(len(others), [self._token(','), self._input_value_definition_wrapper()]))
+        node = (start, first, closure(others), self._token(')'))
+        return self._call('arguments_definition', node)
+
+    def _input_value_definition_wrapper(self):
+        return self._call('_input_value_definition', AST(field=self._input_value_definition_()))
+
+    def _input_value_definition_(self):
+        if self._peek()[0] in ('string', 'block'):
+            self._description_()
+        name = self._name_()
+        cst = self._token(':')
+        type = self._type_()
+        dv = self._default_value_() if self._is('=') else None
+        directives = self._directives_() if self._is('@') else None
+        node = AST(_name=name, _cst=cst, _type=type, _dv=dv, _directives=directives)
+        return self._call('input_value_definition', node)
+
+    def _input_fields_definition_(self):
+        start = self._token('{')
+        fields = [self._input_value_definition_wrapper()]
+        while not self._is('}'):
+            fields.append(self._input_value_definition_wrapper())
+        node = (start, closure(fields), self._token('}'))
+        return self._call('input_fields_definition', node)
+
+    def _enum_values_definition_(self):
+        start = self._token('{')
+        values = [self._enum_value_definition_wrapper()]
+        while not self._is('}'):
+            values.append(self._enum_value_definition_wrapper())
+        node = (start, closure(values), self._token('}'))
+        return self._call('enum_values_definition', node)
+
+    def _enum_value_definition_wrapper(self):
+        return self._call('_enum_value_definition', AST(field=self._enum_value_definition_()))
+
+    def _enum_value_definition_(self):
+        kind = self._peek()[0]
+        if kind == 'comment' or (kind == 'block' and not self._has_description()):
+            return self._call('enum_value_definition', self._COMMENTS_())
+
+        cst = []
+        if kind in ('string', 'block'):
+            cst.append(self._description_())
+        cst.append(self._enum_value_())
+        if self._is('@'):
+            cst.append(self._directives_())
+        return self._call('enum_value_definition', self._node(cst))
+
+    def _default_value_(self):
+        node = (self._token('='), self._value_())
+        return self._call('default_value', node)
+
+    def _type_(self):
+        if self._is('['):
+            type = self._list_type_()
+        else:
+            type = self._named_type_()
+        if self._is('!'):
+            type = [type, self._token('!')]
+        return self._call('type', AST(_type=type))
+
+    def _named_type_(self):
+        return self._call('named_type', self._name_())
+
+    def _list_type_(self):
+        node = (self._token('['), self._type_(), self._token(']'))
+        return self._call('list_type', node)
+
+    def _directives_(self):
+        directives = [self._directive_()]
+        while self._is('@'):
+            directives.append(self._directive_())
+        return self._call('directives', closure(directives))
+
+    def _directive_(self):
+        bb = self._token('@')
+        name = self._name_()
+        args = self._arguments_() if self._is('(') else None
+        return self._call('directive', AST(_cst__bb=bb, _name=name, _args=args))
+
+    def _arguments_(self):
+        start = self._token('(')
+        first = self._argument_()
+        others = []
+        while self._is(','):
+            others.append(self._element(len(others), [self._token(','), self._argument_()]))
+        node = (start, first, closure(others), self._token(')'))
+        return self._call('arguments', node)
+
+    def _comments(self):
+        comments = []
+        while self._peek()[0] == 'comment':
+            comments.append(self._LINE_COMMENT_())
+        return closure(comments)
+
+    def _argument_(self):
+        node = (self._comments(), self._name_(), self._token(':'), self._value_())
+        return self._call('argument', node)
+
+    def _value_(self):
+        node = (self._comments(), self._value())
+        return self._call('value', node)
+
+    def _value(self):
+        kind, value, _ = self._peek()
+        if kind == 'punct':
+            if value == '$':
+                node = self._variable_()
+            elif value == '[':
+                node = self._list_value_()
+            elif value == '{':
+                node = self._object_value_()
+            else:
+                self._error('a value')
+        elif kind == 'int':
+            node = self._int_value_()
+        elif kind in ('string', 'block'):
+            node = self._string_value_()
+        elif kind == 'name':
+            if value in ('true', 'false'):
+                node = self._call('boolean_value', self._token(value))
+            elif value == 'null':
+                node = self._call('null_value', self._token(value))
+            else:
+                node = self._enum_value_()
+        else:
+            self._error('a value')
+        return self._call('_value', node)
+
+    def _variable_(self):
+        node = (self._token('$'), self._name_())
+        return self._call('variable', node)
+
+    def _int_value_(self):
+        _, value, _ = self._peek()
+        self._pos += 1
+        cst = []
+        if value[0] == '-':
+            cst.append('-')
+            value = value[1:]
+        if value == '0':
+            cst.append('0')
+        else:
+            cst.append(self._call('NONZERO_DIGIT', value[0]))
+            cst.append(closure(self._call('DIGIT', d) for d in value[1:]))
+        node = self._call('int', self._node(cst))
+        return self._call('int_value', AST(_join=node))
+
+    def _enum_value_(self):
+        return self._call('enum_value', self._name_())
+
+    def _list_value_(self):
+        start = self._token('[')
+        first = self._value_()
+        others = []
+        while self._is(','):
+            others.append(self._element(len(others), [self._token(','), self._value_()]))
+        node = (start, first, closure(others), self._token(']'))
+        return self._call('list_value', node)
+
+    def _object_value_(self):
+        node = (self._token('{'), self._object_field_(), self._token('}'))
+        return self._call('object_value', node)
+
+    def _object_field_(self):
+        node = (self._name_(), self._token(':'), self._value_())
+        return self._call('object_field', node)
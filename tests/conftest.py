@@ -0,0 +1,23 @@
+'''Shared setup of the tests: gqlast is imported from the root of the repository.
+
+The tests are unittest test cases (see `make test`), they import ROOT and read from
+this module, which pytest also loads.
+'''
+
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+# Inputs and committed output of each target (see `make schemas`).
+TARGETS = [
+    ('dgraph', ['graphql/errors.graphql', 'graphql/fractal6.graphql'], 'gen_dgraph_in/schema.graphql'),
+    ('gqlgen', ['graphql/directives.graphql', 'graphql/fractal6.graphql', 'gen_dgraph_out/schema.graphql'], 'gen/schema.graphql'),
+]
+
+
+def read(path):
+    ''' Returns the text of a file of the repository. '''
+    with open(os.path.join(ROOT, path)) as f:
+        return f.read()
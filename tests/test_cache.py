@@ -0,0 +1,129 @@
+'''Tests of the parse cache (see ParseCache and --cache-dir).'''
+
+import os
+import concurrent.futures
+import tempfile
+import unittest
+from unittest import mock
+
+from conftest import ROOT, read
+from gqlast import MultiSDL, ParseCache
+
+
+def fill_cache(path, worker):
+    ''' Put and get entries in a small cache, returns the number of entries put. '''
+    cache = ParseCache(path, max_bytes=4096)
+    for i in range(200):
+        cache.put('S-code-%d-%d' % (worker, i), 'x' * 500)
+        cache.get('S-code-%d-%d' % ((worker + 1) % 4, i))
+    return i + 1
+
+
+class ParseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, 'cache')
+
+    def entries(self):
+        return sorted(fn[:-len('.pickle.z')] for fn in os.listdir(self.path))
+
+    def test_get_put(self):
+        cache = ParseCache(self.path)
+        self.assertIsNone(cache.get('S-code-a'))
+        cache.put('S-code-a', ['a'])
+        self.assertEqual(cache.get('S-code-a'), ['a'])
+
+    def test_eviction(self):
+        ''' The least recently used entries above max_bytes are evicted, and the entries of other code. '''
+        cache = ParseCache(self.path)
+        cache.put('S-old-a', 'a')
+        for i, key in enumerate(['S-code-a', 'S-code-b', 'S-code-c']):
+            cache.put(key, 'x' * 1000)
+            os.utime(cache._file(key), (i, i))
+        self.assertEqual(self.entries(), ['S-code-a', 'S-code-b', 'S-code-c'])
+
+        # Reading an entry marks it as recently used.
+        cache.get('S-code-a')
+        cache.max_bytes = 2 * os.path.getsize(cache._file('S-code-a'))
+        cache.put('S-code-d', 'x' * 1000)
+        self.assertEqual(self.entries(), ['S-code-a', 'S-code-d'])
+
+        # The new entry is kept, even if it is larger than max_bytes.
+        cache.max_bytes = 1
+        cache.put('S-code-e', 'x' * 1000)
+        self.assertEqual(self.entries(), ['S-code-e'])
+
+    def test_code_hash(self):
+        ''' The code is hashed once per process, not on each lookup. '''
+        with mock.patch.object(ParseCache, '_code_hash', None), \
+                mock.patch.object(ParseCache, '_hash_file', wraps=ParseCache._hash_file) as hash_file:
+            cache = ParseCache(self.path)
+            keys = [cache.key(text, object()) for text in ('type A', 'type B', 'type A')]
+            ParseCache(self.path).key('type A', object())
+        self.assertEqual(hash_file.call_count, 3)
+        self.assertEqual(keys[0], keys[2])
+        self.assertNotEqual(keys[0], keys[1])
+        self.assertEqual(keys[0].split('-')[1], cache.code_hash())
+
+    def test_vanished_entries(self):
+        ''' The entries removed by another run between the listing and their use are skipped. '''
+        cache = ParseCache(self.path, max_bytes=1)
+        cache.put('S-code-a', 'a')
+        listdir = os.listdir
+        vanished = ['S-old-x.pickle.z', 'S-code-y.pickle.z']
+        with mock.patch('os.listdir', lambda path: listdir(path) + vanished):
+            cache.put('S-code-b', 'b')
+        self.assertEqual(self.entries(), ['S-code-b'])
+
+        with mock.patch('os.utime', side_effect=FileNotFoundError):
+            self.assertEqual(cache.get('S-code-b'), 'b')
+
+    def test_concurrent_writers(self):
+        # Concurrent runs (e.g. make -j) share the cache directory and evict each other's entries.
+        with concurrent.futures.ProcessPoolExecutor(4) as pool:
+            results = list(pool.map(fill_cache, [self.path] * 4, range(4)))
+        self.assertEqual(results, [200] * 4)
+
+    def test_read_only(self):
+        ParseCache(self.path).put('S-code-a', 'a')
+        cache = ParseCache(self.path, read_only=True)
+        cache.put('S-code-b', 'b')
+        self.assertEqual(cache.get('S-code-a'), 'a')
+        self.assertEqual(self.entries(), ['S-code-a'])
+
+    def settings(self, out, **options):
+        settings = {'FILE': [os.path.join(ROOT, 'graphql/errors.graphql'), os.path.join(ROOT, 'graphql/fractal6.graphql')],
+                    '--out-dgraph': out, '--parser': 'fast', '--cache-dir': self.path, '--profile': True}
+        settings.update(options)
+        return settings
+
+    def test_outputs(self):
+        ''' The inputs of --out-dgraph/--out-gqlgen are cached one by one, --check only reads the cache. '''
+        out = os.path.join(self.tmp.name, 'schema.graphql')
+        check = MultiSDL(self.settings(out, **{'--check': True}))
+        self.assertEqual(check.profile.info['cache'], '0/2 hits')
+        self.assertFalse(os.path.exists(self.path))
+
+        cold = MultiSDL(self.settings(out))
+        self.assertEqual(cold.profile.info['cache'], '0/2 hits')
+        self.assertEqual(len(self.entries()), 2)
+        cold.generate()
+        self.assertEqual(read(out), read('gen_dgraph_in/schema.graphql'))
+
+        os.remove(out)
+        warm = MultiSDL(self.settings(out))
+        self.assertEqual(warm.profile.info['cache'], '2/2 hits')
+        self.assertNotIn('parse', warm.profile.phases)
+        warm.generate()
+        self.assertEqual(read(out), read('gen_dgraph_in/schema.graphql'))
+
+        check = MultiSDL(self.settings(out, **{'--check': True}))
+        self.assertEqual(check.profile.info['cache'], '2/2 hits')
+        check.generate()
+        self.assertEqual(check.stale, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
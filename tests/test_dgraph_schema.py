@@ -0,0 +1,37 @@
+'''Tests of the local expansion of the Dgraph schema (see DgraphSchema and --expand-dgraph).'''
+
+import unittest
+
+from conftest import read
+from gqlast import DgraphSchema
+
+
+class DgraphSchemaTest(unittest.TestCase):
+
+    def test_conformance(self):
+        ''' The expansion of gen_dgraph_in/ is the schema fetched from Dgraph (`make dgraph_conformance`). '''
+        text = read('gen_dgraph_in/schema.graphql')
+        expected = read('gen_dgraph_out/schema.graphql')
+        for parser in ('fast', 'tatsu'):
+            with self.subTest(parser=parser):
+                self.assertEqual(DgraphSchema(text, parser).stringify(), expected)
+
+    def test_errors(self):
+        with self.assertRaisesRegex(ValueError, '@hasInverse of A.b: no field'):
+            DgraphSchema('type A {\n  b: B @hasInverse(field: a)\n}\n\ntype B {\n  c: Int\n}\n', 'fast')
+        with self.assertRaisesRegex(ValueError, 'Field b of type B can not be searched'):
+            DgraphSchema('type A {\n  b: B @search\n}\n\ntype B {\n  c: Int\n}\n', 'fast')
+        with self.assertRaisesRegex(ValueError, 'Unsupported definition in a Dgraph schema: scalar S'):
+            DgraphSchema('scalar S\n', 'fast')
+
+    def test_unsupported_directives(self):
+        for directive in DgraphSchema.unsupported:
+            with self.subTest(directive=directive):
+                with self.assertRaisesRegex(ValueError, 'Unsupported directive in a Dgraph schema: @%s on A.b' % directive):
+                    DgraphSchema('type A {\n  b: Int @%s\n}\n' % directive, 'fast')
+                with self.assertRaisesRegex(ValueError, 'Unsupported directive in a Dgraph schema: @%s on A$' % directive):
+                    DgraphSchema('type A @%s {\n  b: Int\n}\n' % directive, 'fast')
+
+
+if __name__ == '__main__':
+    unittest.main()
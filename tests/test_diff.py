@@ -0,0 +1,74 @@
+'''Tests of the schema diff (see SchemaDiff and --diff-against).'''
+
+import unittest
+
+from conftest import read
+from gqlast import SchemaDiff, Transformer
+
+
+# Edits of graphql/fractal6.graphql: the type and the index of existing fields,
+# a removed enum value and a new type.
+EDITS = [
+    ('  nameid: String!     @search(by: [hash, regexp]) @id', '  nameid: String     @search(by: [hash, regexp]) @id'),
+    ('  about: String @search(by: [fulltext])', '  about: String @search(by: [term])'),
+    ('  Coordinated # Coordinator centered\n  Agile # Role centered\n', '  Coordinated # Coordinator centered\n'),
+]
+
+ADDED = '''
+type Tag {
+  id: ID!
+  name: String! @search(by: [hash])
+}
+'''
+
+CHANGES = [
+    {'op': 'change', 'kind': 'field', 'name': 'nameid', 'type': 'Node',
+     'old': 'nameid: String! @search(by:[hash, regexp]) @id', 'new': 'nameid: String @search(by:[hash, regexp]) @id'},
+    {'op': 'change', 'kind': 'field', 'name': 'about', 'type': 'Node',
+     'old': 'about: String @search(by:[fulltext])', 'new': 'about: String @search(by:[term])'},
+    {'op': 'change', 'kind': 'search', 'name': 'about', 'type': 'Node',
+     'old': '@search(by:[fulltext])', 'new': '@search(by:[term])'},
+    {'op': 'change', 'kind': 'enum', 'name': 'NodeMode',
+     'old': 'enum NodeMode { Coordinated Agile }', 'new': 'enum NodeMode { Coordinated }'},
+    {'op': 'add', 'kind': 'type', 'name': 'Tag', 'new': 'type Tag { id: ID! name: String! @search(by:[hash]) }'},
+    {'op': 'add', 'kind': 'field', 'name': 'id', 'type': 'Tag', 'new': 'id: ID!'},
+    {'op': 'add', 'kind': 'field', 'name': 'name', 'type': 'Tag', 'new': 'name: String! @search(by:[hash])'},
+    {'op': 'add', 'kind': 'search', 'name': 'name', 'type': 'Tag', 'new': '@search(by:[hash])'},
+]
+
+
+class SchemaDiffTest(unittest.TestCase):
+
+    def setUp(self):
+        self.previous = read('gen_dgraph_in/schema.graphql')
+        self.errors = read('graphql/errors.graphql')
+        self.source = read('graphql/fractal6.graphql')
+
+    def generate(self, source):
+        return Transformer('dgraph', 'fast').transform([self.errors, source])
+
+    def test_noop(self):
+        ''' The committed schema is up to date. '''
+        diff = SchemaDiff('fast').diff(self.previous, self.generate(self.source))
+        self.assertEqual(diff, {'noop': True, 'changes': [], 'reindex': []})
+
+    def test_changes(self):
+        source = self.source
+        for old, new in EDITS:
+            self.assertEqual(source.count(old), 1)
+            source = source.replace(old, new)
+        current = self.generate(source + ADDED)
+
+        diff = SchemaDiff('fast').diff(self.previous, current)
+        self.assertEqual(diff, {'noop': False, 'changes': CHANGES, 'reindex': ['Node.nameid', 'Node.about']})
+
+        # The reverse change set
+        diff = SchemaDiff('fast').diff(current, self.previous)
+        self.assertEqual([(c['op'], c['kind'], c['name']) for c in diff['changes']],
+                         [('change', 'field', 'nameid'), ('change', 'field', 'about'), ('change', 'search', 'about'),
+                          ('change', 'enum', 'NodeMode'), ('remove', 'type', 'Tag'), ('remove', 'field', 'id'),
+                          ('remove', 'field', 'name'), ('remove', 'search', 'name')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+'''Tests of the schema dependency graph (see SchemaGraph, --graph and --affected).'''
+
+import unittest
+
+from conftest import read
+from gqlast import SchemaGraph
+
+
+SCHEMA = '''
+interface I {
+  id: ID!
+}
+
+type A implements I {
+  b: B
+}
+
+type B {
+  a: A
+}
+
+type C {
+  b: [B!]
+}
+
+input AFilter {
+  id: [ID!]
+}
+
+type Query {
+  getA(id: ID!): A
+  queryA(filter: AFilter): [A]
+  queryC: [C]
+}
+'''
+
+
+class SchemaGraphTest(unittest.TestCase):
+
+    def test_export(self):
+        graph = SchemaGraph(SCHEMA, 'fast').export()
+        self.assertEqual(graph['nodes'], {'I': 'interface', 'A': 'type', 'B': 'type', 'C': 'type', 'AFilter': 'input',
+                                          'Query.getA': 'Query', 'Query.queryA': 'Query', 'Query.queryC': 'Query'})
+        self.assertEqual(graph['edges'], [
+            ['I', 'A', 'implements'],
+            ['A', 'B', 'field'], ['A', 'AFilter', 'input'], ['A', 'Query.getA', 'operation'], ['A', 'Query.queryA', 'operation'],
+            ['B', 'A', 'field'], ['B', 'C', 'field'],
+            ['C', 'Query.queryC', 'operation'],
+            ['AFilter', 'Query.queryA', 'field'],
+        ])
+
+    def test_affected(self):
+        ''' The field edges are not followed transitively: the schema is cyclic. '''
+        affected = SchemaGraph(SCHEMA, 'fast').affected(['I'])
+        self.assertEqual(affected, {'changed': ['I'], 'definitions': ['I', 'A', 'B', 'AFilter'],
+                                    'operations': ['Query.getA', 'Query.queryA']})
+
+        # B has a field of type A, C a field of type B: C (and its operation) is not affected.
+        affected = SchemaGraph(SCHEMA, 'fast').affected(['A'])
+        self.assertEqual(affected, {'changed': ['A'], 'definitions': ['A', 'B', 'AFilter'],
+                                    'operations': ['Query.getA', 'Query.queryA']})
+
+        with self.assertRaisesRegex(ValueError, 'Unknown definitions: D'):
+            SchemaGraph(SCHEMA, 'fast').affected(['A', 'D'])
+
+    def test_no_fields(self):
+        # Query and Mutation may be declared (or extended) without fields.
+        for parser in ('tatsu', 'fast'):
+            with self.subTest(parser=parser):
+                graph = SchemaGraph('type Query\n\ntype Mutation @auth\n\n' + SCHEMA, parser)
+                self.assertEqual([n for n, kind in graph.nodes.items() if kind == 'Query'],
+                                 ['Query.getA', 'Query.queryA', 'Query.queryC'])
+                self.assertEqual(graph.affected(['C'])['operations'], ['Query.queryC'])
+
+    def test_inputs(self):
+        text = ''.join(read(path) for path in ('graphql/directives.graphql', 'graphql/fractal6.graphql',
+                                               'gen_dgraph_out/schema.graphql'))
+        affected = SchemaGraph(text, 'fast').affected(['ProjectFieldValue'])
+        self.assertEqual(affected['definitions'], [
+            'ProjectField', 'ProjectFieldValue', 'ProjectTension', 'AddProjectFieldInput', 'AddProjectFieldValueInput',
+            'AddProjectFieldValuePayload', 'AddProjectTensionInput', 'DeleteProjectFieldValuePayload',
+            'ProjectFieldPatch', 'ProjectFieldRef', 'ProjectFieldValueFilter', 'ProjectFieldValuePatch',
+            'ProjectFieldValueRef', 'ProjectTensionPatch', 'ProjectTensionRef', 'UpdateProjectFieldValueInput',
+            'UpdateProjectFieldValuePayload'])
+        self.assertEqual(affected['operations'], [
+            'Mutation.addProjectFieldValue', 'Mutation.updateProjectFieldValue', 'Mutation.deleteProjectFieldValue',
+            'Query.queryProjectFieldValue', 'Query.aggregateProjectFieldValue'])
+
+
+if __name__ == '__main__':
+    unittest.main()
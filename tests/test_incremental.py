@@ -0,0 +1,89 @@
+'''Tests of the incremental mode (see IncrementalSDL).'''
+
+import os
+import tempfile
+import unittest
+
+from conftest import ROOT, TARGETS, read
+from gqlast import SDL, IncrementalSDL, parse_errors
+
+
+# Edits of graphql/fractal6.graphql: a field of a type, of an interface (inherited by
+# the types implementing it) and of a type hooked by the Query and Mutation types.
+EDITS = [
+    ('  nameid: String!     @search(by: [hash, regexp]) @id', '  nameid: String     @search(by: [hash, regexp]) @id'),
+    ('  message: String      @search(by: [fulltext])', '  message: String!     @search(by: [fulltext])'),
+    ('  color: String        @x_alter\n  tensions:', '  color: Int        @x_alter\n  tensions:'),
+]
+
+
+class IncrementalTest(unittest.TestCase):
+    ''' The incremental output is the output of a full run, whatever the previous run. '''
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def settings(self, dgraph, files, **options):
+        settings = {'--dgraph': dgraph, 'FILE': files, '--parser': 'fast', '--cache-dir': self.tmp.name}
+        settings.update(options)
+        return settings
+
+    def write(self, path, text):
+        path = os.path.join(self.tmp.name, os.path.basename(path))
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_cache(self):
+        for target, inputs, _ in TARGETS:
+            dgraph = target == 'dgraph'
+            with self.subTest(dgraph=dgraph):
+                files = [os.path.join(ROOT, fn) for fn in inputs]
+                full = SDL(self.settings(dgraph, files, **{'--no-cache': True})).stringify()
+
+                cold = IncrementalSDL(self.settings(dgraph, files))
+                self.assertEqual(cold.dirty, list(cold.units))
+                self.assertEqual(cold.stringify(), full)
+
+                warm = IncrementalSDL(self.settings(dgraph, files))
+                self.assertEqual(warm.dirty, [])
+                self.assertEqual(warm.stringify(), full)
+
+    def test_edits(self):
+        for target, inputs, _ in TARGETS:
+            dgraph = target == 'dgraph'
+            files = [os.path.join(ROOT, fn) for fn in inputs]
+            source = read('graphql/fractal6.graphql')
+            files[1] = self.write('fractal6.graphql', source)
+            previous = IncrementalSDL(self.settings(dgraph, files, **{'--no-cache': True}))
+            for old, new in EDITS:
+                with self.subTest(dgraph=dgraph, edit=new):
+                    self.assertEqual(source.count(old), 1)
+                    source = source.replace(old, new, 1)
+                    self.write('fractal6.graphql', source)
+                    full = SDL(self.settings(dgraph, files, **{'--no-cache': True})).stringify()
+                    self.assertNotEqual(full, previous.stringify())
+
+                    incremental = IncrementalSDL(self.settings(dgraph, files), previous=previous.state)
+                    self.assertTrue(incremental.dirty)
+                    self.assertLess(len(incremental.dirty), len(incremental.units) // 4)
+                    self.assertEqual(incremental.stringify(), full)
+                    previous = incremental
+
+    def test_error_location(self):
+        # The definitions are parsed one by one, a syntax error is located in its input file.
+        files = [os.path.join(ROOT, 'graphql/errors.graphql'), os.path.join(ROOT, 'graphql/fractal6.graphql')]
+        source = read('graphql/fractal6.graphql')
+        pos = source.index('\ntype ', len(source) // 2) + 1
+        files[1] = self.write('fractal6.graphql', source[:pos] + 'type {\n' + source[pos:])
+        line = source.count('\n', 0, pos) + 1
+        for parser, location in (('tatsu', r'fractal6.graphql\(%d:6\)' % line),
+                                 ('fast', r'fractal6.graphql: .* at line %d, column 6' % line)):
+            with self.subTest(parser=parser):
+                with self.assertRaisesRegex(parse_errors(), location):
+                    IncrementalSDL(self.settings(True, files, **{'--parser': parser, '--no-cache': True}))
+
+
+if __name__ == '__main__':
+    unittest.main()
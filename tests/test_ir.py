@@ -0,0 +1,78 @@
+'''Tests of the IR of the definitions (see to_ir).'''
+
+import unittest
+
+from conftest import read
+from gqlast import SDL, DeferredSemantics, Raw, new_parser, to_ir
+
+
+# Definitions in the shapes the parsers produce: optional descriptions, directives,
+# members, comments (printed or not)...
+CASES = [
+    'scalar S',
+    '"d" scalar S @a @b(c: 1, d: [X, "s"])',
+    'union U',
+    '"d" union U @a = A | B',
+    'union U = | A',
+    'enum E',
+    'enum E {\n A\n B\n}',
+    '"""d"""\nenum E @a {\n "v" A\n B\n}',
+    'enum E @a {\n A @x\n B\n}',
+    'enum E @a {\n # c\n A\n}',
+    'enum E @a {\n # Dgraph.Authorization {}\n A\n}',
+    'type T',
+    'type T implements A {\n a: Int\n}',
+    'type T implements & A @x {\n a: Int\n}',
+    'type T @a(x: [1, # Dgraph.Authorization x\n 2]) {\n # c\n a(b: Int = 1 @x, c: [[Int!]]!): Int @y(z: [A, B])\n}',
+    'interface I @a {\n # Dgraph.Authorization {}\n a: [Int!]!\n}',
+    'input I {\n a: Int = 2 @x\n b: String\n}',
+    'directive @a(b: Int = 2, c: [String]) on FIELD | OBJECT',
+    '# Dgraph.Authorization {"a": 1}\n# plain\n"""doc"""\ntype T {\n  a: Int\n}',
+    'schema { query: Q }',
+]
+
+PARSERS = ('tatsu', 'fast')
+
+# Kinds the IR models, never kept as Raw.
+KINDS = ('directive_definition', 'interface_definition', 'enum_definition', 'type_definition',
+         'input_definition', 'union_definition', 'scalar_definition')
+
+
+def parse(text, parser_name):
+    return new_parser(parser_name).parse(text, rule_name='start', semantics=DeferredSemantics(), parseinfo=False)
+
+
+class IRTest(unittest.TestCase):
+
+    def check(self, text, parser_name):
+        ast = parse(text, parser_name)
+        definitions = to_ir(ast)
+        for d in definitions:
+            if isinstance(d, Raw):
+                self.assertNotIn(d.kind, KINDS)
+        self.assertEqual(''.join(d.sdl() for d in definitions), ''.join(SDL.iter_definitions(ast)))
+
+    def test_cases(self):
+        ''' The supported kinds are not kept as Raw, and are printed as SDL prints their AST. '''
+        for parser_name in PARSERS:
+            for text in CASES:
+                with self.subTest(parser=parser_name, text=text):
+                    self.check(text, parser_name)
+
+    def test_inputs(self):
+        for parser_name in PARSERS:
+            for path in ('graphql/directives.graphql', 'graphql/errors.graphql', 'graphql/fractal6.graphql',
+                         'gen_dgraph_in/schema.graphql', 'gen_dgraph_out/schema.graphql'):
+                with self.subTest(parser=parser_name, path=path):
+                    self.check(read(path), parser_name)
+
+    def test_errors(self):
+        ''' An unexpected node of a supported kind is an error. '''
+        ast = parse('scalar S', 'fast')
+        dict.__setitem__(ast[0], 'scalar_definition', ['scalar'])
+        with self.assertRaises(ValueError):
+            to_ir(ast)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+'''Tests of the output files (see write_output, --out-dgraph, --out-gqlgen and --check).'''
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+from conftest import ROOT, read
+from gqlast import write_output
+
+
+class WriteOutputTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, 'schema.graphql')
+
+    def test_unchanged(self):
+        ''' An unchanged output is not written again: it keeps its mtime. '''
+        self.assertTrue(write_output(self.path, 'type A\n'))
+        os.utime(self.path, (1, 1))
+        self.assertFalse(write_output(self.path, 'type A\n'))
+        self.assertEqual(os.stat(self.path).st_mtime, 1)
+
+        self.assertTrue(write_output(self.path, 'type B\n'))
+        self.assertNotEqual(os.stat(self.path).st_mtime, 1)
+        self.assertEqual(read(self.path), 'type B\n')
+
+    def test_mode(self):
+        write_output(self.path, 'type A\n')
+        os.chmod(self.path, 0o640)
+        write_output(self.path, 'type B\n')
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o640)
+        self.assertEqual(os.listdir(self.tmp.name), ['schema.graphql'])
+
+
+class CheckTest(unittest.TestCase):
+    ''' --check exits with 0 when the outputs are up to date, 1 otherwise, and writes nothing. '''
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.out = os.path.join(self.tmp.name, 'schema.graphql')
+        shutil.copy(os.path.join(ROOT, 'gen_dgraph_in/schema.graphql'), self.out)
+        os.utime(self.out, (1, 1))
+
+    def check(self):
+        return subprocess.run([sys.executable, 'gqlast.py', '--check', '--no-cache', '--parser', 'fast',
+                               '--out-dgraph', self.out, 'graphql/errors.graphql', 'graphql/fractal6.graphql'],
+                              cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+
+    def test_fresh(self):
+        self.assertEqual(self.check().returncode, 0)
+        self.assertEqual(os.stat(self.out).st_mtime, 1)
+
+    def test_stale(self):
+        with open(self.out, 'a') as f:
+            f.write('\n')
+        os.utime(self.out, (1, 1))
+        result = self.check()
+        self.assertEqual(result.returncode, 1)
+        self.assertIn('Outputs not up to date: %s' % self.out, result.stderr)
+        self.assertEqual(os.stat(self.out).st_mtime, 1)
+
+        os.remove(self.out)
+        self.assertEqual(self.check().returncode, 1)
+        self.assertFalse(os.path.exists(self.out))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+'''Tests of the parsers (see new_parser).'''
+
+import os
+import inspect
+import tempfile
+import unittest
+import concurrent.futures
+from unittest import mock
+
+import tatsu
+from tatsu.contexts import ParseContext
+
+import gqlast
+from conftest import ROOT, TARGETS, read
+from gqlast import SDL, DeferredSemantics, Transformer, new_parser, parse_deferred, parse_deferred_inputs, parse_errors, split_definitions
+
+
+class TatsuTest(unittest.TestCase):
+    ''' --low-memory wraps ParseContext._memoize on the parser instance (see new_parser):
+        the hook only exists in the TatSu version pinned by requirements.txt.
+    '''
+
+    def test_pinned_version(self):
+        pins = dict(line.strip().split('==') for line in read('requirements.txt').splitlines() if '==' in line)
+        self.assertEqual(tatsu.__version__, pins['TatSu'])
+
+    def test_memoize_hook(self):
+        self.assertEqual(list(inspect.signature(ParseContext._memoize).parameters), ['self', 'key', 'memo'])
+        parser = new_parser('tatsu', low_memory=True)
+        self.assertIn('_memoize', vars(parser))
+
+        keys = []
+        memoize = parser._memoize
+        parser._memoize = lambda key, memo: keys.append(key) or memoize(key, memo)
+        parser.parse('type A implements B {\n  a: Int\n}\n', rule_name='start', parseinfo=False)
+        self.assertTrue(keys)
+        self.assertTrue(any(key.rule.is_leftrec for key in keys))
+
+    def test_low_memory(self):
+        text = read('graphql/fractal6.graphql')
+        sdl = lambda definitions: ''.join(d.sdl() for d in definitions)
+        self.assertEqual(sdl(parse_deferred(text, 'tatsu', low_memory=True)), sdl(parse_deferred(text, 'tatsu')))
+
+    def test_chunked_errors(self):
+        # A syntax error is reported with its location in the text, other errors are not
+        # hidden by parsing the text in one piece.
+        text = read('graphql/errors.graphql') + 'type {\n'
+        line = text.count('\n')
+        with self.assertRaisesRegex(parse_errors(), r'\(%d:6\)' % line):
+            parse_deferred(text, 'tatsu')
+
+        with mock.patch('gqlast.split_definitions', side_effect=MemoryError), \
+                mock.patch('gqlast.parse_definitions', wraps=gqlast.parse_definitions) as parse:
+            with self.assertRaises(MemoryError):
+                parse_deferred(text, 'tatsu')
+        parse.assert_not_called()
+
+
+class FastParserTest(unittest.TestCase):
+    ''' The hand-written parser (--parser fast) builds the same AST as the TatSu parser. '''
+
+    inputs = ['graphql/directives.graphql', 'graphql/errors.graphql', 'graphql/fractal6.graphql',
+              'gen_dgraph_out/schema.graphql']
+
+    def test_ast(self):
+        parsers = [new_parser('tatsu'), new_parser('fast')]
+        for path in self.inputs:
+            for i, text in enumerate(split_definitions(read(path))):
+                with self.subTest(path=path, definition=i):
+                    expected, got = [p.parse(text, rule_name='start', semantics=DeferredSemantics(), parseinfo=False)
+                                   for p in parsers]
+                    self.assertEqual(got, expected)
+
+    def test_outputs(self):
+        for target, inputs, output in TARGETS:
+            texts = [read(path) for path in inputs]
+            for parser in ('tatsu', 'fast'):
+                with self.subTest(target=target, parser=parser):
+                    self.assertEqual(Transformer(target, parser).transform(texts), read(output))
+
+
+class JobsTest(unittest.TestCase):
+    ''' --jobs parses the definitions of a single input in a process pool (see parse_deferred_inputs). '''
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_single_input(self):
+        text = read('graphql/fractal6.graphql')
+        sdl = lambda definitions: ''.join(d.sdl() for d in definitions)
+        pools = []
+
+        class Pool(concurrent.futures.ProcessPoolExecutor):
+            def __init__(self, jobs):
+                pools.append(jobs)
+                super().__init__(jobs)
+
+        for parser in ('tatsu', 'fast'):
+            with self.subTest(parser=parser):
+                serial = parse_deferred_inputs([text], parser, jobs=1)
+                with mock.patch('concurrent.futures.ProcessPoolExecutor', Pool):
+                    parallel = parse_deferred_inputs([text], parser, jobs=3)
+                self.assertEqual(pools.pop(), 3)
+                self.assertEqual(len(parallel), 1)
+                self.assertEqual(sdl(parallel[0]), sdl(serial[0]))
+
+    def test_errors(self):
+        texts = [read('graphql/errors.graphql'), read('graphql/fractal6.graphql') + 'type {\n']
+        line = texts[1].count('\n')
+        for parser, location in (('tatsu', r'\(%d:6\)' % line), ('fast', 'at line %d, column 6' % line)):
+            with self.subTest(parser=parser):
+                with self.assertRaisesRegex(parse_errors(), location):
+                    parse_deferred_inputs(texts, parser, jobs=2)
+
+    def test_blank_input(self):
+        # A blank input has no definition, as when the inputs were concatenated.
+        blank = os.path.join(self.tmp.name, 'blank.graphql')
+        for text in ('', '\n  \n'):
+            with open(blank, 'w') as f:
+                f.write(text)
+            files = [blank, os.path.join(ROOT, 'graphql/errors.graphql'), os.path.join(ROOT, 'graphql/fractal6.graphql')]
+            for parser in ('tatsu', 'fast'):
+                for jobs in ('1', '2'):
+                    with self.subTest(text=text, parser=parser, jobs=jobs):
+                        self.assertEqual(parse_deferred(text, parser), [])
+                        settings = {'FILE': files, '--dgraph': True, '--parser': parser, '--jobs': jobs, '--no-cache': True}
+                        self.assertEqual(SDL(settings).stringify() + '\n', read('gen_dgraph_in/schema.graphql'))
+
+    def test_outputs(self):
+        files = [os.path.join(ROOT, 'graphql/fractal6.graphql')]
+        for dgraph in (True, False):
+            with self.subTest(dgraph=dgraph):
+                settings = {'FILE': files, '--dgraph': dgraph, '--parser': 'fast', '--no-cache': True}
+                self.assertEqual(SDL(dict(settings, **{'--jobs': '3'})).stringify(), SDL(settings).stringify())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+'''Tests of the rule profiler (see RuleProfiler and --profile-rules).'''
+
+import io
+import os
+import re
+import tempfile
+import unittest
+
+from conftest import ROOT, TARGETS, read
+from gqlast import SDL
+
+
+class RuleProfilerTest(unittest.TestCase):
+    ''' The profiled run has the same outputs, and reports the grammar rules and the semantic actions. '''
+
+    _stack_re = re.compile(r'^[\w.]+(;[\w.]+)* [1-9][0-9]*$')
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.stacks = os.path.join(self.tmp.name, 'stacks.txt')
+
+    def test_profile(self):
+        for target, inputs, output in TARGETS:
+            dgraph = target == 'dgraph'
+            semantics = 'DgraphSemantics' if dgraph else 'GqlgenSemantics'
+            for parser in ('tatsu', 'fast'):
+                with self.subTest(dgraph=dgraph, parser=parser):
+                    settings = {'FILE': [os.path.join(ROOT, fn) for fn in inputs], '--dgraph': dgraph,
+                                '--parser': parser, '--profile-rules': self.stacks}
+                    sdl = SDL(settings)
+                    self.assertEqual(sdl.stringify() + '\n', read(output))
+
+                    out = io.StringIO()
+                    sdl.rule_profiler.report(self.stacks, file=out, limit=len(sdl.rule_profiler.stats))
+                    header, *lines = out.getvalue().splitlines()
+                    self.assertEqual(header.split(), ['rule', 'calls', 'cumtime', 'selftime', 'hits', 'misses', 'hit%'])
+                    rows = {line.split()[0]: line.split()[1:] for line in lines}
+                    self.assertEqual(set(rows), set(sdl.rule_profiler.stats))
+
+                    # Grammar rules, with their memo hits and misses on the tatsu parser.
+                    calls, cum, self_time, hits, misses, rate = rows['field_definition']
+                    self.assertGreater(int(calls), 0)
+                    if parser == 'tatsu':
+                        self.assertEqual(int(hits) + int(misses), int(calls))
+                        self.assertTrue(any(row[3] != '-' and int(row[3]) > 0 for row in rows.values()))
+                    else:
+                        self.assertEqual((hits, misses, rate), ('-', '-', '-'))
+
+                    # Semantic actions, of the parser and of the target semantics.
+                    self.assertIn('DeferredSemantics._default', rows)
+                    self.assertIn('%s.object_type_definition' % semantics, rows)
+                    self.assertTrue(any(name.startswith('%s.sf.' % semantics) for name in rows))
+
+                    stacks = read(self.stacks).splitlines()
+                    self.assertTrue(stacks)
+                    for line in stacks:
+                        self.assertRegex(line, self._stack_re)
+                    self.assertTrue(any(line.startswith('start;') for line in stacks))
+                    frames = set(f for line in stacks for f in line.rsplit(' ', 1)[0].split(';'))
+                    self.assertLessEqual(frames, set(rows))
+
+
+if __name__ == '__main__':
+    unittest.main()
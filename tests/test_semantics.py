@@ -0,0 +1,102 @@
+'''Tests of the semantics of the targets (see SDL.apply_semantics).'''
+
+import os
+import random
+import tempfile
+import unittest
+
+from conftest import TARGETS, read
+from gqlast import SDL, MultiSDL, GqlgenSemantics, SchemaDiff, Transformer, skip_duplicates, split_definitions
+
+
+def definitions(sdl):
+    ''' Returns the text of the definitions of a schema by (kind, name), and the directive
+        definitions added by the semantics, in order.
+    '''
+    texts = {key: d['text'] for key, d in SchemaDiff('fast').definitions(sdl).items()}
+    return texts, [line for line in sdl.splitlines() if line.startswith('directive @hook_')]
+
+
+class OrderTest(unittest.TestCase):
+    ''' The output does not depend on the order of the definitions (only their order in the output does).
+        The first of duplicate definitions is the one kept: the inputs are shuffled one by one.
+    '''
+
+    def test_shuffle(self):
+        for target, files, _ in TARGETS:
+            texts = [read(path) for path in files]
+            expected = definitions(Transformer(target, 'fast').transform(texts))
+            for seed in range(3):
+                with self.subTest(target=target, seed=seed):
+                    rand = random.Random(seed)
+                    shuffled = []
+                    for text in texts:
+                        chunks = [c.strip('\n') + '\n\n' for c in split_definitions(text)]
+                        rand.shuffle(chunks)
+                        shuffled.append(''.join(chunks))
+                    self.assertEqual(definitions(Transformer(target, 'fast').transform(shuffled)), expected)
+
+    def test_forward_references(self):
+        ''' A type can come before its interface, and an input before its type. '''
+        interface = 'interface I {\n  id: ID!\n  name: String @x_alter\n}\n\n'
+        type_ = 'type A implements I {\n  a: Int @x_add\n}\n\n'
+        input_ = 'input APatch {\n  name: String\n  a: Int\n}\n\n'
+        for target in ('dgraph', 'gqlgen'):
+            with self.subTest(target=target):
+                expected = definitions(Transformer(target, 'fast').transform(interface + type_ + input_))
+                self.assertEqual(definitions(Transformer(target, 'fast').transform(input_ + type_ + interface)), expected)
+
+
+class DuplicatesTest(unittest.TestCase):
+    ''' The duplicate definitions dropped by the gqlgen semantics are not parsed (see skip_duplicates). '''
+
+    first = (
+        'enum E {\n  A\n  B\n}\n\n'
+        'type T {\n  e: E\n  u: U\n}\n\n'
+        'union U = T | V\n\n'
+        'type V {\n  a: Int\n}\n\n'
+        'input TPatch {\n  e: E\n}\n'
+    )
+    second = (
+        '# Redefined\n'
+        'enum E {\n  A\n}\n\n'
+        'type T {\n  e: E\n  v: V\n}\n\n'
+        'union U = V\n\n'
+        'input TPatch {\n  v: Int\n}\n\n'
+        'input TRef {\n  e: E\n}\n'
+    )
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.files = []
+        for name, text in (('first.graphql', self.first), ('second.graphql', self.second)):
+            self.files.append(os.path.join(self.tmp.name, name))
+            with open(self.files[-1], 'w') as f:
+                f.write(text)
+
+    def test_skip_duplicates(self):
+        inputs, skipped = skip_duplicates([self.first, self.second], GqlgenSemantics.dropped_duplicates)
+        # The leading comments of a skipped definition are skipped with it.
+        self.assertEqual(inputs, [self.first, 'type T {\n  e: E\n  v: V\n}\n\ninput TRef {\n  e: E\n}\n'])
+        self.assertEqual(skipped, [0, 3])
+
+    def test_outputs(self):
+        ''' The output and the count of dropped definitions do not depend on the skipping. '''
+        settings = {'FILE': self.files, '--dgraph': False, '--no-cache': True}
+        parsed = SDL(dict(settings, **{'--parser': 'fast'}))
+        skipped = SDL(dict(settings, **{'--parser': 'tatsu'}))
+        self.assertEqual(skipped.stringify(), parsed.stringify())
+        # The 3 skipped definitions, and the duplicate type merged into the first one.
+        self.assertEqual(skipped.sf.counters['definitions_dropped'], 4)
+        self.assertEqual(skipped.sf.stats(), parsed.sf.stats())
+
+        out = os.path.join(self.tmp.name, 'schema.graphql')
+        multi = MultiSDL(dict(settings, **{'--parser': 'tatsu', '--out-gqlgen': out}))
+        sdls = multi.generate()
+        self.assertEqual(read(out), parsed.stringify() + '\n')
+        self.assertEqual(sdls['gqlgen'].sf.stats(), parsed.sf.stats())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+'''Tests of the HTTP server (see SDLServer and --serve).'''
+
+import os
+import socket
+import tempfile
+import threading
+import unittest
+import http.client
+
+from conftest import read
+from gqlast import SDLServer, Transformer
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, path):
+        super().__init__('localhost')
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+class SDLServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sdl_server = SDLServer({'--parser': 'fast', '--jobs': '2'})
+
+    def start(self, address):
+        server = self.sdl_server.new_server(address)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def post(self, connection, path, body):
+        connection.request('POST', path, body)
+        response = connection.getresponse()
+        return response.status, response.read().decode()
+
+    def test_tcp(self):
+        server = self.start('127.0.0.1:0')
+        connection = http.client.HTTPConnection(*server.server_address)
+        self.addCleanup(connection.close)
+
+        text = read('graphql/fractal6.graphql')
+        self.assertEqual(self.post(connection, '/dgraph', text.encode()),
+                         (200, Transformer('dgraph', 'fast').transform(text)))
+
+        status, body = self.post(connection, '/other', b'type A { a: Int }')
+        self.assertEqual((status, body), (404, 'Unknown target: other (expected dgraph or gqlgen)\n'))
+
+        status, body = self.post(connection, '/gqlgen', b'type A {')
+        self.assertEqual(status, 400)
+
+        # The connection is answered (not dropped) on a body that is not UTF-8.
+        status, body = self.post(connection, '/gqlgen', b'type A { a: Int } # \xff')
+        self.assertEqual(status, 400)
+        self.assertTrue(body.startswith('UnicodeDecodeError: '))
+
+    def test_unix(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'gqlast.sock')
+            with open(path, 'w'):
+                pass
+            with self.assertRaisesRegex(ValueError, 'the file exists and is not a socket'):
+                self.sdl_server.new_server(path)
+            os.remove(path)
+
+            self.start(path)
+            connection = UnixHTTPConnection(path)
+            self.addCleanup(connection.close)
+            self.assertEqual(self.post(connection, '/gqlgen', b'type A {\n  a: Int\n}\n'),
+                             (200, Transformer('gqlgen', 'fast').transform('type A {\n  a: Int\n}\n')))
+
+    def test_loopback(self):
+        with self.assertRaisesRegex(ValueError, 'HOST must be a loopback address'):
+            self.sdl_server.new_server('0.0.0.0:0')
+
+
+if __name__ == '__main__':
+    unittest.main()
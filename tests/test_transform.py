@@ -0,0 +1,50 @@
+'''Tests of the library API (see Transformer and transform).'''
+
+import gc
+import unittest
+
+from loguru import logger
+
+from conftest import TARGETS, read
+from gqlast import Transformer, transform
+
+
+class TransformerTest(unittest.TestCase):
+    ''' A Transformer is reused for any number of calls: nothing is shared between
+        the calls but the parser, nothing is kept after a call.
+    '''
+
+    def setUp(self):
+        # The gqlgen semantics warn about the Dgraph types without definition, at each call.
+        logger.disable('gqlast')
+        self.addCleanup(logger.enable, 'gqlast')
+        self.inputs = [([read(path) for path in inputs], target, read(output)) for target, inputs, output in TARGETS]
+
+    def test_reuse(self):
+        transformer = Transformer(parser='fast')
+        for texts, target, output in self.inputs:
+            self.assertEqual(transform(texts, target, parser='fast'), output)
+
+        def run(n):
+            for _ in range(n):
+                for texts, target, output in self.inputs:
+                    self.assertEqual(transformer.transform(texts, target), output)
+
+        run(5)
+        gc.collect()
+        objects = len(gc.get_objects())
+        run(95)
+        gc.collect()
+        # A leak of the state of a call would be thousands of objects per call.
+        self.assertLess(len(gc.get_objects()) - objects, 1000)
+
+    def test_reuse_tatsu(self):
+        # The tatsu parser keeps the last definition parsed between the calls.
+        transformer = Transformer('dgraph', parser='tatsu')
+        texts, target, output = self.inputs[0]
+        for _ in range(2):
+            self.assertEqual(transformer.transform(texts), output)
+
+
+if __name__ == '__main__':
+    unittest.main()
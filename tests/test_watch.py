@@ -0,0 +1,115 @@
+'''Tests of the watch mode (see WatchSDL and DirWatcher).'''
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import gqlast
+from conftest import ROOT, read
+from gqlast import SDL, DirWatcher, WatchSDL
+
+
+class WatchTest(unittest.TestCase):
+    ''' The targets are regenerated on each change of their inputs, an input that does
+        not parse keeps the previous outputs.
+    '''
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.input = os.path.join(self.tmp.name, 'fractal6.graphql')
+        self.output = os.path.join(self.tmp.name, 'schema.graphql')
+        self.source = read('graphql/fractal6.graphql')
+        self.write(self.source)
+        self.files = [os.path.join(ROOT, 'graphql/errors.graphql'), self.input]
+        self.sdl = WatchSDL({'FILE': self.files, '--out-dgraph': self.output, '--parser': 'fast', '--no-cache': True})
+
+    def write(self, text):
+        with open(self.input, 'w') as f:
+            f.write(text)
+
+    def expected(self):
+        return SDL({'FILE': self.files, '--dgraph': True, '--parser': 'fast', '--no-cache': True}).stringify() + '\n'
+
+    def test_regenerate(self):
+        self.sdl.regenerate()
+        self.assertEqual(read(self.output), read('gen_dgraph_in/schema.graphql'))
+
+        old = '  nameid: String!     @search(by: [hash, regexp]) @id'
+        self.assertEqual(self.source.count(old), 1)
+        self.write(self.source.replace(old, old.replace('String!', 'String '), 1))
+        self.sdl.regenerate()
+        self.assertEqual(read(self.output), self.expected())
+        self.assertNotEqual(read(self.output), read('gen_dgraph_in/schema.graphql'))
+
+    def test_error(self):
+        self.sdl.regenerate()
+        self.write(self.source + 'type {\n')
+        with mock.patch.object(gqlast, 'logger') as logger:
+            self.sdl.regenerate()
+        logger.error.assert_called_once()
+        self.assertIn('ParseError', logger.error.call_args[0][0])
+        self.assertEqual(read(self.output), read('gen_dgraph_in/schema.graphql'))
+
+        # Regenerated once fixed.
+        self.write(self.source)
+        self.sdl.regenerate()
+        self.assertEqual(read(self.output), read('gen_dgraph_in/schema.graphql'))
+
+    def test_watch(self):
+        # An input change regenerates the targets, a code change restarts the process.
+        code = os.path.join(self.sdl.code_dir, 'sdlparser.py')
+        changes = iter([{os.path.join(self.tmp.name, 'other.graphql')}, {self.input}, {code}])
+
+        class Restart(Exception):
+            pass
+
+        with mock.patch.object(gqlast, 'DirWatcher') as watcher, \
+                mock.patch.object(self.sdl, 'regenerate') as regenerate, \
+                mock.patch('os.execv', side_effect=Restart) as execv:
+            watcher.return_value.wait.side_effect = lambda: next(changes)
+            with self.assertRaises(Restart):
+                self.sdl.watch()
+
+        dirs = watcher.call_args[0][0]
+        self.assertIn(self.tmp.name, dirs)
+        self.assertIn(self.sdl.code_dir, dirs)
+        self.assertEqual(regenerate.call_count, 2)
+        execv.assert_called_once()
+
+
+class DirWatcherTest(unittest.TestCase):
+    ''' The changes are read from inotify, or polled if it is not available. '''
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, 'schema.graphql')
+
+    def write(self, text):
+        with open(self.path, 'w') as f:
+            f.write(text)
+
+    def check(self, watcher):
+        self.write('type A\n')
+        self.assertEqual(watcher.wait(), {self.path})
+        self.write('type AB\n')
+        self.assertEqual(watcher.wait(), {self.path})
+
+    @unittest.skipUnless(hasattr(os, 'O_CLOEXEC'), 'inotify is only available on Linux')
+    def test_inotify(self):
+        watcher = DirWatcher([self.tmp.name])
+        self.assertIsNotNone(watcher._fd)
+        self.addCleanup(os.close, watcher._fd)
+        self.check(watcher)
+
+    def test_polling(self):
+        with mock.patch.object(DirWatcher, '_inotify_init', side_effect=OSError):
+            watcher = DirWatcher([self.tmp.name], interval=0.01)
+        self.assertIsNone(watcher._fd)
+        self.check(watcher)
+
+
+if __name__ == '__main__':
+    unittest.main()